@@ -0,0 +1,141 @@
+# --- English ---
+# # GENERAL-AI GENERATION BENCHMARK #
+#
+# Compares generation throughput of a worker's general-ai expert in two modes on the same
+# machine and the same prompts: one `expert_pipeline` call at a time (the previous
+# behaviour) and the continuous-batching decode loop (`ContinuousBatcher`). All requests
+# arrive at once, with a mix of short and long answers, as on a busy worker. It prints
+# generated tokens per second and the completion-time percentiles of each mode.
+#
+# HOW TO RUN (on a machine with the worker's dependencies installed):
+#    python benchmark_generation.py --requests 32 --batch 8
+#    python benchmark_generation.py --model distilgpt2 --requests 64   # quick check
+#
+# Results are saved as JSON in `benchmark_results/`.
+
+# --- Español ---
+# # BENCHMARK DE GENERACIÓN DE GENERAL-AI #
+#
+# Compara el rendimiento de generación del experto general-ai de un worker en dos modos,
+# en la misma máquina y con los mismos prompts: una llamada a `expert_pipeline` cada vez
+# (el comportamiento anterior) y el bucle de decodificación con batching continuo
+# (`ContinuousBatcher`). Todas las peticiones llegan a la vez, con una mezcla de respuestas
+# cortas y largas, como en un worker ocupado. Muestra los tokens generados por segundo y
+# los percentiles del tiempo de finalización de cada modo.
+#
+# CÓMO EJECUTAR (en una máquina con las dependencias del worker instaladas):
+#    python benchmark_generation.py --requests 32 --batch 8
+#    python benchmark_generation.py --model distilgpt2 --requests 64   # prueba rápida
+#
+# Los resultados se guardan como JSON en `benchmark_results/`.
+
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+if os.name == "nt":
+    import worker_windows as worker
+else:
+    import worker_linux as worker
+
+REPO_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIRECTORY = os.path.join(REPO_DIRECTORY, "benchmark_results")
+
+PROMPTS = [
+    "Explain in one sentence what a distributed system is.",
+    "Write a short poem about the sea.",
+    "List three tips for learning a new language.",
+    "Describe how a compiler turns source code into a program, step by step.",
+    "What is the capital of Spain?",
+    "Summarize the plot of a detective story you invent.",
+    "Give a detailed recipe for a vegetable soup.",
+    "Translate 'good morning, how are you?' into Spanish.",
+]
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+def count_tokens(tokenizer, text):
+    return len(tokenizer(text, add_special_tokens=False).input_ids)
+
+def run_sequential(generator, workload):
+    # --- English ---
+    # The previous behaviour: one plain pipeline call per sub-task, in arrival order.
+    # --- Español ---
+    # El comportamiento anterior: una llamada normal al pipeline por subtarea, en orden de llegada.
+    started = time.perf_counter()
+    completions, tokens = [], 0
+    for prompt, max_new_tokens in workload:
+        output = worker.run_pipeline("general-ai", prompt, {}, max_new_tokens=max_new_tokens, return_full_text=False)[0]
+        tokens += count_tokens(generator.tokenizer, output['generated_text'])
+        completions.append(time.perf_counter() - started)
+    return tokens, time.perf_counter() - started, completions
+
+def run_batched(generator, workload, args):
+    batcher = worker.ContinuousBatcher(generator, max_sequences=args.batch, budget_mb=args.kv_budget_mb)
+    batcher.start()
+    started = time.perf_counter()
+
+    def generate(request):
+        prompt, max_new_tokens = request
+        output = batcher.generate(prompt, {}, max_new_tokens=max_new_tokens)
+        return output['generated_text'], time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=len(workload)) as executor:
+        results = list(executor.map(generate, workload))
+    elapsed = time.perf_counter() - started
+    return sum(count_tokens(generator.tokenizer, text) for text, _ in results), elapsed, [finished for _, finished in results]
+
+def summarize(tokens, elapsed, completions):
+    return {"tokens": tokens, "seconds": elapsed, "tokens_per_second": tokens / elapsed if elapsed else 0.0,
+            "completion_p50": percentile(completions, 0.5), "completion_p99": percentile(completions, 0.99)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare one-at-a-time and continuously batched general-ai generation.")
+    parser.add_argument("--model", default="google/gemma-2b-it", help="The orchestrator's general-ai model by default.")
+    parser.add_argument("--requests", type=int, default=32, help="Sub-tasks arriving at once.")
+    parser.add_argument("--batch", type=int, default=worker.MAX_BATCH_SEQUENCES, help="Maximum sequences in the running batch.")
+    parser.add_argument("--kv-budget-mb", type=int, default=worker.KV_CACHE_BUDGET_MB)
+    parser.add_argument("--short-tokens", type=int, default=32, help="max_new_tokens of short answers.")
+    parser.add_argument("--long-tokens", type=int, default=worker.GENERATION_MAX_NEW_TOKENS, help="max_new_tokens of long answers.")
+    parser.add_argument("--long-fraction", type=float, default=0.25)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Where to save the JSON results.")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    workload = [(rng.choice(PROMPTS), args.long_tokens if rng.random() < args.long_fraction else args.short_tokens) for _ in range(args.requests)]
+
+    print(f"Loading '{args.model}'... | Cargando '{args.model}'...")
+    # --- English ---
+    # Loaded with `pipeline` directly rather than `worker.initialize_ai_model`, which would ask
+    # the orchestrator for a manifest and write a prepared copy of the model for warm restarts.
+    # --- Español ---
+    # Se carga con `pipeline` directamente en lugar de `worker.initialize_ai_model`, que pediría
+    # un manifiesto al orquestador y escribiría una copia preparada del modelo para reinicios en caliente.
+    generator = worker.pipeline("text-generation", model=args.model)
+    worker.expert_pipelines["general-ai"] = generator
+    run_sequential(generator, workload[:1]) # Calentamiento. | Warm-up.
+
+    results = {"model": args.model, "requests": args.requests, "batch": args.batch,
+               "sequential": summarize(*run_sequential(generator, workload)),
+               "continuous_batching": summarize(*run_batched(generator, workload, args))}
+    print(f"\n  {'mode':22s} {'tokens':>8s} {'seconds':>9s} {'tokens/s':>9s} {'p50 done':>9s} {'p99 done':>9s}")
+    for mode in ("sequential", "continuous_batching"):
+        r = results[mode]
+        print(f"  {mode:22s} {r['tokens']:8d} {r['seconds']:8.1f}s {r['tokens_per_second']:9.1f} {r['completion_p50']:8.1f}s {r['completion_p99']:8.1f}s")
+    speedup = results["continuous_batching"]["tokens_per_second"] / max(results["sequential"]["tokens_per_second"], 1e-9)
+    print(f"\nThroughput speed-up: {speedup:.2f}x | Aceleración del rendimiento: {speedup:.2f}x")
+
+    output = args.output or os.path.join(RESULTS_DIRECTORY, f"generation_{int(time.time())}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f: json.dump(results, f, indent=2)
+    print(f"Results saved to {output} | Resultados guardados en {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+# --- English ---
+# # ORCHESTRATOR LOAD-TEST AND BENCHMARK #
+#
+# Starts `orchestrator:app` locally in a throw-away directory and drives it with
+# simulated workers and chat clients. The simulated workers use the real
+# /register, /heartbeat, /request-assignment, /get-sub-task and /submit-sub-task-result
+# flow, but replace the AI model with a fake pipeline that just sleeps. No models
+# are downloaded, so the orchestrator's own capacity can be measured on any machine.
+#
+# HOW TO RUN:
+#    python benchmark_orchestrator.py --workers 2000 --clients 200 --duration 60
+#    python benchmark_orchestrator.py --compare benchmark_results/<previous>.json
+#
+# Results are saved as JSON in `benchmark_results/` so that runs of different
+# versions can be compared with `--compare`.
+
+# --- Español ---
+# # PRUEBA DE CARGA Y BENCHMARK DEL ORQUESTADOR #
+#
+# Inicia `orchestrator:app` localmente en un directorio temporal y lo somete a carga con
+# workers y clientes de chat simulados. Los workers simulados usan el flujo real de
+# /register, /heartbeat, /request-assignment, /get-sub-task y /submit-sub-task-result,
+# pero sustituyen el modelo de IA por un pipeline falso que solo espera. No se descargan
+# modelos, así que la capacidad del propio orquestador se puede medir en cualquier máquina.
+#
+# CÓMO EJECUTAR:
+#    python benchmark_orchestrator.py --workers 2000 --clients 200 --duration 60
+#    python benchmark_orchestrator.py --compare benchmark_results/<anterior>.json
+#
+# Los resultados se guardan como JSON en `benchmark_results/` para poder comparar
+# ejecuciones de distintas versiones con `--compare`.
+
+# -*- coding: utf-8 -*-
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+# --- English ---
+# httpx and uvicorn are installed on the server together with "fastapi[all]".
+# --- Español ---
+# httpx y uvicorn se instalan en el servidor junto con "fastapi[all]".
+try:
+    import httpx
+except ImportError:
+    print("ERROR: This benchmark requires httpx (pip install \"fastapi[all]\"). | ERROR: Este benchmark necesita httpx (pip install \"fastapi[all]\").")
+    sys.exit(1)
+
+REPO_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIRECTORY = os.path.join(REPO_DIRECTORY, "benchmark_results")
+
+# --- English ---
+# A result is flagged as a regression when it is worse than the baseline by more than this fraction.
+# --- Español ---
+# Un resultado se marca como regresión cuando es peor que la referencia en más de esta fracción.
+REGRESSION_TOLERANCE = 0.10
+
+# --- English ---
+# --- Measurement ---
+# --- Español ---
+# --- Medición ---
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.job_latencies = []
+        self.jobs_submitted = 0
+        self.jobs_completed = 0
+        self.sub_tasks_processed = 0
+        self.measuring = False
+
+    async def call(self, client, method, url, endpoint, **kwargs):
+        # --- English ---
+        # Sends a request and records its latency under the route template `endpoint`.
+        # --- Español ---
+        # Envía una petición y registra su latencia bajo la plantilla de ruta `endpoint`.
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            if self.measuring: self.errors[f"{endpoint} {type(e).__name__}"] += 1
+            return None
+        if self.measuring:
+            self.latencies[endpoint].append(time.perf_counter() - start)
+            if response.status_code >= 400: self.errors[f"{endpoint} HTTP {response.status_code}"] += 1
+        return response if response.status_code < 400 else None
+
+def percentile(values, fraction):
+    if not values: return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def summarize(values):
+    return {"count": len(values), "p50": percentile(values, 0.50), "p99": percentile(values, 0.99), "max": max(values) if values else None}
+
+# --- English ---
+# --- Simulated Participants ---
+# --- Español ---
+# --- Participantes Simulados ---
+def fake_pipeline(expert_type, task_data):
+    # --- English ---
+    # Returns an output shaped like the real transformers pipeline for each expert.
+    # --- Español ---
+    # Devuelve una salida con la forma del pipeline real de transformers para cada experto.
+    if expert_type == "general-ai":
+        return {"generated_text": json.dumps({"summary": "Simulated summary.", "generation": "Simulated answer."})}
+    if expert_type == "document-summarization": return {"summary_text": "Simulated summary."}
+    if expert_type == "image-captioning": return {"generated_text": "a simulated caption"}
+    return {"text": "simulated transcription"}
+
+async def simulated_worker(client, recorder, args, worker_ids, stop):
+    response = await recorder.call(client, "POST", "/register", "/register", json={"specs": {"gpu": "N/A", "cpu_cores": 8, "memory": "16GB"}})
+    if response is None: return
+    worker_id = response.json()["worker_id"]
+    worker_ids.append(worker_id)
+    response = await recorder.call(client, "GET", f"/request-assignment/{worker_id}", "/request-assignment/{worker_id}")
+    if response is None: return
+    expert_type = response.json()["assigned_expert"]
+
+    next_heartbeat = time.monotonic() + args.heartbeat_interval * random.random()
+    while not stop.is_set():
+        if time.monotonic() >= next_heartbeat:
+            await recorder.call(client, "POST", "/heartbeat", "/heartbeat", json={"worker_id": worker_id})
+            next_heartbeat = time.monotonic() + args.heartbeat_interval
+        fetch_started = time.perf_counter()
+        response = await recorder.call(client, "GET", f"/get-sub-task/{worker_id}/{expert_type}", "/get-sub-task/{worker_id}/{expert_type}")
+        fetch_seconds = time.perf_counter() - fetch_started
+        sub_task = response.json() if response is not None else {}
+        if "id" not in sub_task:
+            await asyncio.sleep(args.poll_interval)
+            continue
+        task_latency = max(0.0, random.gauss(args.task_latency, args.task_latency * args.task_jitter))
+        await asyncio.sleep(task_latency)
+        result = fake_pipeline(expert_type, json.loads(sub_task["data"]))
+        await recorder.call(client, "POST", "/submit-sub-task-result", "/submit-sub-task-result",
+                            json={"worker_id": worker_id, "sub_task_id": sub_task["id"], "result": json.dumps(result),
+                                  "timings": {"fetch": fetch_seconds, "inference": task_latency}})
+        if recorder.measuring: recorder.sub_tasks_processed += 1
+
+async def simulated_chat_client(client, recorder, args, worker_ids, stop):
+    while not worker_ids and not stop.is_set():
+        await asyncio.sleep(0.1)
+    while not stop.is_set():
+        worker_id = random.choice(worker_ids)
+        submitted_at = time.perf_counter()
+        response = await recorder.call(client, "POST", "/upload-and-submit-job", "/upload-and-submit-job",
+                                       data={"worker_id": worker_id, "prompt": f"Benchmark question {random.randint(0, 10**6)}"})
+        if response is None:
+            await asyncio.sleep(args.client_think_time)
+            continue
+        counted = recorder.measuring
+        if counted: recorder.jobs_submitted += 1
+        job_id = response.json()["job_id"]
+        while not stop.is_set():
+            await asyncio.sleep(args.status_poll_interval)
+            status = await recorder.call(client, "GET", f"/get-job-status/{job_id}", "/get-job-status/{job_id}")
+            if status is not None and status.json().get("status") == "completed":
+                if counted and recorder.measuring:
+                    recorder.jobs_completed += 1
+                    recorder.job_latencies.append(time.perf_counter() - submitted_at)
+                break
+        await asyncio.sleep(random.expovariate(1.0 / args.client_think_time) if args.client_think_time > 0 else 0)
+
+def parse_sqlite_metrics(metrics_text):
+    # --- English ---
+    # Extracts total and mean SQLite statement time per statement type from /metrics.
+    # --- Español ---
+    # Extrae el tiempo total y medio de las sentencias SQLite por tipo desde /metrics.
+    totals = defaultdict(dict)
+    for match in re.finditer(r'^helios_sqlite_query_duration_seconds_(sum|count)\{statement="(\w+)"\} (\S+)$', metrics_text, re.M):
+        totals[match.group(2)][match.group(1)] = float(match.group(3))
+    return {statement: {"count": int(v.get("count", 0)), "total_seconds": v.get("sum", 0.0), "mean_seconds": v.get("sum", 0.0) / v["count"] if v.get("count") else None}
+            for statement, v in totals.items()}
+
+# --- English ---
+# --- Orchestrator Process ---
+# --- Español ---
+# --- Proceso del Orquestador ---
+def start_orchestrator(port, run_directory, processes):
+    # --- English ---
+    # The orchestrator uses relative paths for its database and uploads, so running it
+    # from an empty temporary directory keeps the benchmark isolated from real data.
+    # --- Español ---
+    # El orquestador usa rutas relativas para su base de datos y subidas, así que ejecutarlo
+    # desde un directorio temporal vacío aísla el benchmark de los datos reales.
+    env = dict(os.environ, PYTHONPATH=REPO_DIRECTORY + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    return subprocess.Popen([sys.executable, "-m", "uvicorn", "orchestrator:app", "--host", "127.0.0.1", "--port", str(port), "--workers", str(processes), "--log-level", "warning"],
+                            cwd=run_directory, env=env)
+
+async def wait_until_ready(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/metrics")).status_code == 200: return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Orchestrator did not start in time. | El orquestador no arrancó a tiempo.")
+
+async def run_benchmark(args, base_url):
+    recorder = Recorder()
+    stop = asyncio.Event()
+    worker_ids = []
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.request_timeout) as client:
+        tasks = [asyncio.create_task(simulated_worker(client, recorder, args, worker_ids, stop)) for _ in range(args.workers)]
+        tasks += [asyncio.create_task(simulated_chat_client(client, recorder, args, worker_ids, stop)) for _ in range(args.clients)]
+
+        print(f"Warming up for {args.warmup}s... | Calentando durante {args.warmup}s...")
+        await asyncio.sleep(args.warmup)
+        baseline_metrics = parse_sqlite_metrics((await client.get("/metrics")).text)
+        recorder.measuring = True
+        print(f"Measuring for {args.duration}s... | Midiendo durante {args.duration}s...")
+        started = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        elapsed = time.perf_counter() - started
+        recorder.measuring = False
+        final_metrics = parse_sqlite_metrics((await client.get("/metrics")).text)
+
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    sqlite_stats = {}
+    for statement, stats in final_metrics.items():
+        before = baseline_metrics.get(statement, {"count": 0, "total_seconds": 0.0})
+        count = stats["count"] - before["count"]
+        total = stats["total_seconds"] - before["total_seconds"]
+        sqlite_stats[statement] = {"count": count, "total_seconds": total, "mean_seconds": total / count if count else None}
+    locked_errors = sum(n for key, n in recorder.errors.items() if "HTTP 500" in key)
+
+    return {
+        "orchestrator_version": orchestrator_version(),
+        "git_revision": git_revision(),
+        "timestamp": int(time.time()),
+        "config": {k: v for k, v in vars(args).items() if k not in ("compare", "output")},
+        "duration_seconds": elapsed,
+        "throughput": {
+            "jobs_completed_per_second": recorder.jobs_completed / elapsed,
+            "sub_tasks_per_second": recorder.sub_tasks_processed / elapsed,
+            "requests_per_second": sum(len(v) for v in recorder.latencies.values()) / elapsed,
+        },
+        "jobs": {"submitted": recorder.jobs_submitted, "completed": recorder.jobs_completed, "latency_seconds": summarize(recorder.job_latencies)},
+        "endpoints": {endpoint: summarize(values) for endpoint, values in sorted(recorder.latencies.items())},
+        "db_contention": {
+            "server_errors": locked_errors,
+            "sqlite_busy_seconds_per_second": sum(s["total_seconds"] for s in sqlite_stats.values()) / elapsed,
+            "statements": sqlite_stats,
+        },
+        "errors": dict(recorder.errors),
+    }
+
+def orchestrator_version():
+    with open(os.path.join(REPO_DIRECTORY, "orchestrator.py"), encoding="utf-8") as f:
+        match = re.search(r'FastAPI\(.*version="([^"]+)"', f.read())
+    return match.group(1) if match else "unknown"
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIRECTORY, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+# --- English ---
+# --- Reporting ---
+# --- Español ---
+# --- Informes ---
+def print_report(results):
+    def ms(value): return f"{value * 1000:8.1f}ms" if value is not None else "       n/a"
+    print("\n" + "=" * 60)
+    print(f"Orchestrator {results['orchestrator_version']} ({results['git_revision']})")
+    throughput = results["throughput"]
+    print(f"Jobs/s: {throughput['jobs_completed_per_second']:.2f} | Sub-tasks/s: {throughput['sub_tasks_per_second']:.2f} | Requests/s: {throughput['requests_per_second']:.1f}")
+    jobs = results["jobs"]
+    print(f"Jobs: {jobs['completed']}/{jobs['submitted']} completed | p50 {ms(jobs['latency_seconds']['p50'])} | p99 {ms(jobs['latency_seconds']['p99'])}")
+    for endpoint, stats in results["endpoints"].items():
+        print(f"  {endpoint:45s} n={stats['count']:7d} p50 {ms(stats['p50'])} p99 {ms(stats['p99'])}")
+    contention = results["db_contention"]
+    print(f"SQLite busy: {contention['sqlite_busy_seconds_per_second']:.3f}s per second | Server errors: {contention['server_errors']}")
+    for key, count in sorted(results["errors"].items()):
+        print(f"  error {key}: {count}")
+    print("=" * 60)
+
+def compare_results(current, baseline):
+    # --- English ---
+    # Prints the change of each headline number and returns the list of regressions.
+    # --- Español ---
+    # Muestra el cambio de cada cifra principal y devuelve la lista de regresiones.
+    checks = [("jobs_completed_per_second", current["throughput"]["jobs_completed_per_second"], baseline["throughput"]["jobs_completed_per_second"], True),
+              ("job_latency_p50", current["jobs"]["latency_seconds"]["p50"], baseline["jobs"]["latency_seconds"]["p50"], False),
+              ("job_latency_p99", current["jobs"]["latency_seconds"]["p99"], baseline["jobs"]["latency_seconds"]["p99"], False)]
+    for endpoint, stats in current["endpoints"].items():
+        if endpoint in baseline["endpoints"]:
+            checks.append((f"{endpoint} p99", stats["p99"], baseline["endpoints"][endpoint]["p99"], False))
+    regressions = []
+    print(f"\nComparison against {baseline['orchestrator_version']} ({baseline['git_revision']}) | Comparación con la versión de referencia:")
+    for name, new, old, higher_is_better in checks:
+        if new is None or not old: continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = "REGRESSION" if worse > REGRESSION_TOLERANCE else ""
+        if flag: regressions.append(name)
+        print(f"  {name:55s} {old:10.4f} -> {new:10.4f} ({change:+.1%}) {flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the orchestrator with simulated workers and chat clients.")
+    parser.add_argument("--workers", type=int, default=1000, help="Simulated workers.")
+    parser.add_argument("--clients", type=int, default=100, help="Simulated chat clients.")
+    parser.add_argument("--duration", type=float, default=60, help="Measurement window in seconds.")
+    parser.add_argument("--warmup", type=float, default=10, help="Seconds to run before measuring.")
+    parser.add_argument("--task-latency", type=float, default=0.5, help="Mean fake inference time in seconds.")
+    parser.add_argument("--task-jitter", type=float, default=0.3, help="Standard deviation of the fake inference time, as a fraction of the mean.")
+    parser.add_argument("--poll-interval", type=float, default=5, help="Worker sleep when no task is available (POLL_INTERVAL in the worker).")
+    parser.add_argument("--heartbeat-interval", type=float, default=30, help="Seconds between worker heartbeats.")
+    parser.add_argument("--status-poll-interval", type=float, default=3, help="Seconds between job status polls (the chat UI uses 3).")
+    parser.add_argument("--client-think-time", type=float, default=5, help="Mean pause between jobs of one chat client.")
+    parser.add_argument("--max-connections", type=int, default=200, help="HTTP connection pool size shared by all simulated participants.")
+    parser.add_argument("--request-timeout", type=float, default=30)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--server-processes", type=int, default=1, help="Orchestrator processes (uvicorn --workers) sharing the state backend.")
+    parser.add_argument("--url", default=None, help="Benchmark an already running orchestrator instead of starting one.")
+    parser.add_argument("--output", default=None, help="Where to save the JSON results.")
+    parser.add_argument("--compare", default=None, help="Previous results file to compare against.")
+    args = parser.parse_args()
+
+    process = None
+    run_directory = tempfile.TemporaryDirectory(prefix="helios-benchmark-")
+    base_url = args.url or f"http://127.0.0.1:{args.port}"
+    try:
+        if not args.url:
+            process = start_orchestrator(args.port, run_directory.name, args.server_processes)
+        asyncio.run(wait_until_ready(base_url))
+        results = asyncio.run(run_benchmark(args, base_url))
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=10)
+        run_directory.cleanup()
+
+    print_report(results)
+    output = args.output or os.path.join(RESULTS_DIRECTORY, f"benchmark_{results['orchestrator_version']}_{results['git_revision']}_{results['timestamp']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f: json.dump(results, f, indent=2)
+    print(f"Results saved to {output} | Resultados guardados en {output}")
+
+    if args.compare:
+        with open(args.compare) as f: baseline = json.load(f)
+        if compare_results(results, baseline):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -7,9 +7,12 @@
 # HOW TO DEPLOY:
 # 1. Upload this file to your public server.
 # 2. Create a folder named 'uploads' in the same directory.
-# 3. Run using a production-ready command:
+# 3. Install the dependencies (PyPDF2 and python-docx read uploaded PDF and DOCX files;
+#    without them uploaded documents are skipped with a warning in the answer):
+#    pip install "fastapi[all]" PyPDF2 python-docx
+# 4. Run using a production-ready command:
 #    uvicorn orchestrator:app --host 0.0.0.0 --port 8000
-# 4. Make sure your server's firewall allows traffic on port 8000.
+# 5. Make sure your server's firewall allows traffic on port 8000.
 
 # --- Español ---
 # ORQUESTADOR FINAL - LISTO PARA DESPLIEGUE PÚBLICO
@@ -20,9 +23,12 @@
 # CÓMO DESPLEGAR:
 # 1. Sube este archivo a tu servidor público.
 # 2. Crea una carpeta llamada 'uploads' en el mismo directorio.
-# 3. Ejecútalo usando un comando de producción:
+# 3. Instala las dependencias (PyPDF2 y python-docx leen los archivos PDF y DOCX subidos;
+#    sin ellas los documentos subidos se omiten con un aviso en la respuesta):
+#    pip install "fastapi[all]" PyPDF2 python-docx
+# 4. Ejecútalo usando un comando de producción:
 #    uvicorn orchestrator:app --host 0.0.0.0 --port 8000
-# 4. Asegúrate de que el firewall de tu servidor permite el tráfico en el puerto 8000.
+# 5. Asegúrate de que el firewall de tu servidor permite el tráfico en el puerto 8000.
 
 # -*- coding: utf-8 -*-
 
@@ -33,10 +39,40 @@ import time
 import asyncio
 import os
 import shutil
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+import bisect
+import gzip
+import hashlib
+import math
+import re
+import zlib
+import socket
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request
 from pydantic import BaseModel
-from typing import Dict, Any, Optional
-from fastapi.responses import HTMLResponse
+from typing import Dict, Any, List, Optional
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response, StreamingResponse
+
+# --- English ---
+# Optional dependencies of the semantic answer cache.
+# --- Español ---
+# Dependencias opcionales de la caché semántica de respuestas.
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    np = SentenceTransformer = None
+
+# --- English ---
+# Optional dependencies of document ingestion (PDF and DOCX text extraction).
+# --- Español ---
+# Dependencias opcionales de la ingesta de documentos (extracción de texto de PDF y DOCX).
+try:
+    import PyPDF2
+    import docx
+except ImportError:
+    PyPDF2 = docx = None
 
 # --- English ---
 # --- Configuration ---
@@ -44,6 +80,29 @@ from fastapi.responses import HTMLResponse
 # --- Configuración ---
 DB_FILE = "orchestrator_chat_prod.db"
 
+# --- English ---
+# Where the shared state (workers, jobs, the sub-task queue, chat history) lives.
+# "sqlite:///<path>" is the local backend; with WAL it can be shared by several processes on
+# one machine (`uvicorn --workers N`). "memory://<name>" is an in-memory database for tests.
+# Other backends (e.g. a replicated SQLite service for several nodes) can be added to
+# STATE_BACKENDS. Singleton background tasks run only in the process holding their lease.
+# Everything else kept in memory is per process and diverges under `--workers N`: /metrics and
+# /stage-timings report only the process that answers the scrape, and the semantic answer cache
+# and the model manifest cache are built separately by each process.
+# --- Español ---
+# Dónde vive el estado compartido (workers, trabajos, la cola de subtareas, historial de chat).
+# "sqlite:///<ruta>" es el backend local; con WAL puede compartirse entre varios procesos de
+# una máquina (`uvicorn --workers N`). "memory://<nombre>" es una base de datos en memoria para
+# pruebas. Se pueden añadir otros backends (ej. un servicio SQLite replicado para varios nodos)
+# a STATE_BACKENDS. Las tareas de fondo únicas solo se ejecutan en el proceso que tiene su lease.
+# Todo lo demás que se guarda en memoria es de cada proceso y diverge con `--workers N`: /metrics
+# y /stage-timings informan solo del proceso que atiende la consulta, y la caché semántica de
+# respuestas y la caché de manifiestos de modelos las construye cada proceso por separado.
+STATE_BACKEND_URL = os.environ.get("HELIOS_STATE_BACKEND", f"sqlite:///{DB_FILE}")
+SQLITE_BUSY_TIMEOUT_SECONDS = 30
+LEADER_LEASE_SECONDS = 90
+NODE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
 # --- English ---
 # This value is set to 0.0 for testing purposes.
 # TODO: Increase this value in production for security.
@@ -55,6 +114,108 @@ REPUTATION_THRESHOLD_TO_SUBMIT = 0.0
 HEARTBEAT_TIMEOUT_SECONDS = 120 # 2 minutes
 UPLOAD_DIRECTORY = "uploads"
 
+# --- English ---
+# Document ingestion. Uploaded PDF and DOCX files are read here, when they are uploaded, in a
+# pool of INGEST_PROCESSES processes (so large documents never block the server), and workers
+# receive the extracted text instead of the file. Extractions are cached by the SHA-256 of
+# the file in EXTRACTED_TEXT_DIRECTORY, so the same document is only read once; entries unused
+# for JOB_RETENTION_DAYS are deleted. At most INGEST_MAX_BACKLOG uploads wait for the pool;
+# beyond that the upload is refused with 429 like any other overload.
+# --- Español ---
+# Ingesta de documentos. Los archivos PDF y DOCX subidos se leen aquí, al subirlos, en un pool
+# de INGEST_PROCESSES procesos (así los documentos grandes nunca bloquean el servidor), y los
+# workers reciben el texto extraído en lugar del archivo. Las extracciones se guardan en caché
+# por el SHA-256 del archivo en EXTRACTED_TEXT_DIRECTORY, así cada documento solo se lee una vez;
+# las entradas sin usar durante JOB_RETENTION_DAYS se borran. Como mucho INGEST_MAX_BACKLOG
+# subidas esperan al pool; por encima se rechaza la subida con 429 como cualquier sobrecarga.
+DOCUMENT_EXTENSIONS = (".pdf", ".docx")
+INGEST_PROCESSES = max(1, min(4, (os.cpu_count() or 2) - 1))
+INGEST_MAX_BACKLOG = 32
+INGEST_MAX_FILE_BYTES = 50 * 1024 * 1024
+EXTRACTED_TEXT_DIRECTORY = os.path.join(UPLOAD_DIRECTORY, "extracted")
+
+# --- English ---
+# Admission control. Each user (the worker_id used in the chat) may submit at most
+# USER_RATE_LIMIT_JOBS jobs per window and have USER_MAX_IN_FLIGHT_JOBS unfinished jobs.
+# When MAX_QUEUE_DEPTH sub-tasks are already pending, new jobs are refused with 429 and
+# a Retry-After header, so queue wait stays bounded during bursts. Jobs still unfinished after
+# IN_FLIGHT_JOB_MAX_AGE_SECONDS no longer count towards the in-flight limit, so a job that was
+# lost never locks its user out.
+# --- Español ---
+# Control de admisión. Cada usuario (el worker_id usado en el chat) puede enviar como máximo
+# USER_RATE_LIMIT_JOBS trabajos por ventana y tener USER_MAX_IN_FLIGHT_JOBS trabajos sin
+# terminar. Cuando ya hay MAX_QUEUE_DEPTH subtareas pendientes, los trabajos nuevos se rechazan
+# con 429 y una cabecera Retry-After, así la espera en cola se mantiene acotada en las ráfagas. Los
+# trabajos que siguen sin terminar tras IN_FLIGHT_JOB_MAX_AGE_SECONDS dejan de contar para el
+# límite de trabajos en curso, así un trabajo perdido nunca bloquea a su usuario.
+USER_RATE_LIMIT_JOBS = 20
+USER_RATE_LIMIT_WINDOW_SECONDS = 60
+USER_MAX_IN_FLIGHT_JOBS = 3
+IN_FLIGHT_JOB_MAX_AGE_SECONDS = 15 * 60
+MAX_QUEUE_DEPTH = 1000
+QUEUE_FULL_RETRY_AFTER_SECONDS = 15
+
+# --- English ---
+# Bulk job status. POST /job-statuses answers for up to BULK_STATUS_MAX_JOBS jobs at once,
+# given by id or as a user's jobs in a creation-time window, in one query. A job's update time
+# is when it completed, or when it was created while pending (0 for legacy jobs with neither
+# time recorded). Each response carries a cursor; sent back as `since`, only jobs updated
+# after it are returned, so unchanged jobs are not read again. Responses also carry an ETag,
+# and a matching If-None-Match gets 304 without a body.
+# --- Español ---
+# Estado de trabajos en bloque. POST /job-statuses responde por hasta BULK_STATUS_MAX_JOBS
+# trabajos a la vez, dados por id o como los trabajos de un usuario en una ventana de creación,
+# en una sola consulta. La hora de actualización de un trabajo es cuando terminó, o cuando se
+# creó mientras está pendiente (0 en trabajos antiguos sin ninguna de las dos horas). Cada
+# respuesta lleva un cursor; si se devuelve como `since`, solo se devuelven los trabajos
+# actualizados después, así los que no cambian no se vuelven a leer. Las respuestas llevan
+# además un ETag, y un If-None-Match que coincide recibe 304 sin cuerpo.
+BULK_STATUS_MAX_JOBS = 500
+JOB_UPDATED_AT_SQL = "COALESCE(completed_at, created_at, 0.0)"
+
+# --- English ---
+# Contributors are served first. A user's fair-queuing weight grows with the logarithm of
+# their reputation, up to PRIORITY_MAX_WEIGHT times that of a new user. Because tags only
+# grow with the queue's virtual clock, a new user's sub-task is overtaken by at most
+# PRIORITY_MAX_WEIGHT rounds of contributors' work, so it can never starve (aging).
+# --- Español ---
+# Los contribuidores se atienden primero. El peso de un usuario en la cola justa crece con
+# el logaritmo de su reputación, hasta PRIORITY_MAX_WEIGHT veces el de un usuario nuevo. Como
+# las etiquetas solo crecen con el reloj virtual de la cola, la subtarea de un usuario nuevo
+# es adelantada como mucho por PRIORITY_MAX_WEIGHT rondas de trabajo de contribuidores, así
+# que nunca se queda sin atender (envejecimiento).
+PRIORITY_REPUTATION_SCALE = 1.0
+PRIORITY_MAX_WEIGHT = 8.0
+
+# --- English ---
+# Conversation history is added to each prompt up to a budget measured in tokens, not turns.
+# Older turns are replaced by a rolling summary that a general-ai worker writes in the
+# background, only while no chat jobs are waiting. Summary sub-tasks are served after all
+# chat work and at most one is in flight at a time. Tokens are estimated from characters
+# unless HISTORY_TOKENIZER_MODEL points to a tokenizer (e.g. a local copy of gemma's).
+# Summarized and expired rows are moved to ARCHIVE_DB_FILE to keep chat_history small.
+# --- Español ---
+# El historial de conversación se añade a cada prompt hasta un presupuesto medido en tokens,
+# no en turnos. Los turnos antiguos se sustituyen por un resumen acumulado que un worker
+# general-ai escribe en segundo plano, solo mientras no haya trabajos de chat esperando. Las
+# subtareas de resumen se atienden después de todo el trabajo de chat y como mucho hay una en
+# curso a la vez. Los tokens se estiman a partir de los caracteres salvo que HISTORY_TOKENIZER_MODEL apunte a un
+# tokenizador (ej. una copia local del de gemma). Las filas resumidas y caducadas se mueven a
+# ARCHIVE_DB_FILE para mantener pequeña la tabla chat_history.
+HISTORY_TOKEN_BUDGET = 1024
+HISTORY_SUMMARY_MAX_TOKENS = 256
+HISTORY_MAX_TURNS = 50
+HISTORY_TOKENIZER_MODEL = None
+CHARS_PER_TOKEN = 4
+TURN_OVERHEAD_TOKENS = 5
+HISTORY_COMPACTION_INTERVAL_SECONDS = 60
+HISTORY_SUMMARY_RETRY_SECONDS = 600
+HISTORY_SUMMARY_TURN_MAX_CHARS = 2000
+HISTORY_SUMMARY_INPUT_MAX_TOKENS = 1536
+HISTORY_RETENTION_DAYS = 30
+HISTORY_ARCHIVE_BATCH_SIZE = 5000
+ARCHIVE_DB_FILE = "orchestrator_chat_archive.db"
+
 # --- English ---
 # Using a single, powerful model for general AI tasks.
 # --- Español ---
@@ -63,21 +224,409 @@ SUPPORTED_EXPERTS = {
     "general-ai": {"model": "google/gemma-2b-it", "task": "text-generation"},
     "document-summarization": {"model": "t5-small", "task": "summarization"},
     "image-captioning": {"model": "Salesforce/blip-image-captioning-large", "task": "image-to-text"},
-    "audio-transcription": {"model": "openai/whisper-tiny.en", "task": "automatic-speech-recognition"}
+    "audio-transcription": {"model": "openai/whisper-tiny.en", "task": "automatic-speech-recognition"},
+    "quick-ai": {"model": "google/gemma-3-270m-it", "task": "text-generation"}
 }
+CHAT_EXPERTS = ("general-ai", "quick-ai") # Responden con JSON de chat en su texto generado. | Answer with chat JSON inside their generated text.
+
+# --- English ---
+# Cascaded routing for chat. Short prompts are first answered by quick-ai, a small model
+# with the same chat format as general-ai; its worker reports a confidence (the geometric
+# mean of the probabilities of the generated tokens). Answers that are valid JSON with a
+# 'generation' and at least CASCADE_CONFIDENCE_THRESHOLD are returned under the 'general-ai'
+# key, so the chat sees the usual format; otherwise the answer is discarded and the job is
+# sent on to general-ai. Prompts longer than CASCADE_MAX_PROMPT_CHARS go straight to general-ai,
+# as does everything while no active worker hosts quick-ai. Results of the cheap tier are
+# stored under the key of the expert they stand in for (CASCADE_RESULT_KEYS). quick-ai
+# sub-tasks that wait longer than CASCADE_MAX_WAIT_SECONDS, or once no worker hosts it any
+# more, are sent on to general-ai by the next purge.
+# --- Español ---
+# Enrutado en cascada para el chat. Los prompts cortos los responde primero quick-ai, un
+# modelo pequeño con el mismo formato de chat que general-ai; su worker informa de una
+# confianza (la media geométrica de las probabilidades de los tokens generados). Las respuestas
+# que son JSON válido con 'generation' y al menos CASCADE_CONFIDENCE_THRESHOLD se devuelven con
+# la clave 'general-ai', así el chat ve el formato de siempre; si no, la respuesta se descarta y
+# el trabajo pasa a general-ai. Los prompts más largos que CASCADE_MAX_PROMPT_CHARS van directos
+# a general-ai, igual que todo mientras ningún worker activo aloje quick-ai. Los resultados del
+# nivel barato se guardan con la clave del experto al que sustituyen (CASCADE_RESULT_KEYS). Las
+# subtareas de quick-ai que esperan más de CASCADE_MAX_WAIT_SECONDS, o cuando ya ningún worker
+# lo aloja, pasan a general-ai en la siguiente purga.
+CASCADE_ROUTING_ENABLED = True
+CASCADE_CONFIDENCE_THRESHOLD = 0.6
+CASCADE_MAX_PROMPT_CHARS = 300
+CASCADE_RESULT_KEYS = {"quick-ai": "general-ai"}
+CASCADE_HOST_CHECK_SECONDS = 10 # Cada cuánto se relee si hay workers de quick-ai. | How often quick-ai availability is re-read.
+CASCADE_MAX_WAIT_SECONDS = 60
+
+# --- English ---
+# Multi-expert workers. A worker with enough cores and RAM hosts several experts at once;
+# each hosted expert costs its model's memory once, plus memory and cores per concurrent
+# slot. Slots are handed out one at a time to the expert with the most pending sub-tasks
+# per slot, up to MAX_SLOTS_PER_EXPERT. RESERVED_* is left for the operating system.
+# --- Español ---
+# Workers multi-experto. Un worker con suficientes núcleos y RAM aloja varios expertos a la
+# vez; cada experto alojado cuesta la memoria de su modelo una vez, más memoria y núcleos por
+# cada hueco concurrente. Los huecos se reparten de uno en uno al experto con más subtareas
+# pendientes por hueco, hasta MAX_SLOTS_PER_EXPERT. RESERVED_* queda para el sistema operativo.
+EXPERT_RESOURCES = {
+    "general-ai": {"model_memory_gb": 10.0, "slot_memory_gb": 1.0, "slot_cores": 4},
+    "document-summarization": {"model_memory_gb": 0.5, "slot_memory_gb": 0.25, "slot_cores": 1},
+    "image-captioning": {"model_memory_gb": 2.0, "slot_memory_gb": 0.5, "slot_cores": 2},
+    "audio-transcription": {"model_memory_gb": 0.2, "slot_memory_gb": 0.25, "slot_cores": 1},
+    "quick-ai": {"model_memory_gb": 1.2, "slot_memory_gb": 0.5, "slot_cores": 1}
+}
+MAX_SLOTS_PER_EXPERT = 8
+RESERVED_MEMORY_GB = 2.0
+RESERVED_CORES = 1
+
+# --- English ---
+# Model artifact mirror. Workers download model files from the orchestrator instead of the
+# public hub when the model is present here, one folder per model with "/" written as "--"
+# (e.g. models/google--gemma-2b-it), filled beforehand with
+# `huggingface-cli download google/gemma-2b-it --local-dir models/google--gemma-2b-it`.
+# Files are described by a manifest with a SHA-256 per file and per MODEL_CHUNK_SIZE chunk,
+# so workers can resume downloads and fetch only the chunks that changed. Everything is
+# served from this folder, so it also works offline.
+# --- Español ---
+# Espejo de artefactos de modelos. Los workers descargan los archivos del modelo del
+# orquestador en lugar del hub público cuando el modelo está aquí, una carpeta por modelo con
+# "/" escrito como "--" (ej. models/google--gemma-2b-it), rellenada previamente con
+# `huggingface-cli download google/gemma-2b-it --local-dir models/google--gemma-2b-it`.
+# Los archivos se describen en un manifiesto con un SHA-256 por archivo y por fragmento de
+# MODEL_CHUNK_SIZE, para que los workers puedan reanudar descargas y traer solo los fragmentos
+# que cambiaron. Todo se sirve desde esta carpeta, así que también funciona sin conexión.
+MODEL_MIRROR_DIRECTORY = os.environ.get("HELIOS_MODEL_MIRROR", "models")
+MODEL_CHUNK_SIZE = 8 * 1024 * 1024
+
+# --- English ---
+# Semantic answer cache (optional, needs numpy and sentence-transformers). Chat prompts are
+# embedded and compared by cosine similarity with the prompts of earlier answers; at or above
+# SEMANTIC_CACHE_THRESHOLD the stored answer is returned without running general-ai. The index
+# keeps at most SEMANTIC_CACHE_MAX_ENTRIES answers and evicts the least recently used. Since
+# the answer to a follow-up question depends on the conversation, each answer is also keyed
+# on its context: the last SEMANTIC_CACHE_CONTEXT_TURNS turns before the prompt (at most
+# SEMANTIC_CACHE_CONTEXT_CHARS characters, or the rolling summary if no turns are left), and a
+# stored answer is only reused if its context is at least SEMANTIC_CACHE_CONTEXT_THRESHOLD
+# similar too. Prompts without history share the empty context.
+# --- Español ---
+# Caché semántica de respuestas (opcional, necesita numpy y sentence-transformers). Los prompts
+# del chat se convierten en embeddings y se comparan por similitud coseno con los prompts de
+# respuestas anteriores; a partir de SEMANTIC_CACHE_THRESHOLD se devuelve la respuesta guardada
+# sin ejecutar general-ai. El índice guarda como máximo SEMANTIC_CACHE_MAX_ENTRIES respuestas y
+# expulsa la usada hace más tiempo. Como la respuesta a una pregunta de seguimiento depende de
+# la conversación, cada respuesta se indexa también por su contexto: los últimos
+# SEMANTIC_CACHE_CONTEXT_TURNS turnos antes del prompt (como mucho SEMANTIC_CACHE_CONTEXT_CHARS
+# caracteres, o el resumen acumulado si no quedan turnos), y una respuesta guardada solo se
+# reutiliza si su contexto también es similar al menos en SEMANTIC_CACHE_CONTEXT_THRESHOLD. Los
+# prompts sin historial comparten el contexto vacío.
+SEMANTIC_CACHE_ENABLED = False
+SEMANTIC_CACHE_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+SEMANTIC_CACHE_THRESHOLD = 0.92
+SEMANTIC_CACHE_MAX_ENTRIES = 10000
+SEMANTIC_CACHE_CONTEXT_TURNS = 2
+SEMANTIC_CACHE_CONTEXT_CHARS = 1000
+SEMANTIC_CACHE_CONTEXT_THRESHOLD = 0.8
+
+# --- English ---
+# Completed jobs are kept for JOB_RETENTION_DAYS, then appended to gzip-compressed JSON-lines
+# files in JOB_ARCHIVE_DIRECTORY and deleted, and the freed pages are returned to the file
+# system with incremental vacuuming. Results larger than RESULT_COMPRESSION_MIN_BYTES are
+# stored zlib-compressed.
+# --- Español ---
+# Los trabajos completados se conservan JOB_RETENTION_DAYS días; después se añaden a archivos
+# JSON-lines comprimidos con gzip en JOB_ARCHIVE_DIRECTORY y se borran, y las páginas liberadas
+# se devuelven al sistema de archivos con vacuum incremental. Los resultados mayores que
+# RESULT_COMPRESSION_MIN_BYTES se guardan comprimidos con zlib.
+JOB_RETENTION_DAYS = 7
+JOB_RETENTION_INTERVAL_SECONDS = 300
+JOB_RETENTION_BATCH_SIZE = 500
+JOB_ARCHIVE_DIRECTORY = "archive"
+RESULT_COMPRESSION_MIN_BYTES = 256
+INCREMENTAL_VACUUM_PAGES = 2000
+
+# --- English ---
+# Histogram buckets (in seconds) for the /metrics endpoint. HTTP requests and SQLite
+# queries are expected to be fast; sub-tasks include model inference and can take minutes.
+# --- Español ---
+# Buckets de histograma (en segundos) para el endpoint /metrics. Se espera que las peticiones
+# HTTP y las consultas a SQLite sean rápidas; las subtareas incluyen inferencia y pueden tardar minutos.
+REQUEST_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SQLITE_QUERY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+TASK_LATENCY_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+QUEUE_WAIT_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800)
+WORKER_STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+INGEST_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CONFIDENCE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0)
+
+# --- English ---
+# Processing stages that workers report with each result (see `process_sub_task` in the worker).
+# Unknown stage names are ignored so a client cannot create arbitrary metric series.
+# --- Español ---
+# Etapas de procesamiento que los workers informan con cada resultado (ver `process_sub_task` en el worker).
+# Los nombres de etapa desconocidos se ignoran para que un cliente no pueda crear series arbitrarias.
+WORKER_STAGES = ("fetch", "load", "tokenize", "inference", "postprocess", "upload")
+
+# --- English ---
+# --- Metrics ---
+# Minimal in-process Prometheus-style counters and histograms. Recording a sample is a
+# dictionary lookup plus a few additions under a lock, so it is safe to call on hot paths.
+# Gauges such as queue depth are computed from the database only when /metrics is scraped.
+# --- Español ---
+# --- Métricas ---
+# Contadores e histogramas mínimos al estilo Prometheus en el propio proceso. Registrar una
+# muestra es una búsqueda en un diccionario y unas sumas bajo un lock, así que es seguro en
+# las rutas críticas. Los gauges como la profundidad de cola se calculan desde la base de datos
+# solo cuando se consulta /metrics.
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name, self.help_text, self.label_names = name, help_text, label_names
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1.0):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.label_names, labels)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, label_names=()):
+        self.name, self.help_text, self.label_names = name, help_text, label_names
+        self.buckets = tuple(buckets)
+        # --- English ---
+        # labels -> [per-bucket counts (last slot is +Inf), sum, count]
+        # --- Español ---
+        # etiquetas -> [conteos por bucket (el último es +Inf), suma, total]
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            snapshot = [(labels, list(counts), total, count) for labels, (counts, total, count) in self.series.items()]
+        for labels, counts, total, count in sorted(snapshot):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                bucket_labels = format_labels(self.label_names + ("le",), labels + (str(bound),))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.label_names, labels)} {count}")
+        return lines
+
+def format_labels(names, values):
+    if not names: return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+HTTP_REQUEST_LATENCY = Histogram("helios_http_request_duration_seconds", "Latency of HTTP requests by endpoint.", REQUEST_LATENCY_BUCKETS, ("method", "endpoint", "status"))
+SQLITE_QUERY_LATENCY = Histogram("helios_sqlite_query_duration_seconds", "Time spent executing SQLite statements.", SQLITE_QUERY_BUCKETS, ("statement",))
+SUB_TASK_LATENCY = Histogram("helios_sub_task_claim_to_completion_seconds", "Time from a worker claiming a sub-task to its result being submitted.", TASK_LATENCY_BUCKETS, ("expert_type",))
+RESULT_PARSE_FAILURES = Counter("helios_result_parse_failures_total", "Sub-task results whose model output could not be parsed as JSON.", ("expert_type",))
+WORKERS_PURGED = Counter("helios_workers_purged_total", "Workers removed for missing heartbeats.")
+WORKER_STAGE_LATENCY = Histogram("helios_worker_stage_duration_seconds", "Worker-reported time per processing stage.", WORKER_STAGE_BUCKETS, ("expert_type", "stage"))
+QUEUE_WAIT = Histogram("helios_sub_task_queue_wait_seconds", "Time a sub-task waited in the queue before a worker claimed it.", QUEUE_WAIT_BUCKETS, ("expert_type",))
+ADMISSION_REJECTIONS = Counter("helios_admission_rejections_total", "Jobs refused by admission control.", ("reason",))
+MODEL_BYTES_SERVED = Counter("helios_model_artifact_bytes_served_total", "Model artifact bytes sent to workers.", ("model",))
+SEMANTIC_CACHE_LOOKUPS = Counter("helios_semantic_cache_lookups_total", "Semantic answer cache lookups by result.", ("result",))
+SEMANTIC_CACHE_SAVED_SECONDS = Counter("helios_semantic_cache_saved_seconds_total", "Claim-to-completion seconds of general-ai work avoided by cache hits.")
+SEMANTIC_CACHE_EVICTIONS = Counter("helios_semantic_cache_evictions_total", "Answers evicted from the semantic cache.")
+WORKERS_RESUMED = Counter("helios_workers_resumed_total", "Warm restarts by whether the worker row still existed.", ("outcome",))
+CASCADE_ROUTES = Counter("helios_cascade_routes_total", "Chat jobs by first tier: 'cascade' tries quick-ai first, 'direct' goes straight to general-ai.", ("route",))
+CASCADE_OUTCOMES = Counter("helios_cascade_outcomes_total", "quick-ai sub-tasks accepted, escalated to general-ai, or escalated unanswered (stranded).", ("outcome",))
+CASCADE_CONFIDENCE = Histogram("helios_cascade_confidence", "Confidence reported for quick-ai answers.", CONFIDENCE_BUCKETS)
+DOCUMENT_INGESTS = Counter("helios_document_ingests_total", "Uploaded documents by ingestion result.", ("result",))
+DOCUMENT_EXTRACTION_LATENCY = Histogram("helios_document_extraction_seconds", "Time to extract the text of an uploaded document in the ingest pool.", INGEST_BUCKETS, ("format",))
+SUB_TASKS_RELEASED = Counter("helios_sub_tasks_released_total", "Sub-tasks returned to the queue because the worker holding them restarted without a result or was purged.")
+METRICS = [HTTP_REQUEST_LATENCY, SQLITE_QUERY_LATENCY, SUB_TASK_LATENCY, RESULT_PARSE_FAILURES, WORKERS_PURGED, WORKER_STAGE_LATENCY, QUEUE_WAIT, ADMISSION_REJECTIONS, MODEL_BYTES_SERVED,
+           SEMANTIC_CACHE_LOOKUPS, SEMANTIC_CACHE_SAVED_SECONDS, SEMANTIC_CACHE_EVICTIONS, WORKERS_RESUMED, SUB_TASKS_RELEASED,
+           CASCADE_ROUTES, CASCADE_OUTCOMES, CASCADE_CONFIDENCE, DOCUMENT_INGESTS, DOCUMENT_EXTRACTION_LATENCY]
+
+class StageTimings:
+    # --- English ---
+    # Aggregates worker-reported stage timings per expert type and per worker, to show
+    # whether time goes to I/O, preprocessing or the model. Per-worker entries are dropped
+    # when the worker is purged, so memory stays proportional to the active network.
+    # --- Español ---
+    # Agrega los tiempos por etapa informados por los workers por tipo de experto y por worker,
+    # para mostrar si el tiempo se va en E/S, preprocesamiento o el modelo. Las entradas por
+    # worker se eliminan al purgar el worker, así la memoria es proporcional a la red activa.
+    def __init__(self):
+        self.per_expert = {}
+        self.per_worker = {}
+        self.lock = threading.Lock()
+
+    def record(self, worker_id, expert_type, timings):
+        with self.lock:
+            for stage, seconds in timings.items():
+                for table, key in ((self.per_expert, expert_type), (self.per_worker, worker_id)):
+                    stats = table.setdefault(key, {}).setdefault(stage, [0, 0.0, 0.0])
+                    stats[0] += 1
+                    stats[1] += seconds
+                    stats[2] = max(stats[2], seconds)
+
+    def forget_workers(self, worker_ids):
+        with self.lock:
+            for worker_id in worker_ids: self.per_worker.pop(worker_id, None)
+
+    def snapshot(self):
+        def summarize(stages):
+            grand_total = sum(total for _, total, _ in stages.values()) or 1.0
+            return {stage: {"count": count, "mean_seconds": total / count, "max_seconds": peak, "share": total / grand_total}
+                    for stage, (count, total, peak) in stages.items()}
+        with self.lock:
+            return {"per_expert": {key: summarize(stages) for key, stages in self.per_expert.items()},
+                    "per_worker": {key: summarize(stages) for key, stages in self.per_worker.items()}}
+
+STAGE_TIMINGS = StageTimings()
 
 # --- English ---
 # --- Database Functions ---
 # --- Español ---
 # --- Funciones de la Base de Datos ---
+class TimedConnection(sqlite3.Connection):
+    # --- English ---
+    # sqlite3 connection that records the execution time of every statement.
+    # --- Español ---
+    # Conexión sqlite3 que registra el tiempo de ejecución de cada sentencia.
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            SQLITE_QUERY_LATENCY.observe(time.perf_counter() - start, (sql.split(None, 1) or [""])[0].upper())
+
+# --- English ---
+# --- State Backends ---
+# A backend hands out connections that speak SQLite's SQL dialect and implements leases
+# for leader election.
+# --- Español ---
+# --- Backends de Estado ---
+# Un backend entrega conexiones que hablan el dialecto SQL de SQLite e implementa leases
+# para la elección de líder.
+class SQLiteStateBackend:
+    def __init__(self, path, archive_path=ARCHIVE_DB_FILE):
+        self.path = path
+        self.archive_path = archive_path
+        self.uri = False
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, factory=TimedConnection, timeout=SQLITE_BUSY_TIMEOUT_SECONDS, uri=self.uri)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def prepare(self, conn):
+        # --- English ---
+        # WAL lets readers continue while another process writes; the busy timeout above
+        # makes concurrent writers wait for the lock instead of failing immediately.
+        # Incremental auto-vacuum can only be enabled before the first table is created;
+        # older databases need a one-time `VACUUM` after setting it by hand.
+        # --- Español ---
+        # WAL permite que los lectores sigan mientras otro proceso escribe; el timeout de arriba
+        # hace que los escritores concurrentes esperen el bloqueo en lugar de fallar al momento.
+        # El auto-vacuum incremental solo se puede activar antes de crear la primera tabla;
+        # las bases de datos anteriores necesitan un `VACUUM` manual tras configurarlo.
+        if conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        elif conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            print("Note: run 'PRAGMA auto_vacuum = INCREMENTAL; VACUUM;' once to let retention shrink the database file. | Nota: ejecuta 'PRAGMA auto_vacuum = INCREMENTAL; VACUUM;' una vez para que la retención reduzca el archivo.")
+        conn.execute("PRAGMA journal_mode=WAL")
+
+    def try_acquire_lease(self, name, holder, ttl_seconds):
+        # --- English ---
+        # Takes or renews the named lease if it is free, expired or already ours.
+        # --- Español ---
+        # Toma o renueva el lease indicado si está libre, caducado o ya es nuestro.
+        now = time.time()
+        conn = self.connect()
+        try:
+            conn.execute('''INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+                WHERE leases.holder = excluded.holder OR leases.expires_at < ?''', (name, holder, now + ttl_seconds, now))
+            conn.commit()
+            row = conn.execute("SELECT holder FROM leases WHERE name = ?", (name,)).fetchone()
+            return row is not None and row['holder'] == holder
+        finally:
+            conn.close()
+
+class MemoryStateBackend(SQLiteStateBackend):
+    # --- English ---
+    # In-memory database shared by every connection of this process, for tests and embedding.
+    # An anchor connection keeps it alive; it disappears when the process exits.
+    # --- Español ---
+    # Base de datos en memoria compartida por todas las conexiones de este proceso, para pruebas
+    # e integración. Una conexión ancla la mantiene viva; desaparece al terminar el proceso.
+    def __init__(self, name="helios"):
+        super().__init__(f"file:{name}?mode=memory&cache=shared", f"file:{name}_archive?mode=memory&cache=shared")
+        self.uri = True
+        self.anchor = self.connect()
+
+    def prepare(self, conn):
+        pass
+
+STATE_BACKENDS = {
+    "sqlite": lambda location: SQLiteStateBackend(location),
+    "memory": lambda location: MemoryStateBackend(location or "helios"),
+}
+
+def create_state_backend(url):
+    scheme, _, location = url.partition("://")
+    if scheme not in STATE_BACKENDS:
+        raise ValueError(f"Unknown state backend '{scheme}'. | Backend de estado desconocido '{scheme}'.")
+    return STATE_BACKENDS[scheme](location[1:] if location.startswith("/") else location)
+
+state_backend = create_state_backend(STATE_BACKEND_URL)
+
 def get_db_connection():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return state_backend.connect()
+
+def acquire_leadership(task_name):
+    # --- English ---
+    # True if this process should run the singleton background task `task_name` now.
+    # --- Español ---
+    # True si este proceso debe ejecutar ahora la tarea de fondo única `task_name`.
+    return state_backend.try_acquire_lease(task_name, NODE_ID, LEADER_LEASE_SECONDS)
+
+def ensure_column(conn, table, column, definition):
+    # --- English ---
+    # Adds a column to an existing table. Needed because CREATE TABLE IF NOT EXISTS
+    # does not upgrade databases created by older versions of the orchestrator.
+    # --- Español ---
+    # Añade una columna a una tabla existente. Necesario porque CREATE TABLE IF NOT EXISTS
+    # no actualiza las bases de datos creadas por versiones anteriores del orquestador.
+    columns = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
 
 def init_db():
     os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
     conn = get_db_connection()
+    state_backend.prepare(conn)
+    # --- English ---
+    # Several orchestrator processes may start at once; take the write lock so schema
+    # upgrades run one at a time.
+    # --- Español ---
+    # Varios procesos del orquestador pueden arrancar a la vez; tomar el bloqueo de escritura
+    # para que las actualizaciones del esquema se ejecuten de una en una.
+    conn.execute("BEGIN IMMEDIATE")
     conn.execute('''CREATE TABLE IF NOT EXISTS workers (id TEXT PRIMARY KEY, assigned_expert TEXT, specs TEXT, status TEXT, reputation REAL, last_heartbeat INTEGER)''')
     conn.execute('''CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, prompt TEXT, status TEXT, final_result TEXT)''')
     conn.execute('''CREATE TABLE IF NOT EXISTS sub_tasks (id TEXT PRIMARY KEY, job_id TEXT, expert_type TEXT, data TEXT, status TEXT, assigned_worker_id TEXT, result TEXT, FOREIGN KEY (job_id) REFERENCES jobs (id))''')
@@ -92,33 +641,883 @@ def init_db():
         content TEXT NOT NULL,
         timestamp INTEGER NOT NULL
     )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS chat_summaries (
+        worker_id TEXT PRIMARY KEY,
+        summary TEXT,
+        covered_until_id INTEGER NOT NULL DEFAULT 0,
+        token_count INTEGER NOT NULL DEFAULT 0,
+        pending_sub_task_id TEXT,
+        requested_at INTEGER
+    )''')
+    conn.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires_at REAL NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS fair_queues (expert_type TEXT PRIMARY KEY, virtual_time REAL NOT NULL)")
+    ensure_column(conn, "sub_tasks", "assigned_at", "REAL")
+    ensure_column(conn, "chat_history", "token_count", "INTEGER")
+    ensure_column(conn, "jobs", "worker_id", "TEXT")
+    ensure_column(conn, "jobs", "created_at", "REAL")
+    ensure_column(conn, "jobs", "completed_at", "REAL")
+    ensure_column(conn, "jobs", "semantic_cacheable", "INTEGER NOT NULL DEFAULT 0")
+    ensure_column(conn, "jobs", "semantic_cache_context", "TEXT")
+    ensure_column(conn, "sub_tasks", "requester_id", "TEXT")
+    ensure_column(conn, "sub_tasks", "created_at", "REAL")
+    ensure_column(conn, "sub_tasks", "fair_tag", "REAL")
+    ensure_column(conn, "sub_tasks", "background", "INTEGER NOT NULL DEFAULT 0")
+    ensure_column(conn, "workers", "utilization", "REAL")
+    ensure_column(conn, "workers", "expert_slots", "TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_history_worker ON chat_history (worker_id, id)")
+    conn.execute("DROP INDEX IF EXISTS idx_sub_tasks_queue")
+    conn.execute("DROP INDEX IF EXISTS idx_sub_tasks_fair_queue")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sub_tasks_fair_queue_background ON sub_tasks (expert_type, status, background, fair_tag)")
+    # --- English ---
+    # fair_tag is part of the requester index so enqueue_sub_task reads a user's last tag from the
+    # index alone; without it SQLite walks the whole expert queue for every new sub-task.
+    # --- Español ---
+    # fair_tag forma parte del índice del solicitante para que enqueue_sub_task lea la última etiqueta
+    # del usuario solo del índice; sin ella SQLite recorre toda la cola del experto por cada subtarea nueva.
+    conn.execute("DROP INDEX IF EXISTS idx_sub_tasks_requester")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sub_tasks_requester_tag ON sub_tasks (requester_id, expert_type, status, fair_tag)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_worker ON jobs (worker_id, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_completed ON jobs (status, completed_at)")
+    # --- English ---
+    # The index expression must match JOB_UPDATED_AT_SQL exactly for SQLite to use it.
+    # --- Español ---
+    # La expresión del índice debe coincidir exactamente con JOB_UPDATED_AT_SQL para que SQLite la use.
+    conn.execute("DROP INDEX IF EXISTS idx_jobs_worker_updated")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_jobs_worker_updated_at ON jobs (worker_id, {JOB_UPDATED_AT_SQL}, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sub_tasks_job ON sub_tasks (job_id)")
+    # --- English ---
+    # Jobs completed before retention existed start their retention period now.
+    # --- Español ---
+    # Los trabajos completados antes de existir la retención empiezan su periodo ahora.
+    conn.execute("UPDATE jobs SET completed_at = ? WHERE status = 'completed' AND completed_at IS NULL", (time.time(),))
     conn.commit()
     conn.close()
 
+def priority_weight(reputation):
+    return min(PRIORITY_MAX_WEIGHT, 1.0 + PRIORITY_REPUTATION_SCALE * math.log1p(max(reputation or 0.0, 0.0)))
+
+# --- English ---
+# --- Result Storage ---
+# Results are JSON text. Large ones are stored as zlib-compressed BLOBs in the same
+# columns; SQLite's dynamic typing lets both forms coexist, so old rows stay readable.
+# --- Español ---
+# --- Almacenamiento de Resultados ---
+# Los resultados son texto JSON. Los grandes se guardan como BLOBs comprimidos con zlib en
+# las mismas columnas; el tipado dinámico de SQLite permite que ambas formas convivan, así
+# que las filas antiguas siguen siendo legibles.
+def pack_result(value):
+    text = json.dumps(value, separators=(",", ":"))
+    if len(text) < RESULT_COMPRESSION_MIN_BYTES: return text
+    return zlib.compress(text.encode("utf-8"))
+
+def unpack_result(stored):
+    if isinstance(stored, bytes): return zlib.decompress(stored).decode("utf-8")
+    return stored
+
+# --- English ---
+# --- Sub-Task Queue ---
+# Each expert queue is served in weighted fair order across users: a new sub-task is tagged
+# with a virtual finish time, max(queue virtual time, the user's last tag) + 1 / weight,
+# and workers always receive the smallest tag. A user with many queued sub-tasks therefore
+# cannot push back the first sub-task of another user. The queue's virtual time advances
+# to the tag of each claimed sub-task. Tags are computed once, at enqueue time, and served
+# from an index, so priorities never require re-sorting the queue. Background sub-tasks
+# (history summaries) are only served when no other sub-task of their expert is pending.
+# --- Español ---
+# --- Cola de Subtareas ---
+# Cada cola de experto se sirve en orden justo ponderado entre usuarios: una subtarea nueva
+# recibe un tiempo virtual de finalización, max(tiempo virtual de la cola, última etiqueta
+# del usuario) + 1 / peso, y los workers siempre reciben la etiqueta más pequeña. Así un
+# usuario con muchas subtareas en cola no puede retrasar la primera subtarea de otro. El
+# tiempo virtual de la cola avanza hasta la etiqueta de cada subtarea reclamada. Las etiquetas
+# se calculan una vez, al encolar, y se sirven desde un índice, así que las prioridades nunca
+# requieren reordenar la cola. Las subtareas de fondo (resúmenes del historial) solo se sirven
+# cuando no hay ninguna otra subtarea pendiente de su experto.
+def enqueue_sub_task(conn, job_id, expert_type, data, requester_id=None, weight=1.0, fair_tag=None, created_at=None, background=False):
+    # --- English ---
+    # `fair_tag` and `created_at` are only given for sub-tasks that keep their place from an
+    # earlier queue (cascade escalation).
+    # --- Español ---
+    # `fair_tag` y `created_at` solo se indican para subtareas que conservan su puesto de una
+    # cola anterior (escalado de la cascada).
+    if fair_tag is None:
+        queue = conn.execute("SELECT virtual_time FROM fair_queues WHERE expert_type = ?", (expert_type,)).fetchone()
+        virtual_time = queue['virtual_time'] if queue else 0.0
+        last_tag = None
+        if requester_id:
+            last_tag = conn.execute("SELECT MAX(fair_tag) FROM sub_tasks WHERE requester_id = ? AND expert_type = ? AND status = 'pending'", (requester_id, expert_type)).fetchone()[0]
+        fair_tag = max(virtual_time, last_tag or 0.0) + 1.0 / max(weight, 0.01)
+    sub_task_id = str(uuid.uuid4())
+    conn.execute("INSERT INTO sub_tasks (id, job_id, expert_type, data, status, requester_id, created_at, fair_tag, background) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                 (sub_task_id, job_id, expert_type, json.dumps(data), "pending", requester_id, created_at or time.time(), fair_tag, int(background)))
+    return sub_task_id
+
+def claim_sub_task(conn, worker_id, expert_type):
+    # --- English ---
+    # Select and claim in a single statement so two orchestrator processes can never hand
+    # the same sub-task to two workers.
+    # --- Español ---
+    # Seleccionar y reclamar en una sola sentencia para que dos procesos del orquestador nunca
+    # entreguen la misma subtarea a dos workers.
+    now = time.time()
+    sub_task = conn.execute('''UPDATE sub_tasks SET status = 'assigned', assigned_worker_id = ?, assigned_at = ?
+        WHERE id = (SELECT id FROM sub_tasks WHERE expert_type = ? AND status = 'pending' ORDER BY background, fair_tag LIMIT 1) AND status = 'pending'
+        RETURNING *''', (worker_id, now, expert_type)).fetchone()
+    if sub_task is None: return None
+    if sub_task['fair_tag'] is not None:
+        conn.execute('''INSERT INTO fair_queues (expert_type, virtual_time) VALUES (?, ?)
+            ON CONFLICT(expert_type) DO UPDATE SET virtual_time = MAX(virtual_time, excluded.virtual_time)''', (expert_type, sub_task['fair_tag']))
+    if sub_task['created_at']: QUEUE_WAIT.observe(now - sub_task['created_at'], expert_type)
+    return sub_task
+
+def release_sub_tasks(conn, worker_ids):
+    # --- English ---
+    # Sub-tasks held by purged workers go back to the head of their queue (their fair tag is
+    # kept), so their jobs finish elsewhere instead of staying pending forever.
+    # --- Español ---
+    # Las subtareas de workers purgados vuelven a la cabeza de su cola (se conserva su etiqueta
+    # justa), así sus trabajos terminan en otro worker en lugar de quedar pendientes.
+    placeholders = ', '.join('?' for _ in worker_ids)
+    return conn.execute(f"UPDATE sub_tasks SET status = 'pending', assigned_worker_id = NULL, assigned_at = NULL WHERE status = 'assigned' AND assigned_worker_id IN ({placeholders})", list(worker_ids)).rowcount
+
+def claim_next_sub_task(conn, worker_id, expert_types):
+    # --- English ---
+    # Combined fetch for multi-expert workers: serves the queue, among `expert_types`, whose
+    # next sub-task has waited longest, background sub-tasks last. Falls through to the next
+    # queue if it was taken meanwhile.
+    # --- Español ---
+    # Obtención combinada para workers multi-experto: atiende la cola, entre `expert_types`,
+    # cuya siguiente subtarea lleva más tiempo esperando, las de fondo al final. Pasa a la
+    # siguiente cola si otra la tomó antes.
+    heads = []
+    for expert_type in expert_types:
+        head = conn.execute("SELECT created_at, background FROM sub_tasks WHERE expert_type = ? AND status = 'pending' ORDER BY background, fair_tag LIMIT 1", (expert_type,)).fetchone()
+        if head: heads.append((head['background'], head['created_at'] or 0.0, expert_type))
+    for _, _, expert_type in sorted(heads):
+        sub_task = claim_sub_task(conn, worker_id, expert_type)
+        if sub_task: return sub_task
+    return None
+
+quick_ai_hosts = {"hosted": False, "checked_at": 0.0}
+
+def quick_ai_hosted(conn, now):
+    active_threshold = int(now) - HEARTBEAT_TIMEOUT_SECONDS
+    hosted = conn.execute("SELECT 1 FROM workers WHERE last_heartbeat >= ? AND assigned_expert LIKE '%quick-ai%' LIMIT 1", (active_threshold,)).fetchone() is not None
+    quick_ai_hosts.update(hosted=hosted, checked_at=now)
+    return hosted
+
+def choose_chat_expert(conn, prompt):
+    # --- English ---
+    # First tier of the cascade for a chat prompt: quick-ai if the prompt is short and some
+    # active worker hosts it, general-ai otherwise. Whether one does is cached for
+    # CASCADE_HOST_CHECK_SECONDS (and set as soon as this process assigns quick-ai), so chat
+    # submissions do not scan the workers table (assigned_expert lists every hosted expert).
+    # --- Español ---
+    # Primer nivel de la cascada para un prompt del chat: quick-ai si el prompt es corto y algún
+    # worker activo lo aloja, si no general-ai. Si alguno lo aloja se guarda en caché durante
+    # CASCADE_HOST_CHECK_SECONDS (y se marca en cuanto este proceso asigna quick-ai), así los
+    # envíos del chat no recorren la tabla de workers (assigned_expert lista todos los expertos alojados).
+    if not CASCADE_ROUTING_ENABLED or len(prompt) > CASCADE_MAX_PROMPT_CHARS: return "general-ai"
+    now = time.time()
+    if now - quick_ai_hosts["checked_at"] >= CASCADE_HOST_CHECK_SECONDS: quick_ai_hosted(conn, now)
+    return "quick-ai" if quick_ai_hosts["hosted"] else "general-ai"
+
+def accept_cheap_answer(clean_result, parsed, confidence):
+    if confidence is not None: CASCADE_CONFIDENCE.observe(confidence)
+    accepted = parsed and isinstance(clean_result, dict) and bool(clean_result.get('generation')) and confidence is not None and confidence >= CASCADE_CONFIDENCE_THRESHOLD
+    CASCADE_OUTCOMES.inc("accepted" if accepted else "escalated")
+    return accepted
+
+def escalate_sub_task(conn, sub_task_id, claimed, task_data):
+    # --- English ---
+    # Replaces a rejected quick-ai sub-task with a general-ai one for the same job and prompt.
+    # The user has already waited for the cheap tier, so it keeps its creation time and goes to
+    # the head of the general-ai queue: its fair tag is the quick-ai one, capped at the general-ai
+    # virtual time (each queue has its own virtual clock).
+    # --- Español ---
+    # Sustituye una subtarea de quick-ai rechazada por una de general-ai para el mismo trabajo y
+    # prompt. El usuario ya esperó al nivel barato, así que conserva su hora de creación y va a la
+    # cabeza de la cola de general-ai: su etiqueta justa es la de quick-ai, limitada al tiempo
+    # virtual de general-ai (cada cola tiene su propio reloj virtual).
+    job = conn.execute("SELECT job_id FROM sub_tasks WHERE id = ?", (sub_task_id,)).fetchone()
+    queue = conn.execute("SELECT virtual_time FROM fair_queues WHERE expert_type = 'general-ai'").fetchone()
+    virtual_time = queue['virtual_time'] if queue else 0.0
+    fair_tag = min(claimed['fair_tag'], virtual_time) if claimed['fair_tag'] is not None else virtual_time
+    conn.execute("DELETE FROM sub_tasks WHERE id = ?", (sub_task_id,))
+    return enqueue_sub_task(conn, job['job_id'], "general-ai", {"text": task_data['text']}, requester_id=claimed['requester_id'],
+                            fair_tag=fair_tag, created_at=claimed['created_at'])
+
+def escalate_stranded_sub_tasks(conn):
+    # --- English ---
+    # quick-ai sub-tasks only escalate when a quick-ai worker answers them. Those still pending
+    # after CASCADE_MAX_WAIT_SECONDS, or while no active worker hosts quick-ai (the last one left,
+    # or the job was routed from a stale availability cache), are escalated here instead.
+    # --- Español ---
+    # Las subtareas de quick-ai solo escalan cuando un worker de quick-ai las responde. Las que
+    # siguen pendientes tras CASCADE_MAX_WAIT_SECONDS, o mientras ningún worker activo aloja
+    # quick-ai (se fue el último, o el trabajo se enrutó con una caché de disponibilidad antigua),
+    # se escalan aquí.
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    cutoff = now - CASCADE_MAX_WAIT_SECONDS if quick_ai_hosted(conn, now) else now
+    stranded = conn.execute('''SELECT s.id, s.data, s.fair_tag, s.created_at, j.worker_id AS requester_id FROM sub_tasks s LEFT JOIN jobs j ON j.id = s.job_id
+        WHERE s.expert_type = 'quick-ai' AND s.status = 'pending' AND COALESCE(s.created_at, 0) < ?''', (cutoff,)).fetchall()
+    for sub_task in stranded:
+        escalate_sub_task(conn, sub_task['id'], sub_task, json.loads(sub_task['data']))
+    conn.commit()
+    if stranded: CASCADE_OUTCOMES.inc("stranded", amount=len(stranded))
+    return len(stranded)
+
+def check_admission(conn, worker_id):
+    # --- English ---
+    # Raises 429 with Retry-After if the user is over their rate or in-flight limit, or the queue is full.
+    # --- Español ---
+    # Lanza 429 con Retry-After si el usuario supera su límite de ritmo o de trabajos en curso, o la cola está llena.
+    now = time.time()
+    window_start = now - USER_RATE_LIMIT_WINDOW_SECONDS
+    in_flight_start = now - IN_FLIGHT_JOB_MAX_AGE_SECONDS
+    usage = conn.execute('''SELECT SUM(created_at > ?) AS recent, SUM(status = 'pending') AS in_flight, MIN(CASE WHEN created_at > ? THEN created_at END) AS oldest_recent
+        FROM jobs WHERE worker_id = ? AND created_at > ?''', (window_start, window_start, worker_id, min(window_start, in_flight_start))).fetchone()
+    if (usage['in_flight'] or 0) >= USER_MAX_IN_FLIGHT_JOBS:
+        ADMISSION_REJECTIONS.inc("in_flight")
+        raise HTTPException(status_code=429, detail=f"Too many unfinished jobs (max {USER_MAX_IN_FLIGHT_JOBS}). | Demasiados trabajos sin terminar (máx. {USER_MAX_IN_FLIGHT_JOBS}).",
+                            headers={"Retry-After": str(QUEUE_FULL_RETRY_AFTER_SECONDS)})
+    if (usage['recent'] or 0) >= USER_RATE_LIMIT_JOBS:
+        ADMISSION_REJECTIONS.inc("rate_limit")
+        retry_after = max(1, int(usage['oldest_recent'] + USER_RATE_LIMIT_WINDOW_SECONDS - now) + 1)
+        raise HTTPException(status_code=429, detail=f"Rate limit exceeded ({USER_RATE_LIMIT_JOBS} jobs per {USER_RATE_LIMIT_WINDOW_SECONDS}s). | Límite de ritmo superado.",
+                            headers={"Retry-After": str(retry_after)})
+    placeholders = ', '.join('?' for _ in SUPPORTED_EXPERTS)
+    pending = conn.execute(f"SELECT COUNT(*) FROM sub_tasks WHERE expert_type IN ({placeholders}) AND status = 'pending'", tuple(SUPPORTED_EXPERTS)).fetchone()[0]
+    if pending >= MAX_QUEUE_DEPTH:
+        ADMISSION_REJECTIONS.inc("queue_full")
+        raise HTTPException(status_code=429, detail="The network is busy, please try again shortly. | La red está ocupada, inténtalo de nuevo en breve.",
+                            headers={"Retry-After": str(QUEUE_FULL_RETRY_AFTER_SECONDS)})
+
+# --- English ---
+# --- Chat History ---
+# --- Español ---
+# --- Historial de Chat ---
+history_tokenizer = None
+if HISTORY_TOKENIZER_MODEL:
+    try:
+        from transformers import AutoTokenizer
+        history_tokenizer = AutoTokenizer.from_pretrained(HISTORY_TOKENIZER_MODEL)
+    except (ImportError, OSError) as e:
+        print(f"Tokenizer unavailable, estimating tokens from characters: {e} | Tokenizador no disponible, estimando tokens por caracteres: {e}")
+
+def count_tokens(text):
+    if history_tokenizer is not None:
+        return len(history_tokenizer.encode(text, add_special_tokens=False)) + TURN_OVERHEAD_TOKENS
+    return len(text) // CHARS_PER_TOKEN + 1 + TURN_OVERHEAD_TOKENS
+
+def stored_tokens_sql(table=""):
+    # --- English ---
+    # SQL expression for a row's token count; rows from older versions have none and are estimated.
+    # --- Español ---
+    # Expresión SQL del número de tokens de una fila; las filas de versiones anteriores no lo tienen y se estima.
+    prefix = f"{table}." if table else ""
+    return f"COALESCE({prefix}token_count, LENGTH({prefix}content) / {CHARS_PER_TOKEN} + 1 + {TURN_OVERHEAD_TOKENS})"
+
+def add_chat_turn(conn, worker_id, role, content):
+    conn.execute("INSERT INTO chat_history (worker_id, role, content, timestamp, token_count) VALUES (?, ?, ?, ?, ?)",
+                 (worker_id, role, content, int(time.time()), count_tokens(content)))
+
+def build_conversation_history(conn, worker_id):
+    # --- English ---
+    # Returns the rolling summary (if any) followed by the newest turns that fit in
+    # HISTORY_TOKEN_BUDGET. Token counts are stored with each row, so this is one
+    # indexed query and no re-tokenization. Rows from older versions have no count
+    # and fall back to the character estimate.
+    # --- Español ---
+    # Devuelve el resumen acumulado (si existe) seguido de los turnos más recientes que
+    # caben en HISTORY_TOKEN_BUDGET. El número de tokens se guarda con cada fila, así que
+    # es una consulta indexada sin volver a tokenizar. Las filas de versiones anteriores no
+    # tienen conteo y usan la estimación por caracteres.
+    summary = conn.execute("SELECT summary, covered_until_id, token_count FROM chat_summaries WHERE worker_id = ?", (worker_id,)).fetchone()
+    covered_until_id = summary['covered_until_id'] if summary else 0
+    has_summary = bool(summary and summary['summary'])
+    budget = HISTORY_TOKEN_BUDGET - (summary['token_count'] if has_summary else 0)
+    rows = conn.execute(f"SELECT role, content, {stored_tokens_sql()} AS tokens FROM chat_history WHERE worker_id = ? AND id > ? ORDER BY id DESC LIMIT ?",
+                        (worker_id, covered_until_id, HISTORY_MAX_TURNS)).fetchall()
+    turns = []
+    for row in rows:
+        if row['tokens'] > budget: break
+        budget -= row['tokens']
+        turns.append(row)
+    turns.reverse() # Put messages in chronological order
+
+    conversation_history = f"<start_of_turn>user\nSummary of our earlier conversation: {summary['summary']}<end_of_turn>\n" if has_summary else ""
+    return conversation_history + "".join([f"<start_of_turn>{row['role']}\n{row['content']}<end_of_turn>\n" for row in turns])
+
+def compact_chat_history():
+    # --- English ---
+    # Queues a background general-ai sub-task that folds the oldest unsummarized turns of
+    # the first long conversation found into its rolling summary. Nothing is queued while
+    # chat jobs are pending or another summary is unfinished, and background sub-tasks are
+    # claimed after all chat work, so compaction only uses otherwise idle workers.
+    # --- Español ---
+    # Encola una subtarea general-ai de fondo que integra los turnos sin resumir más antiguos
+    # de la primera conversación larga encontrada en su resumen acumulado. No se encola nada
+    # mientras haya trabajos de chat pendientes u otro resumen sin terminar, y las subtareas de
+    # fondo se reclaman después de todo el trabajo de chat, así solo usa workers que estarían inactivos.
+    conn = get_db_connection()
+    try:
+        if conn.execute("SELECT 1 FROM sub_tasks WHERE expert_type = 'general-ai' AND status = 'pending' LIMIT 1").fetchone():
+            return
+        if conn.execute("SELECT 1 FROM sub_tasks WHERE background = 1 AND status != 'completed' LIMIT 1").fetchone():
+            return
+        recent_budget = HISTORY_TOKEN_BUDGET - HISTORY_SUMMARY_MAX_TOKENS
+        retry_threshold = int(time.time()) - HISTORY_SUMMARY_RETRY_SECONDS
+        candidates = conn.execute(f'''SELECT h.worker_id, SUM({stored_tokens_sql('h')}) AS tokens
+            FROM chat_history h LEFT JOIN chat_summaries s ON s.worker_id = h.worker_id
+            WHERE h.id > COALESCE(s.covered_until_id, 0) AND (s.pending_sub_task_id IS NULL OR s.requested_at < ?)
+            GROUP BY h.worker_id HAVING tokens > ?''', (retry_threshold, recent_budget)).fetchall()
+        for candidate in candidates:
+            worker_id = candidate['worker_id']
+            summary = conn.execute("SELECT summary, covered_until_id FROM chat_summaries WHERE worker_id = ?", (worker_id,)).fetchone()
+            rows = conn.execute(f"SELECT id, role, content, {stored_tokens_sql()} AS tokens FROM chat_history WHERE worker_id = ? AND id > ? ORDER BY id DESC",
+                                (worker_id, summary['covered_until_id'] if summary else 0)).fetchall()
+            # --- English ---
+            # Keep the newest turns worth half of the recent budget verbatim and summarize the rest,
+            # so that a conversation is not compacted again on every new message.
+            # --- Español ---
+            # Mantener literales los turnos más recientes que sumen la mitad del presupuesto y resumir
+            # el resto, para que una conversación no se compacte de nuevo con cada mensaje.
+            kept_tokens, split = 0, len(rows)
+            for index, row in enumerate(rows):
+                if kept_tokens + row['tokens'] > recent_budget // 2:
+                    split = index
+                    break
+                kept_tokens += row['tokens']
+            if split == len(rows): continue
+            covered_until_id = rows[split]['id']
+            # --- English ---
+            # Very old turns beyond the summarizer's input limit were already out of every prompt; they are covered without being read.
+            # --- Español ---
+            # Los turnos muy antiguos que exceden el límite de entrada ya no estaban en ningún prompt; se cubren sin leerlos.
+            to_summarize, input_tokens = [], 0
+            for row in rows[split:]:
+                input_tokens += min(row['tokens'], HISTORY_SUMMARY_TURN_MAX_CHARS // CHARS_PER_TOKEN)
+                if to_summarize and input_tokens > HISTORY_SUMMARY_INPUT_MAX_TOKENS: break
+                to_summarize.append(row)
+            to_summarize.reverse()
+
+            transcript = "\n".join(f"{row['role']}: {row['content'][:HISTORY_SUMMARY_TURN_MAX_CHARS]}" for row in to_summarize)
+            previous = f"Previous summary: {summary['summary']}\n\n" if summary and summary['summary'] else ""
+            prompt_template = (
+                f"<start_of_turn>user\nSummarize the following conversation between a user and an AI assistant so it can be continued later. "
+                f"Keep names, facts and open questions. Use at most {HISTORY_SUMMARY_MAX_TOKENS * 3 // 4} words. Respond with a single JSON code block with one key, 'summary'.\n\n"
+                f"{previous}Conversation:\n{transcript}\n\nYour JSON response:<end_of_turn>\n"
+                f"<start_of_turn>model\n"
+            )
+            sub_task_id = enqueue_sub_task(conn, None, "general-ai", {"text": prompt_template, "kind": "history-summary", "worker_id": worker_id, "covered_until_id": covered_until_id},
+                                           background=True)
+            conn.execute('''INSERT INTO chat_summaries (worker_id, pending_sub_task_id, requested_at) VALUES (?, ?, ?)
+                ON CONFLICT(worker_id) DO UPDATE SET pending_sub_task_id = excluded.pending_sub_task_id, requested_at = excluded.requested_at''',
+                         (worker_id, sub_task_id, int(time.time())))
+            break
+        conn.commit()
+    finally:
+        conn.close()
+
+def store_chat_summary(conn, sub_task_id, task_data, clean_result):
+    # --- English ---
+    # Saves the result of a history-summary sub-task. On failure the pending marker is
+    # cleared so the conversation is picked up again on the next compaction pass.
+    # --- Español ---
+    # Guarda el resultado de una subtarea de resumen de historial. Si falla, se borra la
+    # marca de pendiente para que la conversación se retome en la siguiente compactación.
+    summary_text = clean_result.get('summary') if isinstance(clean_result, dict) else None
+    if isinstance(summary_text, str) and summary_text.strip():
+        conn.execute('''UPDATE chat_summaries SET summary = ?, covered_until_id = MAX(covered_until_id, ?), token_count = ?, pending_sub_task_id = NULL
+            WHERE worker_id = ? AND pending_sub_task_id = ?''',
+                     (summary_text.strip(), task_data['covered_until_id'], count_tokens(summary_text.strip()), task_data['worker_id'], sub_task_id))
+    else:
+        conn.execute("UPDATE chat_summaries SET pending_sub_task_id = NULL WHERE worker_id = ? AND pending_sub_task_id = ?", (task_data['worker_id'], sub_task_id))
+
+def archive_chat_history():
+    # --- English ---
+    # Moves rows that are already covered by a summary, or older than the retention period,
+    # to the archive database. Works in batches so the write lock is held only briefly.
+    # --- Español ---
+    # Mueve a la base de datos de archivo las filas que ya cubre un resumen o que superan el
+    # periodo de retención. Trabaja por lotes para mantener el bloqueo de escritura poco tiempo.
+    conn = get_db_connection()
+    try:
+        conn.execute("ATTACH DATABASE ? AS archive", (state_backend.archive_path,))
+        conn.execute("CREATE TABLE IF NOT EXISTS archive.chat_history (id INTEGER PRIMARY KEY, worker_id TEXT NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, timestamp INTEGER NOT NULL, token_count INTEGER)")
+        cutoff = int(time.time()) - HISTORY_RETENTION_DAYS * 86400
+        archived = 0
+        while True:
+            ids = [row['id'] for row in conn.execute('''SELECT h.id FROM chat_history h LEFT JOIN chat_summaries s ON s.worker_id = h.worker_id
+                WHERE h.timestamp < ? OR h.id <= COALESCE(s.covered_until_id, 0) LIMIT ?''', (cutoff, HISTORY_ARCHIVE_BATCH_SIZE)).fetchall()]
+            if not ids: break
+            placeholders = ', '.join('?' for _ in ids)
+            conn.execute(f"INSERT OR IGNORE INTO archive.chat_history (id, worker_id, role, content, timestamp, token_count) SELECT id, worker_id, role, content, timestamp, token_count FROM chat_history WHERE id IN ({placeholders})", ids)
+            conn.execute(f"DELETE FROM chat_history WHERE id IN ({placeholders})", ids)
+            conn.commit()
+            archived += len(ids)
+            if len(ids) < HISTORY_ARCHIVE_BATCH_SIZE: break
+        conn.execute('''DELETE FROM chat_summaries WHERE pending_sub_task_id IS NULL AND worker_id NOT IN (SELECT id FROM workers)
+            AND NOT EXISTS (SELECT 1 FROM chat_history h WHERE h.worker_id = chat_summaries.worker_id)''')
+        conn.commit()
+        if archived: print(f"🗄️ Archived {archived} chat history row(s). | Archivadas {archived} fila(s) del historial de chat.")
+    finally:
+        conn.close()
+
+# --- English ---
+# --- Semantic Answer Cache ---
+# Brute-force NumPy index: embeddings are normalized, so one matrix-vector product gives the
+# cosine similarity with every cached prompt. Each orchestrator process keeps its own index.
+# --- Español ---
+# --- Caché Semántica de Respuestas ---
+# Índice NumPy de fuerza bruta: los embeddings están normalizados, así que un producto
+# matriz-vector da la similitud coseno con todos los prompts cacheados. Cada proceso del
+# orquestador mantiene su propio índice.
+class SemanticCache:
+    def __init__(self, max_entries):
+        self.lock = threading.Lock()
+        self.max_entries = max_entries
+        self.vectors = None # Se reserva en la primera inserción, cuando se conoce la dimensión. | Allocated on first insert, once the dimension is known.
+        self.contexts = None
+        self.last_used = None
+        self.answers = []
+        self.generation_seconds = []
+
+    def __len__(self):
+        return len(self.answers)
+
+    def find(self, vector, context):
+        # --- English ---
+        # The most similar prompt among the entries whose prompt and context both pass their threshold.
+        # --- Español ---
+        # El prompt más similar entre las entradas cuyo prompt y contexto superan ambos su umbral.
+        if not self.answers: return None
+        similarities = self.vectors[:len(self.answers)] @ vector
+        matches = (similarities >= SEMANTIC_CACHE_THRESHOLD) & (self.contexts[:len(self.answers)] @ context >= SEMANTIC_CACHE_CONTEXT_THRESHOLD)
+        if not matches.any(): return None
+        return int(np.where(matches, similarities, -np.inf).argmax())
+
+    def lookup(self, vector, context):
+        with self.lock:
+            slot = self.find(vector, context)
+            if slot is None: return None
+            self.last_used[slot] = time.monotonic()
+            return self.answers[slot], self.generation_seconds[slot]
+
+    def add(self, vector, context, answer, generation_seconds):
+        with self.lock:
+            if self.vectors is None:
+                self.vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+                self.contexts = np.zeros((self.max_entries, len(context)), dtype=np.float32)
+                self.last_used = np.zeros(self.max_entries)
+            if self.find(vector, context) is not None: return
+            if len(self.answers) < self.max_entries:
+                slot = len(self.answers)
+                self.answers.append(answer)
+                self.generation_seconds.append(generation_seconds)
+            else:
+                slot = int(self.last_used.argmin())
+                self.answers[slot], self.generation_seconds[slot] = answer, generation_seconds
+                SEMANTIC_CACHE_EVICTIONS.inc()
+            self.vectors[slot] = vector
+            self.contexts[slot] = context
+            self.last_used[slot] = time.monotonic()
+
+semantic_cache = SemanticCache(SEMANTIC_CACHE_MAX_ENTRIES)
+semantic_cache_model = None
+semantic_cache_model_lock = threading.Lock()
+
+def load_semantic_cache_model():
+    global semantic_cache_model
+    if not SEMANTIC_CACHE_ENABLED: return
+    if SentenceTransformer is None:
+        print("Semantic cache disabled: numpy and sentence-transformers are not installed. | Caché semántica desactivada: numpy y sentence-transformers no están instalados.")
+        return
+    semantic_cache_model = SentenceTransformer(SEMANTIC_CACHE_MODEL)
+
+def embed_prompt(text, context):
+    # Devuelve los embeddings del prompt y de su contexto, en una sola llamada. | Returns the embeddings of the prompt and of its context, in one call.
+    with semantic_cache_model_lock:
+        vectors = semantic_cache_model.encode([text, context], normalize_embeddings=True).astype(np.float32)
+    return vectors[0], vectors[1]
+
+def semantic_cache_context(conn, worker_id):
+    # --- English ---
+    # The conversation a new prompt follows, as the semantic cache compares it (see SEMANTIC_CACHE_CONTEXT_TURNS).
+    # --- Español ---
+    # La conversación a la que sigue un prompt nuevo, tal como la compara la caché semántica (ver SEMANTIC_CACHE_CONTEXT_TURNS).
+    rows = conn.execute("SELECT content FROM chat_history WHERE worker_id = ? ORDER BY id DESC LIMIT ?", (worker_id, SEMANTIC_CACHE_CONTEXT_TURNS)).fetchall()
+    if rows: return "\n".join(row['content'] for row in reversed(rows))[-SEMANTIC_CACHE_CONTEXT_CHARS:]
+    summary = conn.execute("SELECT summary FROM chat_summaries WHERE worker_id = ?", (worker_id,)).fetchone()
+    return (summary['summary'] or "")[-SEMANTIC_CACHE_CONTEXT_CHARS:] if summary else ""
+
+def remember_answer(prompt, context, final_result, generation_seconds):
+    # --- English ---
+    # Only successful answers are cached.
+    # --- Español ---
+    # Solo se cachean las respuestas correctas.
+    answer = final_result.get("general-ai")
+    if not isinstance(answer, dict) or "error" in answer or not answer.get("generation"): return
+    semantic_cache.add(*embed_prompt(prompt, context or ""), final_result, generation_seconds)
+
+# --- English ---
+# --- Model Artifacts ---
+# Manifests are computed on first request and kept in memory until a file in the model's
+# folder changes size or modification time.
+# --- Español ---
+# --- Artefactos de Modelos ---
+# Los manifiestos se calculan en la primera petición y se guardan en memoria hasta que un
+# archivo de la carpeta del modelo cambia de tamaño o de fecha de modificación.
+model_manifests = {}
+model_manifests_lock = threading.Lock()
+model_manifest_builds = {}
+
+def model_directory(model_key):
+    root = os.path.realpath(MODEL_MIRROR_DIRECTORY)
+    directory = os.path.realpath(os.path.join(root, model_key))
+    if os.path.dirname(directory) != root or not os.path.isdir(directory): return None
+    return directory
+
+def list_model_files(directory):
+    files = []
+    for folder, subfolders, names in os.walk(directory):
+        subfolders[:] = sorted(name for name in subfolders if not name.startswith("."))
+        for name in sorted(names):
+            if name.startswith("."): continue
+            path = os.path.join(folder, name)
+            stat = os.stat(path)
+            files.append((os.path.relpath(path, directory).replace(os.sep, "/"), stat.st_size, stat.st_mtime_ns))
+    return files
+
+def hash_model_file(path):
+    file_hash, chunks = hashlib.sha256(), []
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(MODEL_CHUNK_SIZE)
+            if not chunk: break
+            file_hash.update(chunk)
+            chunks.append(hashlib.sha256(chunk).hexdigest())
+    return file_hash.hexdigest(), chunks
+
+def build_model_manifest(model_key):
+    directory = model_directory(model_key)
+    if directory is None: return None
+    signature = list_model_files(directory)
+    with model_manifests_lock:
+        cached = model_manifests.get(model_key)
+    if cached and cached[0] == signature: return cached[1]
+    previous = {entry['path']: entry for entry in cached[1]['files']} if cached else {}
+    old_signature = {path: (size, mtime) for path, size, mtime in cached[0]} if cached else {}
+    files = []
+    for path, size, mtime in signature:
+        if old_signature.get(path) == (size, mtime):
+            files.append(previous[path])
+            continue
+        sha256, chunks = hash_model_file(os.path.join(directory, path))
+        files.append({"path": path, "size": size, "sha256": sha256, "chunks": chunks})
+    manifest = {"model": model_key, "chunk_size": MODEL_CHUNK_SIZE, "files": files}
+    with model_manifests_lock:
+        model_manifests[model_key] = (signature, manifest)
+    return manifest
+
+def parse_byte_range(header, size):
+    # --- English ---
+    # Parses a single "bytes=start-end" range (also "start-" and "-suffix"). Returns (start, end) inclusive.
+    # --- Español ---
+    # Interpreta un único rango "bytes=inicio-fin" (también "inicio-" y "-sufijo"). Devuelve (inicio, fin) inclusivo.
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", header or "")
+    if not match or match.group(1) == match.group(2) == "": raise HTTPException(status_code=416, detail="Invalid range.", headers={"Content-Range": f"bytes */{size}"})
+    if match.group(1) == "":
+        start, end = max(size - int(match.group(2)), 0), size - 1
+    else:
+        start = int(match.group(1))
+        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    if start >= size or start > end: raise HTTPException(status_code=416, detail="Range not satisfiable.", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+def stream_file_range(path, start, end, model_key):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(1024 * 1024, remaining))
+            if not chunk: break
+            remaining -= len(chunk)
+            MODEL_BYTES_SERVED.inc(model_key, amount=len(chunk))
+            yield chunk
+
+# --- English ---
+# --- Document Ingestion ---
+# --- Español ---
+# --- Ingesta de Documentos ---
+ingest_pool = None
+ingest_backlog = 0
+
+def start_ingest_pool():
+    global ingest_pool
+    if PyPDF2 is None or docx is None:
+        print("Document ingestion disabled: PyPDF2 or python-docx is not installed. | Ingesta de documentos desactivada: PyPDF2 o python-docx no está instalado.")
+        return
+    ingest_pool = ProcessPoolExecutor(max_workers=INGEST_PROCESSES)
+
+def extract_document(path):
+    # --- English ---
+    # Runs in the ingest pool: returns the text of a PDF or DOCX file and its metadata.
+    # --- Español ---
+    # Se ejecuta en el pool de ingesta: devuelve el texto de un archivo PDF o DOCX y sus metadatos.
+    if path.endswith(".pdf"):
+        with open(path, 'rb') as f:
+            reader = PyPDF2.PdfReader(f)
+            pages = [page.extract_text() or "" for page in reader.pages]
+            try:
+                info = reader.metadata or {}
+            except Exception:
+                info = {}
+        text = "\n".join(pages)
+        metadata = {"format": "pdf", "pages": len(pages), "title": str(info["/Title"]) if info.get("/Title") else None,
+                    "author": str(info["/Author"]) if info.get("/Author") else None}
+    else:
+        document = docx.Document(path)
+        text = "\n".join(paragraph.text for paragraph in document.paragraphs)
+        properties = document.core_properties
+        metadata = {"format": "docx", "paragraphs": len(document.paragraphs), "title": properties.title or None, "author": properties.author or None}
+    metadata["characters"] = len(text)
+    return {"text": text, "metadata": metadata}
+
+def extracted_text_path(digest):
+    return os.path.join(EXTRACTED_TEXT_DIRECTORY, f"{digest}.json.gz")
+
+def load_extracted_text(digest):
+    path = extracted_text_path(digest)
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f: extracted = json.load(f)
+        os.utime(path) # Marca la entrada como usada para la retención. | Marks the entry as used for retention.
+        return extracted
+    except (OSError, ValueError):
+        return None
+
+def store_extracted_text(digest, extracted):
+    os.makedirs(EXTRACTED_TEXT_DIRECTORY, exist_ok=True)
+    path = extracted_text_path(digest)
+    with gzip.open(f"{path}.{os.getpid()}.tmp", "wt", encoding="utf-8") as f: json.dump(extracted, f)
+    os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+def write_upload(path, content):
+    with open(path, 'wb') as f: f.write(content)
+
+def prune_extracted_text():
+    if not os.path.isdir(EXTRACTED_TEXT_DIRECTORY): return
+    cutoff = time.time() - JOB_RETENTION_DAYS * 86400
+    for entry in os.scandir(EXTRACTED_TEXT_DIRECTORY):
+        if entry.stat().st_mtime < cutoff: os.remove(entry.path)
+
+async def ingest_document(upload):
+    # --- English ---
+    # Returns (document, warning) for an uploaded file. `document` is {"text", "metadata"}, from
+    # the cache or from the ingest pool. A file this server cannot read (unsupported type, or
+    # PyPDF2/python-docx not installed) gives (None, warning): the job goes on with the prompt
+    # alone. Raises HTTPException for too large, unreadable or excess uploads, and while a
+    # crashed ingest pool is replaced.
+    # --- Español ---
+    # Devuelve (documento, aviso) de un archivo subido. `documento` es {"text", "metadata"}, desde
+    # la caché o desde el pool de ingesta. Un archivo que este servidor no puede leer (tipo no
+    # soportado, o PyPDF2/python-docx no instalados) da (None, aviso): el trabajo sigue solo con
+    # el prompt. Lanza HTTPException si la subida es demasiado grande, no se puede leer o sobra,
+    # y mientras se reemplaza un pool de ingesta caído.
+    global ingest_backlog
+    extension = os.path.splitext(upload.filename or "")[1].lower()
+    if extension not in DOCUMENT_EXTENSIONS:
+        DOCUMENT_INGESTS.inc("unsupported")
+        return None, (f"Unsupported file type (supported: {', '.join(DOCUMENT_EXTENSIONS)}), only the prompt was processed. | "
+                      f"Tipo de archivo no soportado (soportados: {', '.join(DOCUMENT_EXTENSIONS)}), solo se procesó el prompt.")
+    content = await upload.read(INGEST_MAX_FILE_BYTES + 1)
+    if len(content) > INGEST_MAX_FILE_BYTES:
+        DOCUMENT_INGESTS.inc("too_large")
+        raise HTTPException(status_code=413, detail=f"File too large (max {INGEST_MAX_FILE_BYTES // 1024 ** 2} MB). | Archivo demasiado grande.")
+    digest = hashlib.sha256(content).hexdigest()
+    extracted = await asyncio.to_thread(load_extracted_text, digest)
+    if extracted is not None:
+        DOCUMENT_INGESTS.inc("cache_hit")
+        return extracted, None
+    if ingest_pool is None:
+        DOCUMENT_INGESTS.inc("unavailable")
+        return None, ("Document processing is not available on this server, only the prompt was processed. | "
+                      "El procesamiento de documentos no está disponible en este servidor, solo se procesó el prompt.")
+    if ingest_backlog >= INGEST_MAX_BACKLOG:
+        DOCUMENT_INGESTS.inc("busy")
+        raise HTTPException(status_code=429, detail="The network is busy, please try again shortly. | La red está ocupada, inténtalo de nuevo en breve.",
+                            headers={"Retry-After": str(QUEUE_FULL_RETRY_AFTER_SECONDS)})
+    path = os.path.join(UPLOAD_DIRECTORY, f"{digest}.{os.getpid()}{extension}")
+    pool = ingest_pool
+    ingest_backlog += 1
+    try:
+        await asyncio.to_thread(write_upload, path, content)
+        started = time.perf_counter()
+        extracted = await asyncio.get_running_loop().run_in_executor(pool, extract_document, path)
+        DOCUMENT_EXTRACTION_LATENCY.observe(time.perf_counter() - started, extension[1:])
+    except BrokenProcessPool:
+        # --- English ---
+        # An extraction process died (killed for memory, for example). The pool refuses all later
+        # work, so it is replaced once, by the first request that notices, and this upload can be retried.
+        # --- Español ---
+        # Un proceso de extracción murió (por falta de memoria, por ejemplo). El pool rechaza todo el
+        # trabajo posterior, así que lo reemplaza una vez la primera petición que lo detecta, y esta subida se puede reintentar.
+        DOCUMENT_INGESTS.inc("pool_crashed")
+        if ingest_pool is pool:
+            pool.shutdown(wait=False)
+            start_ingest_pool()
+        raise HTTPException(status_code=503, detail="Document processing was restarted, please try again. | El procesamiento de documentos se reinició, inténtalo de nuevo.",
+                            headers={"Retry-After": str(QUEUE_FULL_RETRY_AFTER_SECONDS)})
+    except Exception as e:
+        DOCUMENT_INGESTS.inc("failed")
+        raise HTTPException(status_code=422, detail=f"Could not read the document: {e} | No se pudo leer el documento: {e}")
+    finally:
+        ingest_backlog -= 1
+        if os.path.exists(path): os.remove(path)
+    await asyncio.to_thread(store_extracted_text, digest, extracted)
+    DOCUMENT_INGESTS.inc("extracted")
+    return extracted, None
+
 # --- English ---
 # --- Background Task for Purging Inactive Workers ---
 # --- Español ---
 # --- Tarea en Segundo Plano para Purgar Workers Inactivos ---
-async def purge_inactive_workers():
-    while True:
-        await asyncio.sleep(60)
-        timeout_threshold = int(time.time()) - HEARTBEAT_TIMEOUT_SECONDS
-        conn = get_db_connection()
+def purge_workers():
+    timeout_threshold = int(time.time()) - HEARTBEAT_TIMEOUT_SECONDS
+    conn = get_db_connection()
+    try:
         inactive_ids_tuples = conn.execute("SELECT id FROM workers WHERE last_heartbeat < ?", (timeout_threshold,)).fetchall()
         if inactive_ids_tuples:
             inactive_ids = [row['id'] for row in inactive_ids_tuples]
             placeholders = ', '.join('?' for _ in inactive_ids)
+            released = release_sub_tasks(conn, inactive_ids)
             conn.execute(f"DELETE FROM workers WHERE id IN ({placeholders})", inactive_ids)
             conn.commit()
+            WORKERS_PURGED.inc(amount=len(inactive_ids))
+            if released: SUB_TASKS_RELEASED.inc(amount=released)
+            STAGE_TIMINGS.forget_workers(inactive_ids)
             print(f"👻 Purged {len(inactive_ids)} inactive worker(s). | Purgados {len(inactive_ids)} worker(s) inactivos.")
+        escalate_stranded_sub_tasks(conn)
+    finally:
         conn.close()
 
+async def purge_inactive_workers():
+    while True:
+        await asyncio.sleep(60)
+        try:
+            if not await asyncio.to_thread(acquire_leadership, "purge-inactive-workers"): continue
+            await asyncio.to_thread(purge_workers)
+        except sqlite3.Error as e:
+            print(f"Worker purge failed: {e} | Falló la purga de workers: {e}")
+
+def expire_completed_jobs():
+    # --- English ---
+    # Archives and deletes completed jobs past their retention period, in small batches so
+    # request handlers are never blocked for long, then releases free pages to the OS.
+    # --- Español ---
+    # Archiva y borra los trabajos completados que superan su periodo de retención, en lotes
+    # pequeños para no bloquear mucho tiempo a los manejadores, y libera páginas al sistema.
+    cutoff = time.time() - JOB_RETENTION_DAYS * 86400
+    os.makedirs(JOB_ARCHIVE_DIRECTORY, exist_ok=True)
+    archive_path = os.path.join(JOB_ARCHIVE_DIRECTORY, f"jobs-{time.strftime('%Y-%m-%d')}.jsonl.gz")
+    conn = get_db_connection()
+    expired = 0
+    try:
+        while True:
+            jobs = conn.execute("SELECT id, worker_id, prompt, created_at, completed_at, final_result FROM jobs WHERE status = 'completed' AND completed_at < ? LIMIT ?",
+                                (cutoff, JOB_RETENTION_BATCH_SIZE)).fetchall()
+            if not jobs: break
+            # --- English ---
+            # gzip files may hold several members, so each batch is simply appended.
+            # --- Español ---
+            # Los archivos gzip pueden contener varios miembros, así que cada lote se añade al final.
+            with gzip.open(archive_path, "at", encoding="utf-8") as archive:
+                for job in jobs:
+                    final_result = unpack_result(job['final_result'])
+                    archive.write(json.dumps({"id": job['id'], "worker_id": job['worker_id'], "prompt": job['prompt'], "created_at": job['created_at'],
+                                              "completed_at": job['completed_at'], "final_result": json.loads(final_result) if final_result else None}, separators=(",", ":")) + "\n")
+            ids = [job['id'] for job in jobs]
+            placeholders = ', '.join('?' for _ in ids)
+            conn.execute(f"DELETE FROM sub_tasks WHERE job_id IN ({placeholders})", ids)
+            conn.execute(f"DELETE FROM jobs WHERE id IN ({placeholders})", ids)
+            conn.commit()
+            expired += len(ids)
+        conn.execute("DELETE FROM sub_tasks WHERE job_id IS NULL AND status = 'completed' AND created_at < ?", (cutoff,))
+        conn.commit()
+        conn.execute(f"PRAGMA incremental_vacuum({INCREMENTAL_VACUUM_PAGES})").fetchall()
+        if expired: print(f"🗄️ Archived {expired} expired job(s) to {archive_path}. | Archivados {expired} trabajo(s) caducados en {archive_path}.")
+    finally:
+        conn.close()
+
+# --- English ---
+# --- Background Task for Job Retention ---
+# --- Español ---
+# --- Tarea en Segundo Plano para la Retención de Trabajos ---
+async def enforce_job_retention():
+    while True:
+        await asyncio.sleep(JOB_RETENTION_INTERVAL_SECONDS)
+        try:
+            if not await asyncio.to_thread(acquire_leadership, "enforce-job-retention"): continue
+            await asyncio.to_thread(expire_completed_jobs)
+            await asyncio.to_thread(prune_extracted_text)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Job retention failed: {e} | Falló la retención de trabajos: {e}")
+
+# --- English ---
+# --- Background Task for Chat History Compaction and Archival ---
+# --- Español ---
+# --- Tarea en Segundo Plano para Compactar y Archivar el Historial de Chat ---
+async def maintain_chat_history():
+    while True:
+        await asyncio.sleep(HISTORY_COMPACTION_INTERVAL_SECONDS)
+        try:
+            if not await asyncio.to_thread(acquire_leadership, "maintain-chat-history"): continue
+            await asyncio.to_thread(compact_chat_history)
+            await asyncio.to_thread(archive_chat_history)
+        except sqlite3.Error as e:
+            print(f"Chat history maintenance failed: {e} | Falló el mantenimiento del historial de chat: {e}")
+
 app = FastAPI(title="Distributed AI Orchestrator | Orquestador de IA Distribuida", version="13.0.0")
 
+class RequestTimingMiddleware:
+    # --- English ---
+    # Plain ASGI middleware (cheaper than BaseHTTPMiddleware) that times every HTTP request.
+    # The route template (e.g. /get-job-status/{job_id}) is used as the label so that IDs
+    # in the URL do not create one time series per job.
+    # --- Español ---
+    # Middleware ASGI simple (más barato que BaseHTTPMiddleware) que mide cada petición HTTP.
+    # Se usa la plantilla de la ruta (ej. /get-job-status/{job_id}) como etiqueta para que los
+    # IDs de la URL no creen una serie temporal por trabajo.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = {"code": 500}
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start": status["code"] = message["status"]
+            await send(message)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            endpoint = getattr(route, "path", "unmatched")
+            HTTP_REQUEST_LATENCY.observe(time.perf_counter() - start, scope["method"], endpoint, str(status["code"]))
+
+app.add_middleware(RequestTimingMiddleware)
+
 @app.on_event("startup")
 async def on_startup():
     init_db()
+    start_ingest_pool()
+    await asyncio.to_thread(load_semantic_cache_model)
     asyncio.create_task(purge_inactive_workers())
+    asyncio.create_task(maintain_chat_history())
+    asyncio.create_task(enforce_job_retention())
 
 # --- English ---
 # --- Pydantic Models for Data Validation ---
@@ -126,8 +1525,11 @@ async def on_startup():
 # --- Modelos Pydantic para Validación de Datos ---
 class WorkerSpecs(BaseModel): gpu: str; cpu_cores: int; memory: str
 class WorkerRegistrationPayload(BaseModel): specs: WorkerSpecs
-class HeartbeatPayload(BaseModel): worker_id: str
-class SubTaskResultPayload(BaseModel): worker_id: str; sub_task_id: str; result: str
+class HeartbeatPayload(BaseModel): worker_id: str; utilization: Optional[float] = None
+class SubTaskResultPayload(BaseModel): worker_id: str; sub_task_id: str; result: str; timings: Optional[Dict[str, float]] = None
+class SubTaskRequestPayload(BaseModel): free_slots: Dict[str, int]
+class JobStatusQuery(BaseModel): job_ids: Optional[List[str]] = None; worker_id: Optional[str] = None; created_after: Optional[float] = None; created_before: Optional[float] = None; since: Optional[str] = None; limit: int = BULK_STATUS_MAX_JOBS; include_results: bool = True
+class WorkerResumePayload(BaseModel): worker_id: str; specs: WorkerSpecs; finished_sub_tasks: List[str] = []
 
 # --- English ---
 # --- API Endpoints for Workers ---
@@ -143,44 +1545,161 @@ def register_worker(payload: WorkerRegistrationPayload):
     conn.close()
     return {"status": "success", "worker_id": worker_id}
 
+@app.post("/resume")
+def resume_worker(payload: WorkerResumePayload):
+    # --- English ---
+    # Warm restart: a worker that kept its session file comes back with the same id. If it
+    # was purged meanwhile, the row is recreated under that id. Sub-tasks still assigned to it
+    # are kept if the worker has their results in its journal (`finished_sub_tasks`) and will
+    # resubmit them; the rest were lost in the restart and go back to the head of their queue.
+    # The stored assignment is returned so the worker can skip asking for a new one.
+    # --- Español ---
+    # Reinicio en caliente: un worker que conservó su archivo de sesión vuelve con el mismo id.
+    # Si fue purgado mientras tanto, la fila se vuelve a crear con ese id. Las subtareas que
+    # sigue teniendo asignadas se mantienen si el worker tiene sus resultados en su diario
+    # (`finished_sub_tasks`) y los reenviará; el resto se perdieron en el reinicio y vuelven a la
+    # cabeza de su cola. Se devuelve la asignación guardada para que el worker no pida una nueva.
+    conn = get_db_connection()
+    now = int(time.time())
+    worker = conn.execute("SELECT assigned_expert, expert_slots FROM workers WHERE id = ?", (payload.worker_id,)).fetchone()
+    if worker:
+        conn.execute("UPDATE workers SET specs = ?, last_heartbeat = ? WHERE id = ?", (json.dumps(payload.specs.dict()), now, payload.worker_id))
+    else:
+        conn.execute("INSERT INTO workers (id, specs, status, reputation, last_heartbeat) VALUES (?, ?, ?, ?, ?)",
+                     (payload.worker_id, json.dumps(payload.specs.dict()), "pending_assignment", 0.0, now))
+    finished = set(payload.finished_sub_tasks)
+    held = [row['id'] for row in conn.execute("SELECT id FROM sub_tasks WHERE assigned_worker_id = ? AND status = 'assigned'", (payload.worker_id,)).fetchall()]
+    released = [sub_task_id for sub_task_id in held if sub_task_id not in finished]
+    if released:
+        placeholders = ', '.join('?' for _ in released)
+        conn.execute(f"UPDATE sub_tasks SET status = 'pending', assigned_worker_id = NULL, assigned_at = NULL WHERE id IN ({placeholders})", released)
+        SUB_TASKS_RELEASED.inc(amount=len(released))
+    conn.commit()
+    conn.close()
+    WORKERS_RESUMED.inc("resumed" if worker else "recreated")
+
+    experts = {}
+    if worker and worker['expert_slots']:
+        experts = {expert: {"model_info": SUPPORTED_EXPERTS[expert], "slots": slots, "slot_cores": EXPERT_RESOURCES[expert]["slot_cores"]}
+                   for expert, slots in json.loads(worker['expert_slots']).items() if expert in SUPPORTED_EXPERTS}
+    elif worker and worker['assigned_expert'] in SUPPORTED_EXPERTS:
+        experts = {worker['assigned_expert']: {"model_info": SUPPORTED_EXPERTS[worker['assigned_expert']], "slots": 1}}
+    return {"status": "resumed" if worker else "recreated", "worker_id": payload.worker_id, "experts": experts,
+            "resubmit": [sub_task_id for sub_task_id in held if sub_task_id in finished], "released": released}
+
 @app.post("/heartbeat")
 def heartbeat(payload: HeartbeatPayload):
     conn = get_db_connection()
-    result = conn.execute("UPDATE workers SET last_heartbeat = ? WHERE id = ?", (int(time.time()), payload.worker_id))
+    result = conn.execute("UPDATE workers SET last_heartbeat = ?, utilization = COALESCE(?, utilization) WHERE id = ?", (int(time.time()), payload.utilization, payload.worker_id))
     conn.commit()
     conn.close()
     if result.rowcount == 0: raise HTTPException(status_code=404, detail="Worker not found or purged. Please restart.")
     return {"status": "acknowledged"}
 
-@app.get("/request-assignment/{worker_id}")
-def request_assignment(worker_id: str):
-    conn = get_db_connection()
-    pending_counts = {expert: conn.execute("SELECT COUNT(*) FROM sub_tasks WHERE expert_type = ? AND status = 'pending'", (expert,)).fetchone()[0] for expert in SUPPORTED_EXPERTS}
+def count_pending_by_expert(conn):
+    return {expert: conn.execute("SELECT COUNT(*) FROM sub_tasks WHERE expert_type = ? AND status = 'pending'", (expert,)).fetchone()[0] for expert in SUPPORTED_EXPERTS}
+
+def choose_single_expert(pending_counts):
     file_experts = ["document-summarization", "image-captioning", "audio-transcription"]
     
     assigned_expert = "general-ai" # Asignar 'general-ai' por defecto
 
     # --- English ---
-    # Check if there are urgent file-processing tasks. If so, re-assign.
+    # Check if there are urgent file-processing tasks. If so, re-assign. quick-ai answers are
+    # waited on by the chat too, so a waiting cascade queue also gets a worker.
     # --- Español ---
-    # Comprobar si hay tareas urgentes de procesamiento de archivos. Si es así, reasignar.
-    for fe in file_experts:
+    # Comprobar si hay tareas urgentes de procesamiento de archivos. Si es así, reasignar. Las
+    # respuestas de quick-ai también las espera el chat, así que una cola de cascada con espera
+    # también recibe un worker.
+    for fe in file_experts + ["quick-ai"]:
         if pending_counts.get(fe, 0) > 0:
             assigned_expert = fe
             break
-    
+    return assigned_expert
+
+def parse_memory_gb(memory):
+    match = re.match(r"\s*([\d.]+)\s*([KMGT]?)B?", str(memory), re.IGNORECASE)
+    if not match: return 0.0
+    return float(match.group(1)) * {"K": 1 / 1024 ** 2, "M": 1 / 1024, "G": 1.0, "T": 1024.0, "": 1.0}[match.group(2).upper()]
+
+def plan_expert_slots(specs, pending_counts):
+    # --- English ---
+    # Returns {expert: slots} for a worker with `specs`, following EXPERT_RESOURCES. Experts
+    # are considered busiest queue first (general-ai first on ties, as in single assignment).
+    # --- Español ---
+    # Devuelve {experto: huecos} para un worker con `specs`, según EXPERT_RESOURCES. Los
+    # expertos se consideran de la cola más cargada a la menos (general-ai primero en empates,
+    # como en la asignación simple).
+    free_memory = parse_memory_gb(specs.get("memory")) - RESERVED_MEMORY_GB
+    free_cores = (specs.get("cpu_cores") or 0) - RESERVED_CORES
+    slots = {}
+    for expert in sorted(EXPERT_RESOURCES, key=lambda e: (-pending_counts.get(e, 0), e != "general-ai")):
+        cost = EXPERT_RESOURCES[expert]
+        if cost["model_memory_gb"] + cost["slot_memory_gb"] <= free_memory and cost["slot_cores"] <= free_cores:
+            free_memory -= cost["model_memory_gb"] + cost["slot_memory_gb"]
+            free_cores -= cost["slot_cores"]
+            slots[expert] = 1
+    while True:
+        growable = [e for e in slots if slots[e] < MAX_SLOTS_PER_EXPERT
+                    and EXPERT_RESOURCES[e]["slot_memory_gb"] <= free_memory and EXPERT_RESOURCES[e]["slot_cores"] <= free_cores]
+        if not growable: return slots
+        expert = max(growable, key=lambda e: (pending_counts.get(e, 0) + 1) / slots[e])
+        free_memory -= EXPERT_RESOURCES[expert]["slot_memory_gb"]
+        free_cores -= EXPERT_RESOURCES[expert]["slot_cores"]
+        slots[expert] += 1
+
+@app.get("/request-assignment/{worker_id}")
+def request_assignment(worker_id: str):
+    conn = get_db_connection()
+    assigned_expert = choose_single_expert(count_pending_by_expert(conn))
     model_info = SUPPORTED_EXPERTS[assigned_expert]
-    conn.execute("UPDATE workers SET assigned_expert = ?, status = 'idle' WHERE id = ?", (assigned_expert, worker_id))
+    conn.execute("UPDATE workers SET assigned_expert = ?, expert_slots = NULL, status = 'idle' WHERE id = ?", (assigned_expert, worker_id))
     conn.commit()
     conn.close()
+    if assigned_expert == "quick-ai": quick_ai_hosts["hosted"] = True
     return {"assigned_expert": assigned_expert, "model_info": model_info}
 
+@app.get("/request-experts/{worker_id}")
+def request_experts(worker_id: str):
+    # --- English ---
+    # Multi-expert assignment: the experts this worker should host and the concurrency
+    # slots for each, sized from its registered specs. A worker too small for any expert
+    # receives the single-expert assignment with one slot.
+    # --- Español ---
+    # Asignación multi-experto: los expertos que este worker debe alojar y los huecos
+    # concurrentes de cada uno, calculados a partir de sus especificaciones registradas. Un
+    # worker demasiado pequeño para cualquier experto recibe la asignación simple con un hueco.
+    conn = get_db_connection()
+    worker = conn.execute("SELECT specs FROM workers WHERE id = ?", (worker_id,)).fetchone()
+    if not worker:
+        conn.close()
+        raise HTTPException(status_code=404, detail="Worker not found or purged. Please restart.")
+    pending_counts = count_pending_by_expert(conn)
+    slots = plan_expert_slots(json.loads(worker['specs'] or "{}"), pending_counts) or {choose_single_expert(pending_counts): 1}
+    conn.execute("UPDATE workers SET assigned_expert = ?, expert_slots = ?, status = 'idle' WHERE id = ?", ("+".join(sorted(slots)), json.dumps(slots), worker_id))
+    conn.commit()
+    conn.close()
+    if "quick-ai" in slots: quick_ai_hosts["hosted"] = True
+    return {"experts": {expert: {"model_info": SUPPORTED_EXPERTS[expert], "slots": count, "slot_cores": EXPERT_RESOURCES[expert]["slot_cores"]} for expert, count in slots.items()}}
+
+@app.post("/get-sub-task/{worker_id}")
+def get_next_sub_task(worker_id: str, payload: SubTaskRequestPayload):
+    conn = get_db_connection()
+    expert_types = [expert for expert, free in payload.free_slots.items() if free > 0 and expert in SUPPORTED_EXPERTS]
+    sub_task = claim_next_sub_task(conn, worker_id, expert_types)
+    if sub_task:
+        conn.execute("UPDATE workers SET status = 'busy' WHERE id = ?", (worker_id,))
+        conn.commit()
+        conn.close()
+        return dict(sub_task)
+    conn.close()
+    return {"message": "No tasks available."}
+
 @app.get("/get-sub-task/{worker_id}/{expert_type}")
 def get_sub_task(worker_id: str, expert_type: str):
     conn = get_db_connection()
-    sub_task = conn.execute("SELECT * FROM sub_tasks WHERE expert_type = ? AND status = 'pending' LIMIT 1", (expert_type,)).fetchone()
+    sub_task = claim_sub_task(conn, worker_id, expert_type)
     if sub_task:
-        conn.execute("UPDATE sub_tasks SET status = 'assigned', assigned_worker_id = ? WHERE id = ?", (worker_id, sub_task['id']))
         conn.execute("UPDATE workers SET status = 'busy' WHERE id = ?", (worker_id,))
         conn.commit()
         conn.close()
@@ -192,90 +1711,270 @@ def get_sub_task(worker_id: str, expert_type: str):
 def submit_sub_task_result(payload: SubTaskResultPayload):
     conn = get_db_connection()
     
+    submitted = json.loads(payload.result)
+    claimed = conn.execute("SELECT s.expert_type, s.assigned_at, s.data, s.fair_tag, s.created_at, j.worker_id AS requester_id FROM sub_tasks s LEFT JOIN jobs j ON j.id = s.job_id WHERE s.id = ?", (payload.sub_task_id,)).fetchone()
+
     # --- English ---
-    # JSON cleaning logic and saving the AI's response to the history
+    # JSON cleaning logic and saving the AI's response to the history. Only the chat experts
+    # answer with JSON inside their generated text; the other experts' outputs (summary_text,
+    # caption, transcription or error) are stored as they are.
     # --- Español ---
-    # Lógica de limpieza de JSON y guardado de la respuesta de la IA en el historial
-    raw_result_str = json.loads(payload.result).get('generated_text', '')
-    clean_result = {"error": "Failed to parse model output.", "raw_output": raw_result_str}
-    try:
-        start_index = raw_result_str.find('{')
-        end_index = raw_result_str.rfind('}') + 1
-        if start_index != -1 and end_index != 0:
-            json_str = raw_result_str[start_index:end_index]
-            clean_result = json.loads(json_str)
-    except (json.JSONDecodeError, IndexError):
-        pass
-    
-    conn.execute("UPDATE sub_tasks SET status = 'completed', result = ? WHERE id = ?", (json.dumps(clean_result), payload.sub_task_id))
-    conn.execute("UPDATE workers SET status = 'idle', reputation = reputation + 1.0 WHERE id = ?", (payload.worker_id,))
+    # Lógica de limpieza de JSON y guardado de la respuesta de la IA en el historial. Solo los
+    # expertos de chat responden con JSON dentro de su texto generado; las salidas de los demás
+    # expertos (summary_text, descripción, transcripción o error) se guardan tal cual.
+    if claimed and claimed['expert_type'] not in CHAT_EXPERTS:
+        clean_result, parsed = submitted, True
+    else:
+        raw_result_str = submitted.get('generated_text', '')
+        clean_result = {"error": "Failed to parse model output.", "raw_output": raw_result_str}
+        parsed = False
+        try:
+            start_index = raw_result_str.find('{')
+            end_index = raw_result_str.rfind('}') + 1
+            if start_index != -1 and end_index != 0:
+                json_str = raw_result_str[start_index:end_index]
+                clean_result = json.loads(json_str)
+                parsed = True
+        except (json.JSONDecodeError, IndexError):
+            pass
 
-    if clean_result and "error" not in clean_result:
+    generation_seconds = 0.0
+    if claimed:
+        if not parsed: RESULT_PARSE_FAILURES.inc(claimed['expert_type'])
+        if claimed['assigned_at']:
+            generation_seconds = time.time() - claimed['assigned_at']
+            SUB_TASK_LATENCY.observe(generation_seconds, claimed['expert_type'])
+        if payload.timings:
+            timings = {stage: seconds for stage, seconds in payload.timings.items() if stage in WORKER_STAGES and seconds >= 0}
+            for stage, seconds in timings.items(): WORKER_STAGE_LATENCY.observe(seconds, claimed['expert_type'], stage)
+            STAGE_TIMINGS.record(payload.worker_id, claimed['expert_type'], timings)
+
+    conn.execute("UPDATE sub_tasks SET status = 'completed', result = ? WHERE id = ?", (pack_result(clean_result), payload.sub_task_id))
+    # --- English ---
+    # A worker stays busy while it still holds other claimed sub-tasks (prefetch or concurrent slots).
+    # --- Español ---
+    # Un worker sigue ocupado mientras tenga otras subtareas reclamadas (prebúsqueda o huecos concurrentes).
+    conn.execute('''UPDATE workers SET reputation = reputation + 1.0,
+        status = CASE WHEN EXISTS (SELECT 1 FROM sub_tasks WHERE assigned_worker_id = workers.id AND status = 'assigned') THEN 'busy' ELSE 'idle' END
+        WHERE id = ?''', (payload.worker_id,))
+
+    task_data = json.loads(claimed['data']) if claimed else {}
+    if task_data.get('kind') == 'history-summary':
+        store_chat_summary(conn, payload.sub_task_id, task_data, clean_result)
+        conn.commit()
+        conn.close()
+        return {"status": "success"}
+
+    # --- English ---
+    # Cascade: a quick-ai answer that is not confident enough never reaches the chat; the job goes to general-ai.
+    # --- Español ---
+    # Cascada: una respuesta de quick-ai sin suficiente confianza nunca llega al chat; el trabajo pasa a general-ai.
+    if claimed and claimed['expert_type'] == "quick-ai" and not accept_cheap_answer(clean_result, parsed, submitted.get('confidence')):
+        escalate_sub_task(conn, payload.sub_task_id, claimed, task_data)
+        conn.commit()
+        conn.close()
+        return {"status": "success"}
+
+    # --- English ---
+    # The answer belongs to the history of the user who submitted the job, not of the worker that computed it.
+    # --- Español ---
+    # La respuesta pertenece al historial del usuario que envió el trabajo, no del worker que la calculó.
+    if clean_result and "error" not in clean_result and claimed and claimed['requester_id']:
         generation_text = clean_result.get('generation', '')
         if generation_text:
-            conn.execute("INSERT INTO chat_history (worker_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
-                         (payload.worker_id, 'model', generation_text, int(time.time())))
-            conn.commit()
+            add_chat_turn(conn, claimed['requester_id'], 'model', generation_text)
     # --- End of History Logic ---
 
+    cache_candidate = None
     sub_task = conn.execute("SELECT job_id FROM sub_tasks WHERE id = ?", (payload.sub_task_id,)).fetchone()
     if sub_task:
         job_id = sub_task['job_id']
         pending_count = conn.execute("SELECT COUNT(*) FROM sub_tasks WHERE job_id = ? AND status != 'completed'", (job_id,)).fetchone()[0]
         if pending_count == 0:
             all_results = conn.execute("SELECT expert_type, result FROM sub_tasks WHERE job_id = ?", (job_id,)).fetchall()
-            final_result = {res['expert_type']: json.loads(res['result']) for res in all_results}
-            conn.execute("UPDATE jobs SET status = 'completed', final_result = ? WHERE id = ?", (json.dumps(final_result, indent=2), job_id))
+            final_result = {CASCADE_RESULT_KEYS.get(res['expert_type'], res['expert_type']): json.loads(unpack_result(res['result'])) for res in all_results}
+            conn.execute("UPDATE jobs SET status = 'completed', final_result = ?, completed_at = ? WHERE id = ?", (pack_result(final_result), time.time(), job_id))
+            job = conn.execute("SELECT prompt, semantic_cacheable, semantic_cache_context FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if semantic_cache_model is not None and job and job['semantic_cacheable']: cache_candidate = (job['prompt'], job['semantic_cache_context'], final_result)
     
     conn.commit()
     conn.close()
+    if cache_candidate: remember_answer(*cache_candidate, generation_seconds)
     return {"status": "success"}
 
 
+@app.get("/model-artifacts/{model_key}/manifest")
+async def get_model_manifest(model_key: str):
+    # --- English ---
+    # `model_key` is the model name with "/" written as "--". 404 means the model is not
+    # mirrored and the worker should use the public hub.
+    # --- Español ---
+    # `model_key` es el nombre del modelo con "/" escrito como "--". 404 significa que el modelo
+    # no está en el espejo y el worker debe usar el hub público.
+    # --- English ---
+    # Single flight: while a manifest is being built (hashing can take minutes for a large model),
+    # further requests for the same model wait for that build instead of hashing it again.
+    # --- Español ---
+    # Una sola ejecución: mientras se construye un manifiesto (el hash puede tardar minutos en un
+    # modelo grande), las demás peticiones del mismo modelo esperan a esa construcción en lugar de repetirla.
+    build = model_manifest_builds.get(model_key)
+    if build is None:
+        build = model_manifest_builds[model_key] = asyncio.ensure_future(asyncio.to_thread(build_model_manifest, model_key))
+        build.add_done_callback(lambda done: model_manifest_builds.pop(model_key) if model_manifest_builds.get(model_key) is done else None)
+    manifest = await asyncio.shield(build)
+    if manifest is None: raise HTTPException(status_code=404, detail="Model not mirrored. | Modelo no disponible en el espejo.")
+    return manifest
+
+@app.get("/model-artifacts/{model_key}/files/{file_path:path}")
+def get_model_file(model_key: str, file_path: str, request: Request):
+    directory = model_directory(model_key)
+    path = os.path.realpath(os.path.join(directory, file_path)) if directory else None
+    if not path or not path.startswith(directory + os.sep) or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="File not found. | Archivo no encontrado.")
+    size = os.path.getsize(path)
+    headers = {"Accept-Ranges": "bytes"}
+    range_header = request.headers.get("range")
+    if range_header is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(stream_file_range(path, 0, size - 1, model_key), media_type="application/octet-stream", headers=headers)
+    start, end = parse_byte_range(range_header, size)
+    headers.update({"Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(end - start + 1)})
+    return StreamingResponse(stream_file_range(path, start, end, model_key), status_code=206, media_type="application/octet-stream", headers=headers)
+
 # --- English ---
 # --- API Endpoints for Web UI ---
 # --- Español ---
 # --- Endpoints de la API para la Interfaz Web ---
-@app.post("/upload-and-submit-job")
-async def upload_and_submit_job(worker_id: str = Form(...), prompt: str = Form(""), file: Optional[UploadFile] = File(None)):
+def admit_job(worker_id):
+    # --- English ---
+    # Returns the submitter's reputation, or raises 403/429 if they may not submit now.
+    # This early check spares the ingestion and embedding work of a refused job; the limits are
+    # enforced again in the transaction that inserts the job (store_job, store_cached_job).
+    # --- Español ---
+    # Devuelve la reputación del solicitante, o lanza 403/429 si ahora no puede enviar.
+    # Esta comprobación temprana ahorra la ingesta y el embedding de un trabajo rechazado; los límites
+    # se vuelven a aplicar en la transacción que inserta el trabajo (store_job, store_cached_job).
     conn = get_db_connection()
-    worker = conn.execute("SELECT reputation FROM workers WHERE id = ?", (worker_id,)).fetchone()
-    if not worker: raise HTTPException(status_code=403, detail="Invalid or purged Worker ID.")
-    if worker['reputation'] < REPUTATION_THRESHOLD_TO_SUBMIT: raise HTTPException(status_code=403, detail=f"Worker reputation ({worker['reputation']:.1f}) is too low.")
+    try:
+        worker = conn.execute("SELECT reputation FROM workers WHERE id = ?", (worker_id,)).fetchone()
+        if not worker: raise HTTPException(status_code=403, detail="Invalid or purged Worker ID.")
+        if worker['reputation'] < REPUTATION_THRESHOLD_TO_SUBMIT: raise HTTPException(status_code=403, detail=f"Worker reputation ({worker['reputation']:.1f}) is too low.")
+        check_admission(conn, worker_id)
+        return worker
+    finally:
+        conn.close()
 
-    job_id = str(uuid.uuid4())
-    
+def read_conversation_history(worker_id):
+    # Devuelve el historial para el prompt y el contexto para la caché semántica. | Returns the history for the prompt and the context for the semantic cache.
+    conn = get_db_connection()
+    try:
+        return build_conversation_history(conn, worker_id), semantic_cache_context(conn, worker_id)
+    finally:
+        conn.close()
+
+def store_cached_job(job_id, worker_id, prompt, final_result):
+    now = time.time()
+    conn = get_db_connection()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        check_admission(conn, worker_id)
+        add_chat_turn(conn, worker_id, 'user', prompt)
+        add_chat_turn(conn, worker_id, 'model', final_result['general-ai']['generation'])
+        conn.execute("INSERT INTO jobs (id, prompt, status, final_result, worker_id, created_at, completed_at) VALUES (?, ?, 'completed', ?, ?, ?, ?)",
+                     (job_id, prompt, pack_result(final_result), worker_id, now, now))
+        conn.commit()
+    finally:
+        conn.close()
+
+def store_job(job_id, worker_id, prompt, worker, conversation_history, document, document_warning, filename, cacheable, cache_context):
+    conn = get_db_connection()
+    try:
+        # --- English ---
+        # The admission check and the inserts share one write transaction, so concurrent
+        # submissions of the same user cannot all pass the check and exceed the limits.
+        # --- Español ---
+        # La comprobación de admisión y las inserciones comparten una transacción de escritura,
+        # así los envíos simultáneos de un mismo usuario no pueden pasar todos y superar los límites.
+        conn.execute("BEGIN IMMEDIATE")
+        check_admission(conn, worker_id)
+        # --- English ---
+        # Chat History Logic
+        # 1. Retrieve the summary and the recent turns that fit in the token budget
+        # 2. Build the prompt with history
+        # 3. Save the new user message to the history
+        # --- Español ---
+        # Lógica del Historial de Chat
+        # 1. Recuperar el resumen y los turnos recientes que caben en el presupuesto de tokens
+        # 2. Construir el prompt con el historial
+        # 3. Guardar el nuevo mensaje del usuario en el historial
+        if prompt.strip(): add_chat_turn(conn, worker_id, 'user', prompt)
+
+        prompt_template = (
+            f"{conversation_history}"
+            f"<start_of_turn>user\nAnalyze the following text and provide two responses in a single JSON code block: 1. 'summary': a concise one-sentence summary. 2. 'generation': a creative continuation or a relevant response to the text.\n\nUser text: \"{prompt}\"\n\nYour JSON response:<end_of_turn>\n"
+            f"<start_of_turn>model\n"
+        )
+        # --- End of History Logic ---
+
+        weight = priority_weight(worker['reputation'])
+        conn.execute("INSERT INTO jobs (id, prompt, status, worker_id, created_at, semantic_cacheable, semantic_cache_context) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     (job_id, prompt, "pending", worker_id, time.time(), int(cacheable), cache_context if cacheable else None))
+        # --- English ---
+        # An uploaded document is summarized from its extracted text; the prompt, if any, goes to general-ai as usual.
+        # --- Español ---
+        # Un documento subido se resume a partir de su texto extraído; el prompt, si lo hay, va a general-ai como siempre.
+        if document:
+            enqueue_sub_task(conn, job_id, "document-summarization", {"text": document['text'], "metadata": document['metadata'], "filename": filename},
+                             requester_id=worker_id, weight=weight)
+        # --- English ---
+        # A document that could not be read is recorded as an already completed summary holding the
+        # warning, so the final result tells the user why it was left out.
+        # --- Español ---
+        # Un documento que no se pudo leer se registra como un resumen ya completado con el aviso,
+        # así el resultado final le dice al usuario por qué se omitió.
+        if document_warning:
+            conn.execute("INSERT INTO sub_tasks (id, job_id, expert_type, data, status, requester_id, created_at, result) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (str(uuid.uuid4()), job_id, "document-summarization", json.dumps({"filename": filename}), "completed", worker_id, time.time(),
+                          pack_result({"warning": document_warning})))
+        if prompt.strip() or not document:
+            expert_type = choose_chat_expert(conn, prompt)
+            if CASCADE_ROUTING_ENABLED: CASCADE_ROUTES.inc("cascade" if expert_type == "quick-ai" else "direct")
+            enqueue_sub_task(conn, job_id, expert_type, {"text": prompt_template}, requester_id=worker_id, weight=weight)
+        conn.commit()
+    finally:
+        conn.close()
+
+@app.post("/upload-and-submit-job")
+async def upload_and_submit_job(worker_id: str = Form(...), prompt: str = Form(""), file: Optional[UploadFile] = File(None)):
     # --- English ---
-    # Chat History Logic
-    # 1. Retrieve recent conversation history
-    # 2. Build the prompt with history
-    # 3. Save the new user message to the history
+    # Async only to await document ingestion and the prompt embedding. All database work runs in
+    # the thread pool, like the plain `def` endpoints, so a wait for the SQLite write lock (up to
+    # SQLITE_BUSY_TIMEOUT_SECONDS) never blocks the event loop of this process.
     # --- Español ---
-    # Lógica del Historial de Chat
-    # 1. Recuperar el historial reciente de la conversación
-    # 2. Construir el prompt con el historial
-    # 3. Guardar el nuevo mensaje del usuario en el historial
-    history = conn.execute("SELECT role, content FROM chat_history WHERE worker_id = ? ORDER BY timestamp DESC LIMIT 5", (worker_id,)).fetchall()
-    history.reverse() # Put messages in chronological order
+    # Es async solo para esperar la ingesta de documentos y el embedding del prompt. Todo el
+    # trabajo con la base de datos va en el pool de hilos, como los endpoints `def` normales, así
+    # una espera por el bloqueo de escritura de SQLite (hasta SQLITE_BUSY_TIMEOUT_SECONDS) nunca
+    # bloquea el bucle de eventos de este proceso.
+    worker = await asyncio.to_thread(admit_job, worker_id)
+    document, document_warning = await ingest_document(file) if file is not None and file.filename else (None, None)
+    job_id = str(uuid.uuid4())
+    conversation_history, cache_context = await asyncio.to_thread(read_conversation_history, worker_id)
 
-    conversation_history = "".join([f"<start_of_turn>{row['role']}\n{row['content']}<end_of_turn>\n" for row in history])
-    
-    conn.execute("INSERT INTO chat_history (worker_id, role, content, timestamp) VALUES (?, ?, ?, ?)", (worker_id, 'user', prompt, int(time.time())))
-    conn.commit()
-    
-    prompt_template = (
-        f"{conversation_history}"
-        f"<start_of_turn>user\nAnalyze the following text and provide two responses in a single JSON code block: 1. 'summary': a concise one-sentence summary. 2. 'generation': a creative continuation or a relevant response to the text.\n\nUser text: \"{prompt}\"\n\nYour JSON response:<end_of_turn>\n"
-        f"<start_of_turn>model\n"
-    )
-    # --- End of History Logic ---
+    # --- English ---
+    # Semantic cache: a paraphrase of an already answered prompt is completed at once.
+    # --- Español ---
+    # Caché semántica: una paráfrasis de un prompt ya respondido se completa al momento.
+    cacheable = semantic_cache_model is not None and file is None and bool(prompt.strip())
+    if cacheable:
+        cached = semantic_cache.lookup(*await asyncio.to_thread(embed_prompt, prompt, cache_context))
+        SEMANTIC_CACHE_LOOKUPS.inc("hit" if cached else "miss")
+        if cached:
+            final_result, generation_seconds = cached
+            SEMANTIC_CACHE_SAVED_SECONDS.inc(amount=generation_seconds)
+            await asyncio.to_thread(store_cached_job, job_id, worker_id, prompt, final_result)
+            return {"status": "success", "job_id": job_id}
 
-    conn.execute("INSERT INTO jobs (id, prompt, status) VALUES (?, ?, ?)", (job_id, prompt, "pending"))
-    conn.execute("INSERT INTO sub_tasks (id, job_id, expert_type, data, status) VALUES (?, ?, ?, ?, ?)",
-                 (str(uuid.uuid4()), job_id, "general-ai", json.dumps({"text": prompt_template}), "pending"))
-    
-    conn.commit()
-    conn.close()
+    await asyncio.to_thread(store_job, job_id, worker_id, prompt, worker, conversation_history, document, document_warning, file.filename if document or document_warning else None, cacheable, cache_context)
     return {"status": "success", "job_id": job_id}
 
 @app.get("/get-job-status/{job_id}")
@@ -284,7 +1983,110 @@ def get_job_status(job_id: str):
     job = conn.execute("SELECT status, final_result FROM jobs WHERE id = ?", (job_id,)).fetchone()
     conn.close()
     if not job: raise HTTPException(status_code=404, detail="Job not found. | Trabajo no encontrado.")
-    return dict(job)
+    return {"status": job['status'], "final_result": unpack_result(job['final_result'])}
+
+def parse_status_cursor(cursor):
+    # "<update time>:<job id>", as returned by /job-statuses. | "<hora de actualización>:<id del trabajo>", como lo devuelve /job-statuses.
+    try:
+        updated_at, job_id = cursor.split(":", 1)
+        return float(updated_at), job_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor. | Cursor no válido.")
+
+@app.post("/job-statuses")
+def get_job_statuses(query: JobStatusQuery, request: Request):
+    # --- English ---
+    # Jobs come back ordered by update time. Results are spliced into the response as stored,
+    # without decoding and re-encoding them. `more` is true when `limit` cut the list short;
+    # the next page is requested with the returned cursor.
+    # --- Español ---
+    # Los trabajos se devuelven ordenados por hora de actualización. Los resultados se insertan
+    # en la respuesta tal como están guardados, sin decodificarlos y volver a codificarlos. `more`
+    # es true cuando `limit` recortó la lista; la página siguiente se pide con el cursor devuelto.
+    if bool(query.job_ids) == bool(query.worker_id):
+        raise HTTPException(status_code=400, detail="Give either job_ids or worker_id. | Indica job_ids o worker_id.")
+    if query.job_ids and len(query.job_ids) > BULK_STATUS_MAX_JOBS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_STATUS_MAX_JOBS} job ids per request. | Como máximo {BULK_STATUS_MAX_JOBS} ids por petición.")
+    limit = max(1, min(query.limit, BULK_STATUS_MAX_JOBS))
+    conditions, params = [], []
+    if query.job_ids:
+        conditions.append(f"id IN ({', '.join('?' for _ in query.job_ids)})")
+        params.extend(query.job_ids)
+    else:
+        conditions.append("worker_id = ?")
+        params.append(query.worker_id)
+        if query.created_after is not None:
+            conditions.append("created_at >= ?")
+            params.append(query.created_after)
+        if query.created_before is not None:
+            conditions.append("created_at < ?")
+            params.append(query.created_before)
+    if query.since:
+        # La primera condición permite a SQLite saltar en el índice hasta el cursor. | The first condition lets SQLite seek the index to the cursor.
+        updated_at, job_id = parse_status_cursor(query.since)
+        conditions.append(f"{JOB_UPDATED_AT_SQL} >= ? AND ({JOB_UPDATED_AT_SQL}, id) > (?, ?)")
+        params.extend((updated_at, updated_at, job_id))
+    columns = f"id, status, created_at, completed_at, {JOB_UPDATED_AT_SQL} AS updated_at" + (", final_result" if query.include_results else "")
+    conn = get_db_connection()
+    rows = conn.execute(f"SELECT {columns} FROM jobs WHERE {' AND '.join(conditions)} ORDER BY {JOB_UPDATED_AT_SQL}, id LIMIT ?", (*params, limit + 1)).fetchall()
+    conn.close()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    cursor = f"{rows[-1]['updated_at']!r}:{rows[-1]['id']}" if rows else query.since
+
+    # --- English ---
+    # Completed results never change, so the ids, statuses and update times identify the body.
+    # --- Español ---
+    # Los resultados completados nunca cambian, así que los ids, estados y horas de actualización identifican el cuerpo.
+    fingerprint = hashlib.sha1(f"{query.include_results}|{cursor}|{more}".encode())
+    for row in rows: fingerprint.update(f"|{row['id']}:{row['status']}:{row['updated_at']!r}".encode())
+    etag = f'W/"{fingerprint.hexdigest()}"'
+    if request.headers.get("if-none-match") == etag: return Response(status_code=304, headers={"ETag": etag})
+
+    entries = []
+    for row in rows:
+        entry = json.dumps({"id": row['id'], "status": row['status'], "created_at": row['created_at'], "completed_at": row['completed_at']}, separators=(",", ":"))
+        if query.include_results: entry = f'{entry[:-1]},"final_result":{unpack_result(row["final_result"]) or "null"}}}'
+        entries.append(entry)
+    body = f'{{"jobs":[{",".join(entries)}],"cursor":{json.dumps(cursor)},"more":{json.dumps(more)}}}'
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    # --- English ---
+    # Exposes orchestrator internals in the Prometheus text exposition format.
+    # Queue depth and worker counts are read from the database at scrape time.
+    # --- Español ---
+    # Expone los datos internos del orquestador en el formato de texto de Prometheus.
+    # La profundidad de cola y los conteos de workers se leen de la base de datos al consultar.
+    conn = get_db_connection()
+    queue_depth = {row['expert_type']: row['n'] for row in conn.execute("SELECT expert_type, COUNT(*) AS n FROM sub_tasks WHERE status = 'pending' GROUP BY expert_type").fetchall()}
+    active_threshold = int(time.time()) - HEARTBEAT_TIMEOUT_SECONDS
+    worker_rows = conn.execute("SELECT COALESCE(assigned_expert, 'unassigned') AS expert, COUNT(*) AS active, SUM(status = 'busy') AS busy, AVG(utilization) AS utilization FROM workers WHERE last_heartbeat >= ? GROUP BY expert", (active_threshold,)).fetchall()
+    conn.close()
+
+    lines = ["# HELP helios_queue_depth Pending sub-tasks per expert type.", "# TYPE helios_queue_depth gauge"]
+    for expert in SUPPORTED_EXPERTS:
+        lines.append(f"helios_queue_depth{format_labels(('expert_type',), (expert,))} {queue_depth.get(expert, 0)}")
+    lines += ["# HELP helios_workers_active Workers with a recent heartbeat by assigned expert.", "# TYPE helios_workers_active gauge"]
+    lines += [f"helios_workers_active{format_labels(('assigned_expert',), (row['expert'],))} {row['active']}" for row in worker_rows]
+    lines += ["# HELP helios_workers_busy Workers currently processing a sub-task by assigned expert.", "# TYPE helios_workers_busy gauge"]
+    lines += [f"helios_workers_busy{format_labels(('assigned_expert',), (row['expert'],))} {row['busy'] or 0}" for row in worker_rows]
+    lines += ["# HELP helios_worker_utilization Mean fraction of time workers spend in inference, as reported with heartbeats.", "# TYPE helios_worker_utilization gauge"]
+    lines += [f"helios_worker_utilization{format_labels(('assigned_expert',), (row['expert'],))} {row['utilization']}" for row in worker_rows if row['utilization'] is not None]
+    if semantic_cache_model is not None:
+        lines += ["# HELP helios_semantic_cache_entries Answers held in this process's semantic cache.", "# TYPE helios_semantic_cache_entries gauge", f"helios_semantic_cache_entries {len(semantic_cache)}"]
+    for metric in METRICS:
+        lines += metric.render()
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+@app.get("/stage-timings")
+def get_stage_timings():
+    # --- English ---
+    # Where sub-task time goes, per expert type and per worker, from the timings workers report.
+    # --- Español ---
+    # En qué se va el tiempo de las subtareas, por tipo de experto y por worker, según los tiempos informados.
+    return STAGE_TIMINGS.snapshot()
 
 @app.get("/", response_class=HTMLResponse)
 def get_chat_ui():
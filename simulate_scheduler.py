@@ -0,0 +1,822 @@
+# --- English ---
+# # SCHEDULER SIMULATION #
+#
+# Simulation of the whole network against the orchestrator's scheduling policy: expert
+# assignment (`choose_single_expert`, or `plan_expert_slots` with --multi-expert), the fair
+# queue of `enqueue_sub_task` / `claim_sub_task`, and the requeue of a purged worker's
+# sub-tasks, with a simulated clock. Workers have individual speeds, model load times and
+# session lengths (churn); they poll like the real worker (immediately after a result, every
+# POLL_INTERVAL when there is no work) and silently disappear when their session ends, as a
+# closed worker does. Arrivals are synthetic (Poisson) or replayed from a trace.
+#
+# Two engines:
+#  - Default: time advances in ticks of --tick seconds, and each tick moves all workers and
+#    sub-tasks at once with numpy arrays. Each expert queue is kept sorted by the fair tag
+#    `enqueue_sub_task` would give and served from its head as `claim_sub_task` does. Waits
+#    are measured to within one tick. 10k workers over a simulated hour take about ten seconds.
+#  - --exact: discrete events, with every sub-task going through the real SQL functions
+#    (`enqueue_sub_task`, `claim_sub_task` / `claim_next_sub_task`, `release_sub_tasks`) on an
+#    in-memory database. It is about a hundred times slower; use it on small networks to
+#    check the default engine.
+#
+# Every --sample-interval it records queue depth, queue wait (p50/p95/max), slot
+# utilization, and live, loading and "ghost" workers (gone, but still counted as active
+# until HEARTBEAT_TIMEOUT_SECONDS and the purge loop remove them). The curves are saved
+# as CSV in `simulation_results/` and a summary is printed.
+#
+# HOW TO RUN:
+#    python simulate_scheduler.py --workers 10000 --hours 2 --load 0.85
+#    python simulate_scheduler.py --workers 2000 --multi-expert --mean-session-hours 1
+#    python simulate_scheduler.py --workers 300 --hours 0.5 --exact
+#    python simulate_scheduler.py --export-trace orchestrator_chat_prod.db trace.csv
+#    python simulate_scheduler.py --trace trace.csv --workers 500
+
+# --- Español ---
+# # SIMULACIÓN DEL PLANIFICADOR #
+#
+# Simulación de toda la red contra la política de planificación del orquestador: asignación
+# de expertos (`choose_single_expert`, o `plan_expert_slots` con --multi-expert), la cola
+# justa de `enqueue_sub_task` / `claim_sub_task`, y la devolución a la cola de las subtareas
+# de un worker purgado, con un reloj simulado. Los workers tienen velocidades, tiempos de
+# carga del modelo y duraciones de sesión propios (rotación); sondean como el worker real
+# (inmediatamente después de un resultado, cada POLL_INTERVAL si no hay trabajo) y
+# desaparecen sin avisar al terminar su sesión, como hace un worker cerrado. Las llegadas son
+# sintéticas (Poisson) o se reproducen desde una traza.
+#
+# Dos motores:
+#  - Por defecto: el tiempo avanza en tics de --tick segundos, y cada tic mueve a la vez todos
+#    los workers y subtareas con arrays de numpy. Cada cola de experto se mantiene ordenada
+#    por la etiqueta justa que daría `enqueue_sub_task` y se atiende desde la cabeza como hace
+#    `claim_sub_task`. Las esperas se miden con la precisión de un tic. 10k workers durante
+#    una hora simulada tardan unos diez segundos.
+#  - --exact: eventos discretos, con cada subtarea pasando por las funciones SQL reales
+#    (`enqueue_sub_task`, `claim_sub_task` / `claim_next_sub_task`, `release_sub_tasks`) sobre
+#    una base de datos en memoria. Es unas cien veces más lento; úsalo en redes pequeñas para
+#    comprobar el motor por defecto.
+#
+# Cada --sample-interval registra la profundidad de la cola, la espera en cola
+# (p50/p95/máx), la utilización de los huecos, y los workers vivos, cargando y "fantasma" (ya
+# no están, pero siguen contando como activos hasta que HEARTBEAT_TIMEOUT_SECONDS y el bucle
+# de purga los eliminan). Las curvas se guardan como CSV en `simulation_results/` y se
+# muestra un resumen.
+#
+# CÓMO EJECUTAR:
+#    python simulate_scheduler.py --workers 10000 --hours 2 --load 0.85
+#    python simulate_scheduler.py --workers 2000 --multi-expert --mean-session-hours 1
+#    python simulate_scheduler.py --workers 300 --hours 0.5 --exact
+#    python simulate_scheduler.py --export-trace orchestrator_chat_prod.db traza.csv
+#    python simulate_scheduler.py --trace traza.csv --workers 500
+
+# -*- coding: utf-8 -*-
+import argparse
+import bisect
+import csv
+import heapq
+import math
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from collections import defaultdict
+
+import numpy as np
+
+os.environ["HELIOS_STATE_BACKEND"] = "memory://scheduler-simulation"
+import orchestrator
+
+REPO_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIRECTORY = os.path.join(REPO_DIRECTORY, "simulation_results")
+
+# --- English ---
+# Reference worker: mean inference seconds per sub-task and model load seconds per expert.
+# Each simulated worker scales both by its own speed factor.
+# --- Español ---
+# Worker de referencia: segundos medios de inferencia por subtarea y segundos de carga del
+# modelo por experto. Cada worker simulado los escala por su propio factor de velocidad.
+SERVICE_SECONDS = {"general-ai": 8.0, "document-summarization": 4.0, "image-captioning": 3.0, "audio-transcription": 12.0, "quick-ai": 1.5}
+MODEL_LOAD_SECONDS = {"general-ai": 90.0, "document-summarization": 10.0, "image-captioning": 30.0, "audio-transcription": 8.0, "quick-ai": 10.0}
+TRAFFIC_MIX = {"general-ai": 0.85, "document-summarization": 0.05, "image-captioning": 0.05, "audio-transcription": 0.05}
+WORKER_SPECS_MIX = [({"gpu": "N/A", "cpu_cores": 4, "memory": "8GB"}, 0.3), ({"gpu": "N/A", "cpu_cores": 8, "memory": "16GB"}, 0.5),
+                    ({"gpu": "N/A", "cpu_cores": 32, "memory": "64GB"}, 0.2)]
+POLL_INTERVAL = 5 # Como en el worker. | As in the worker.
+HEARTBEAT_INTERVAL = 30
+PURGE_INTERVAL_SECONDS = 60 # Periodo de `purge_inactive_workers`. | Period of `purge_inactive_workers`.
+EXPERTS = list(orchestrator.SUPPORTED_EXPERTS) # Códigos de experto de los arrays. | Expert codes of the arrays.
+
+def percentile(values, fraction):
+    if isinstance(values, np.ndarray):
+        if not len(values): return 0.0
+        index = min(len(values) - 1, int(fraction * len(values)))
+        return float(np.partition(values, index)[index])
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+def draw_worker(args, rng, pending_counts):
+    # --- English ---
+    # Experts, speed factor, model load seconds and session seconds (None without churn) of a
+    # joining worker. Experts are chosen by the orchestrator's own assignment code.
+    # --- Español ---
+    # Expertos, factor de velocidad, segundos de carga del modelo y segundos de sesión (None sin
+    # rotación) de un worker que llega. Los expertos los elige el propio código de asignación del orquestador.
+    if args.multi_expert:
+        specs = rng.choices([s for s, _ in WORKER_SPECS_MIX], weights=[w for _, w in WORKER_SPECS_MIX])[0]
+        slots = orchestrator.plan_expert_slots(specs, pending_counts) or {orchestrator.choose_single_expert(pending_counts): 1}
+    else:
+        slots = {orchestrator.choose_single_expert(pending_counts): 1}
+    speed = rng.lognormvariate(0.0, args.speed_spread)
+    load_seconds = sum(MODEL_LOAD_SECONDS[expert] for expert in slots) * speed * rng.uniform(0.5, 1.5)
+    session_seconds = rng.expovariate(1.0 / (args.mean_session_hours * 3600)) if args.mean_session_hours > 0 else None
+    return slots, speed, load_seconds, session_seconds
+
+def purge_time(args, rng, now):
+    # --- English ---
+    # When the purge loop removes a worker that vanished at `now`: its last heartbeat plus the
+    # timeout, rounded up to the next purge pass.
+    # --- Español ---
+    # Cuándo elimina el bucle de purga a un worker que desapareció en `now`: su último heartbeat
+    # más el tiempo límite, redondeado a la siguiente pasada de purga.
+    expires = now - rng.uniform(0, HEARTBEAT_INTERVAL) + orchestrator.HEARTBEAT_TIMEOUT_SECONDS
+    return expires + (-expires % PURGE_INTERVAL_SECONDS)
+
+class SimulatedWorker:
+    def __init__(self, worker_id, speed, slots):
+        self.id = worker_id
+        self.speed = speed
+        self.slots = slots
+        self.free = {}
+        self.held = {} # id de subtarea -> (experto, encolada en). | sub-task id -> (expert, enqueued at).
+        self.alive = True
+        self.ready = False
+        self.sleep_phase = None # Fase del tic de sondeo mientras duerme. | Poll tick phase while sleeping.
+        self.token = 0 # Invalida entradas de `sleepers` antiguas. | Invalidates old `sleepers` entries.
+        self.first_slot = None # Primer hueco en los arrays de VectorizedSimulation. | First slot in VectorizedSimulation's arrays.
+
+class FairQueue:
+    # --- English ---
+    # Pending sub-tasks of one expert in fair tag order, as (tag, arrival time) arrays. Only a
+    # sorted head of the smallest tags is kept in order; larger tags wait unsorted in the tail
+    # until the head runs out, so a deep queue costs nothing per arrival.
+    # --- Español ---
+    # Subtareas pendientes de un experto en orden de etiqueta justa, como arrays de (etiqueta,
+    # hora de llegada). Solo se mantiene ordenada una cabeza con las etiquetas menores; las
+    # mayores esperan sin ordenar en la cola hasta que la cabeza se agota, así una cola profunda
+    # no cuesta nada por llegada.
+    HEAD_SIZE = 4096
+
+    def __init__(self):
+        self.head_tags, self.head_arrivals = np.empty(0), np.empty(0)
+        self.tail = []
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def insert(self, tags, arrivals):
+        order = np.lexsort((arrivals, tags))
+        tags, arrivals = tags[order], arrivals[order]
+        self.size += len(tags)
+        if not len(self.head_tags):
+            if self.tail: self.tail.append((tags, arrivals))
+            else: self.head_tags, self.head_arrivals = tags, arrivals
+            return
+        split = int(np.searchsorted(tags, self.head_tags[-1], side="left"))
+        if split:
+            positions = np.searchsorted(self.head_tags, tags[:split], side="right")
+            self.head_tags = np.insert(self.head_tags, positions, tags[:split])
+            self.head_arrivals = np.insert(self.head_arrivals, positions, arrivals[:split])
+        if split < len(tags): self.tail.append((tags[split:], arrivals[split:]))
+
+    def pop(self, count):
+        if len(self.head_tags) < count and self.tail: self.refill(count)
+        tags, arrivals = self.head_tags[:count], self.head_arrivals[:count]
+        self.head_tags, self.head_arrivals = self.head_tags[count:], self.head_arrivals[count:]
+        self.size -= len(tags)
+        return tags, arrivals
+
+    def refill(self, count):
+        tags = np.concatenate([self.head_tags] + [part for part, _ in self.tail])
+        arrivals = np.concatenate([self.head_arrivals] + [part for _, part in self.tail])
+        keep = max(count, self.HEAD_SIZE)
+        head, self.tail = np.arange(len(tags)), []
+        if len(tags) > keep:
+            partition = np.argpartition(tags, keep - 1)
+            head = partition[:keep]
+            self.tail = [(tags[partition[keep:]], arrivals[partition[keep:]])]
+        head = head[np.lexsort((arrivals[head], tags[head]))]
+        self.head_tags, self.head_arrivals = tags[head], arrivals[head]
+
+class VectorizedSimulation:
+    # --- English ---
+    # Each slot is one row of the slot arrays: its expert, its worker, the tick at which its
+    # running sub-task completes (-1 when free) and its poll phase while idle (-1 when not).
+    # Events scheduled within a tick happen at its end. A worker with idle slots sleeps as a
+    # whole, as in ExactSimulation: a slot freed meanwhile waits for the worker's poll tick.
+    # As each slot serves only its expert's queue, the slots of a multi-expert worker hand out
+    # the same sub-tasks as the combined fetch.
+    # --- Español ---
+    # Cada hueco es una fila de los arrays de huecos: su experto, su worker, el tic en que
+    # termina su subtarea en curso (-1 si está libre) y su fase de sondeo mientras está ocioso
+    # (-1 si no). Los eventos de un tic ocurren al final del mismo. Un worker con huecos ociosos
+    # duerme entero, como en ExactSimulation: un hueco liberado mientras tanto espera al tic de
+    # sondeo del worker. Como cada hueco solo atiende la cola de su experto, los huecos de un
+    # worker multi-experto reparten las mismas subtareas que la obtención combinada.
+    def __init__(self, args, arrival_blocks, requesters):
+        self.args = args
+        self.rng = np.random.default_rng(args.seed)
+        self.worker_rng = random.Random(args.seed)
+        self.arrival_blocks = arrival_blocks
+        self.block, self.block_start = None, 0
+        self.step = args.tick
+        self.phases = max(1, round(POLL_INTERVAL / args.tick))
+        self.tag_step = 1.0 / max(orchestrator.priority_weight(0.0), 0.01)
+        self.service = np.array([SERVICE_SECONDS[expert] for expert in EXPERTS])
+        self.queues = [FairQueue() for _ in EXPERTS]
+        self.virtual_time = [0.0] * len(EXPERTS)
+        self.requesters = max(requesters, 1)
+        self.last_tags = np.zeros(len(EXPERTS) * self.requesters) # Por (experto, solicitante). | Per (expert, requester).
+        self.slot_expert = np.zeros(0, np.int64)
+        self.slot_worker = np.zeros(0, np.int64)
+        self.slot_speed = np.zeros(0)
+        self.slot_done = np.zeros(0, np.int64)
+        self.slot_idle = np.zeros(0, np.int64)
+        self.slot_tag = np.zeros(0)
+        self.slot_arrival = np.zeros(0)
+        self.slot_count = 0
+        self.worker_idle = np.zeros(0, np.int64) # Huecos ociosos de cada worker. | Idle slots of each worker.
+        self.worker_phase = np.zeros(0, np.int64) # Fase de sondeo mientras duerme. | Poll phase while sleeping.
+        self.readies, self.leaves, self.purges = defaultdict(list), defaultdict(list), defaultdict(list)
+        self.ghosts = []
+        self.tick_index, self.now = -1, 0.0
+        self.next_worker = self.live = 0
+        self.busy_slots = self.ready_slots = self.loading = 0
+        self.window_busy = self.window_capacity = 0.0
+        self.window_waits, self.wait_blocks = [], []
+        self.all_waits = np.empty(0)
+        self.orphaned = self.completed = self.enqueued = 0
+        self.samples = []
+
+    def tick_of(self, at):
+        return max(self.tick_index + 1, math.ceil(at / self.step) - 1)
+
+    def reserve(self, columns, needed):
+        size = max(needed, 2 * len(getattr(self, columns[0][0])), 1024)
+        for name, fill in columns:
+            old = getattr(self, name)
+            grown = np.full(size, fill, old.dtype)
+            grown[:len(old)] = old
+            setattr(self, name, grown)
+
+    # --- English ---
+    # --- Workers ---
+    # --- Español ---
+    # --- Workers ---
+    def join(self):
+        pending_counts = {expert: len(self.queues[code]) for code, expert in enumerate(EXPERTS)}
+        slots, speed, load_seconds, session_seconds = draw_worker(self.args, self.worker_rng, pending_counts)
+        worker = SimulatedWorker(self.next_worker, speed, slots)
+        self.next_worker += 1
+        if self.next_worker > len(self.worker_idle):
+            self.reserve((("worker_idle", 0), ("worker_phase", -1)), self.next_worker)
+        count = sum(slots.values())
+        if self.slot_count + count > len(self.slot_done):
+            self.reserve((("slot_expert", 0), ("slot_worker", 0), ("slot_speed", 0.0), ("slot_done", -1), ("slot_idle", -1), ("slot_tag", 0.0), ("slot_arrival", 0.0)), self.slot_count + count)
+        worker.first_slot = first = self.slot_count
+        self.slot_count += count
+        self.slot_expert[first:self.slot_count] = [EXPERTS.index(expert) for expert, n in slots.items() for _ in range(n)]
+        self.slot_worker[first:self.slot_count] = worker.id
+        self.slot_speed[first:self.slot_count] = speed
+        self.live += 1
+        self.loading += 1
+        self.readies[self.tick_of(self.now + load_seconds)].append(worker)
+        if session_seconds is not None: self.leaves[self.tick_of(self.now + session_seconds)].append(worker)
+
+    def worker_slots(self, worker):
+        return np.arange(worker.first_slot, worker.first_slot + sum(worker.slots.values()))
+
+    def ready(self, worker):
+        if not worker.alive: return np.empty(0, np.int64)
+        self.loading -= 1
+        worker.ready = True
+        slots = self.worker_slots(worker)
+        self.ready_slots += len(slots)
+        return slots
+
+    def leave(self, worker):
+        # --- English ---
+        # The worker process ends without telling the orchestrator. Its running sub-tasks stay
+        # assigned until its heartbeat times out and the purge loop hands them back to their
+        # queues with their fair tags; meanwhile the worker still counts as active.
+        # --- Español ---
+        # El proceso del worker termina sin avisar al orquestador. Sus subtareas en curso siguen
+        # asignadas hasta que su heartbeat caduca y el bucle de purga las devuelve a sus colas con
+        # sus etiquetas justas; mientras tanto el worker sigue contando como activo.
+        worker.alive = False
+        slots = self.worker_slots(worker)
+        running = slots[self.slot_done[slots] >= 0]
+        self.slot_done[slots] = -1
+        self.slot_idle[slots] = -1
+        self.worker_idle[worker.id] = 0
+        if worker.ready:
+            self.ready_slots -= len(slots)
+            self.busy_slots -= len(running)
+        else:
+            self.loading -= 1
+        self.live -= 1
+        self.orphaned += len(running)
+        purge_at = purge_time(self.args, self.worker_rng, self.now)
+        heapq.heappush(self.ghosts, purge_at)
+        if len(running):
+            self.purges[self.tick_of(purge_at)].append((self.slot_expert[running], self.slot_tag[running], self.slot_arrival[running]))
+
+    # --- English ---
+    # --- Queues ---
+    # --- Español ---
+    # --- Colas ---
+    def enqueue(self, arrivals, experts, requesters):
+        # --- English ---
+        # Fair tags as `enqueue_sub_task` gives them: max(virtual time, the requester's last tag)
+        # + 1 / weight. The k-th sub-task of a requester within the tick is k steps after its
+        # last tag. Keeping each requester's last tag ever is the same as the SQL's last pending
+        # one: once that sub-task is claimed, the virtual time has reached it.
+        # --- Español ---
+        # Etiquetas justas como las da `enqueue_sub_task`: max(tiempo virtual, última etiqueta del
+        # solicitante) + 1 / peso. La k-ésima subtarea de un solicitante en el tic queda k pasos
+        # después de su última etiqueta. Guardar la última etiqueta de cada solicitante equivale a
+        # la última pendiente del SQL: cuando esa subtarea se reclama, el tiempo virtual ya la alcanzó.
+        virtual_times = np.array(self.virtual_time)[experts]
+        tags = virtual_times + self.tag_step
+        known = np.flatnonzero(requesters >= 0)
+        if len(known):
+            keys = experts[known] * self.requesters + requesters[known]
+            order = np.argsort(keys, kind="stable")
+            keys, known = keys[order], known[order]
+            position = np.arange(len(keys))
+            first = np.ones(len(keys), bool)
+            first[1:] = keys[1:] != keys[:-1]
+            rank = position - np.maximum.accumulate(np.where(first, position, 0)) + 1
+            key_tags = np.maximum(virtual_times[known], self.last_tags[keys]) + rank * self.tag_step
+            last = np.ones(len(keys), bool)
+            last[:-1] = first[1:]
+            self.last_tags[keys[last]] = key_tags[last]
+            tags[known] = key_tags
+        for code in np.unique(experts):
+            mask = experts == code
+            self.queues[code].insert(tags[mask], arrivals[mask])
+        self.enqueued += len(arrivals)
+
+    def claim(self, code, slots):
+        # --- English ---
+        # `slots` take the head of the queue, as `claim_sub_task` does, one sub-task each.
+        # --- Español ---
+        # `slots` toman la cabeza de la cola, como hace `claim_sub_task`, una subtarea cada uno.
+        count = len(slots)
+        tags, arrivals = self.queues[code].pop(count)
+        self.virtual_time[code] = max(self.virtual_time[code], tags[-1])
+        waits = self.now - arrivals
+        self.window_waits.append(waits)
+        self.wait_blocks.append(waits)
+        self.slot_idle[slots] = -1
+        self.slot_tag[slots], self.slot_arrival[slots] = tags, arrivals
+        service = self.rng.exponential(self.service[code] * self.slot_speed[slots])
+        self.slot_done[slots] = np.maximum(self.tick_index + 1, np.ceil((self.now + service) / self.step).astype(np.int64) - 1)
+        self.busy_slots += count
+
+    def sleep(self, slots, phase):
+        workers = self.slot_worker[slots]
+        self.slot_idle[slots] = phase
+        self.worker_phase[workers] = phase
+        np.add.at(self.worker_idle, workers, 1)
+
+    def dispatch(self, polling):
+        # --- English ---
+        # Slots that poll now (just freed or just loaded) claim first; idle slots whose poll tick
+        # falls on this tick join them only while sub-tasks are left. Slots that find nothing
+        # sleep until their next poll tick.
+        # --- Español ---
+        # Los huecos que sondean ahora (recién liberados o recién cargados) reclaman primero; los
+        # huecos ociosos cuyo tic de sondeo cae en este tic se suman solo si quedan subtareas. Los
+        # que no encuentran nada duermen hasta su siguiente tic de sondeo.
+        phase = self.tick_index % self.phases
+        idle = None
+        if any(len(queue) for queue in self.queues):
+            idle = np.flatnonzero(self.slot_idle[:self.slot_count] == phase)
+            idle_experts = self.slot_expert[idle]
+        polling_experts = self.slot_expert[polling]
+        for code in range(len(EXPERTS)):
+            polled = polling[polling_experts == code] if len(polling) else polling
+            queued = len(self.queues[code])
+            if not queued:
+                if len(polled): self.sleep(polled, phase)
+                continue
+            candidates = polled
+            if queued > len(polled) and idle is not None:
+                candidates = np.concatenate((polled, idle[idle_experts == code]))
+            claimed = min(len(candidates), queued)
+            if claimed: self.claim(code, candidates[:claimed])
+            if claimed < len(polled): self.sleep(polled[claimed:], phase)
+            woken = candidates[len(polled):claimed]
+            if len(woken): np.subtract.at(self.worker_idle, self.slot_worker[woken], 1)
+
+    # --- English ---
+    # --- Traffic and Sampling ---
+    # --- Español ---
+    # --- Tráfico y Muestreo ---
+    def take_arrivals(self, until):
+        parts = []
+        while True:
+            if self.block is None:
+                self.block, self.block_start = next(self.arrival_blocks, None), 0
+                if self.block is None: break
+            end = int(np.searchsorted(self.block[0], until, side="right"))
+            parts.append([column[self.block_start:end] for column in self.block])
+            self.block_start = end
+            if end < len(self.block[0]): break
+            self.block = None
+        if not parts: return np.empty(0), np.empty(0, np.int64), np.empty(0, np.int64)
+        return [np.concatenate(columns) for columns in zip(*parts)]
+
+    def arrive(self):
+        times, experts, requesters = self.take_arrivals(self.now)
+        if len(times): self.enqueue(times, experts, requesters)
+
+    def sample(self):
+        while self.ghosts and self.ghosts[0] <= self.now: heapq.heappop(self.ghosts)
+        waits = np.concatenate(self.window_waits) if self.window_waits else np.empty(0)
+        row = {"minute": round(self.now / 60, 2), "live_workers": self.live, "loading_workers": self.loading, "ghost_workers": len(self.ghosts),
+               "utilization": round(self.window_busy / self.window_capacity, 4) if self.window_capacity else 0.0,
+               "wait_p50": round(percentile(waits, 0.5), 2), "wait_p95": round(percentile(waits, 0.95), 2),
+               "wait_max": round(percentile(waits, 1.0), 2), "claimed": len(waits), "orphaned_total": self.orphaned}
+        row.update({f"queue_{expert}": len(self.queues[code]) for code, expert in enumerate(EXPERTS)})
+        self.samples.append(row)
+        self.window_busy = self.window_capacity = 0.0
+        self.window_waits = []
+
+    def run(self):
+        args, step = self.args, self.step
+        join_rate = args.workers / (args.mean_session_hours * 3600) if args.mean_session_hours > 0 else 0.0
+        for _ in range(args.workers): self.join()
+        next_join = self.worker_rng.expovariate(join_rate) if join_rate else math.inf
+        next_sample = args.sample_interval
+        for tick in range(math.ceil(args.hours * 3600 / step)):
+            self.tick_index, self.now = tick, (tick + 1) * step
+            while next_join <= self.now:
+                # --- English ---
+                # Replacement workers join at the rate others leave, keeping the population steady.
+                # --- Español ---
+                # Los workers de reemplazo llegan al ritmo al que otros se van, manteniendo la población estable.
+                self.join()
+                next_join += self.worker_rng.expovariate(join_rate)
+            for worker in self.leaves.pop(tick, ()): self.leave(worker)
+            polling = [self.ready(worker) for worker in self.readies.pop(tick, ())]
+            done = np.flatnonzero(self.slot_done[:self.slot_count] == tick)
+            if len(done):
+                self.slot_done[done] = -1
+                self.busy_slots -= len(done)
+                self.completed += len(done)
+                asleep = self.worker_idle[self.slot_worker[done]] > 0
+                if asleep.any():
+                    self.sleep(done[asleep], self.worker_phase[self.slot_worker[done[asleep]]])
+                    done = done[~asleep]
+                polling.append(done)
+            for experts, tags, arrivals in self.purges.pop(tick, ()):
+                for code in np.unique(experts): self.queues[code].insert(tags[experts == code], arrivals[experts == code])
+            self.arrive()
+            self.dispatch(np.concatenate(polling) if polling else np.empty(0, np.int64))
+            self.window_busy += step * self.busy_slots
+            self.window_capacity += step * self.ready_slots
+            if self.now >= next_sample:
+                self.sample()
+                next_sample += args.sample_interval
+        self.all_waits = np.concatenate(self.wait_blocks) if self.wait_blocks else np.empty(0)
+
+class ExactSimulation:
+    def __init__(self, args, arrivals):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.arrivals = arrivals
+        self.conn = orchestrator.get_db_connection()
+        self.events, self.sequence = [], 0
+        self.workers, self.next_worker = {}, 0
+        self.sleepers = {expert: [] for expert in orchestrator.SUPPORTED_EXPERTS}
+        self.wakeups = {expert: 0 for expert in orchestrator.SUPPORTED_EXPERTS}
+        self.pending = {expert: 0 for expert in orchestrator.SUPPORTED_EXPERTS}
+        self.enqueued_at = {}
+        self.ghosts = []
+        self.now = self.last_advance = 0.0
+        self.busy_slots = self.ready_slots = self.loading = 0
+        self.window_busy = self.window_capacity = 0.0
+        self.window_waits, self.all_waits = [], []
+        self.orphaned = self.completed = self.enqueued = 0
+        self.samples = []
+
+    def schedule(self, at, kind, *payload):
+        heapq.heappush(self.events, (at, self.sequence, kind, payload))
+        self.sequence += 1
+
+    def advance(self, now):
+        elapsed = now - self.last_advance
+        self.window_busy += elapsed * self.busy_slots
+        self.window_capacity += elapsed * self.ready_slots
+        self.now = self.last_advance = now
+
+    # --- English ---
+    # --- Workers ---
+    # --- Español ---
+    # --- Workers ---
+    def join(self):
+        slots, speed, load_seconds, session_seconds = draw_worker(self.args, self.rng, orchestrator.count_pending_by_expert(self.conn))
+        worker = SimulatedWorker(f"worker-{self.next_worker}", speed, slots)
+        self.next_worker += 1
+        self.workers[worker.id] = worker
+        self.loading += 1
+        self.schedule(self.now + load_seconds, "ready", worker)
+        if session_seconds is not None: self.schedule(self.now + session_seconds, "leave", worker)
+
+    def ready(self, worker):
+        if not worker.alive: return
+        self.loading -= 1
+        worker.ready = True
+        worker.free = dict(worker.slots)
+        self.ready_slots += sum(worker.slots.values())
+        self.poll(worker)
+
+    def leave(self, worker):
+        # --- English ---
+        # The worker process ends without telling the orchestrator. Its running sub-tasks stay
+        # assigned until its heartbeat times out and the purge loop hands them back to their
+        # queues with their fair tags; meanwhile the worker still counts as active.
+        # --- Español ---
+        # El proceso del worker termina sin avisar al orquestador. Sus subtareas en curso siguen
+        # asignadas hasta que su heartbeat caduca y el bucle de purga las devuelve a sus colas con
+        # sus etiquetas justas; mientras tanto el worker sigue contando como activo.
+        worker.alive = False
+        worker.token += 1
+        if worker.ready:
+            self.ready_slots -= sum(worker.slots.values())
+            self.busy_slots -= len(worker.held)
+        else:
+            self.loading -= 1
+        self.orphaned += len(worker.held)
+        purge_at = purge_time(self.args, self.rng, self.now)
+        heapq.heappush(self.ghosts, purge_at)
+        if worker.held: self.schedule(purge_at, "purge", worker)
+        del self.workers[worker.id]
+
+    def purge(self, worker):
+        orchestrator.release_sub_tasks(self.conn, [worker.id])
+        for sub_task_id, (expert, enqueued_at) in worker.held.items():
+            self.enqueued_at[sub_task_id] = enqueued_at
+            self.pending[expert] += 1
+        for expert in {expert for expert, _ in worker.held.values()}: self.wake(expert)
+
+    def poll(self, worker, woken_for=None):
+        # --- English ---
+        # One call to the fetch endpoint per free slot, like the worker loops; an empty answer
+        # puts the worker to sleep until its next poll tick.
+        # --- Español ---
+        # Una llamada al endpoint de obtención por hueco libre, como en los bucles del worker;
+        # una respuesta vacía duerme al worker hasta su siguiente tic de sondeo.
+        if woken_for is not None: self.wakeups[woken_for] -= 1
+        if not worker.alive: return
+        worker.sleep_phase = None
+        worker.token += 1
+        while True:
+            free_experts = [expert for expert, free in worker.free.items() if free > 0]
+            if not free_experts: break
+            if self.args.multi_expert:
+                sub_task = orchestrator.claim_next_sub_task(self.conn, worker.id, free_experts)
+            else:
+                sub_task = orchestrator.claim_sub_task(self.conn, worker.id, free_experts[0])
+            if sub_task is None:
+                self.sleep(worker, free_experts)
+                break
+            expert = sub_task['expert_type']
+            self.pending[expert] -= 1
+            worker.free[expert] -= 1
+            self.busy_slots += 1
+            enqueued_at = self.enqueued_at.pop(sub_task['id'])
+            worker.held[sub_task['id']] = (expert, enqueued_at)
+            self.window_waits.append(self.now - enqueued_at)
+            self.all_waits.append(self.now - enqueued_at)
+            service = self.rng.expovariate(1.0 / (SERVICE_SECONDS[expert] * worker.speed))
+            self.schedule(self.now + service, "completion", worker, sub_task['id'], expert)
+        for expert in self.pending: self.wake(expert)
+
+    def sleep(self, worker, experts):
+        worker.sleep_phase = self.now % POLL_INTERVAL
+        for expert in experts: bisect.insort(self.sleepers[expert], (worker.sleep_phase, worker.id, worker.token))
+
+    def wake(self, expert):
+        # --- English ---
+        # Makes sure every pending sub-task of `expert` has a sleeping worker scheduled to poll
+        # for it, choosing the sleepers whose next poll tick comes first.
+        # --- Español ---
+        # Se asegura de que cada subtarea pendiente de `expert` tenga un worker dormido que vaya a
+        # sondear por ella, eligiendo los que tienen el siguiente tic de sondeo más próximo.
+        sleepers = self.sleepers[expert]
+        phase_now = self.now % POLL_INTERVAL
+        while self.pending[expert] > self.wakeups[expert] and sleepers:
+            index = bisect.bisect_left(sleepers, (phase_now,)) % len(sleepers)
+            phase, worker_id, token = sleepers.pop(index)
+            worker = self.workers.get(worker_id)
+            if worker is None or worker.token != token or worker.free.get(expert, 0) <= 0: continue
+            worker.token += 1
+            self.wakeups[expert] += 1
+            self.schedule(self.now + (phase - phase_now) % POLL_INTERVAL, "poll", worker, expert)
+
+    def complete(self, worker, sub_task_id, expert):
+        if not worker.alive: return
+        self.conn.execute("DELETE FROM sub_tasks WHERE id = ?", (sub_task_id,))
+        del worker.held[sub_task_id]
+        self.completed += 1
+        worker.free[expert] += 1
+        self.busy_slots -= 1
+        # --- English ---
+        # A sleeping multi-expert worker only notices the freed slot at its next poll tick.
+        # --- Español ---
+        # Un worker multi-experto dormido solo nota el hueco liberado en su siguiente tic de sondeo.
+        if worker.sleep_phase is not None:
+            bisect.insort(self.sleepers[expert], (worker.sleep_phase, worker.id, worker.token))
+            self.wake(expert)
+        else:
+            self.poll(worker)
+
+    # --- English ---
+    # --- Traffic and Sampling ---
+    # --- Español ---
+    # --- Tráfico y Muestreo ---
+    def arrive(self, expert, requester_id):
+        sub_task_id = orchestrator.enqueue_sub_task(self.conn, None, expert, {"simulated": True}, requester_id=requester_id)
+        self.enqueued_at[sub_task_id] = self.now
+        self.pending[expert] += 1
+        self.enqueued += 1
+        self.wake(expert)
+        self.schedule_next_arrival()
+
+    def schedule_next_arrival(self):
+        arrival = next(self.arrivals, None)
+        if arrival is not None: self.schedule(arrival[0], "arrival", arrival[1], arrival[2])
+
+    def sample(self):
+        while self.ghosts and self.ghosts[0] <= self.now: heapq.heappop(self.ghosts)
+        row = {"minute": round(self.now / 60, 2), "live_workers": len(self.workers), "loading_workers": self.loading, "ghost_workers": len(self.ghosts),
+               "utilization": round(self.window_busy / self.window_capacity, 4) if self.window_capacity else 0.0,
+               "wait_p50": round(percentile(self.window_waits, 0.5), 2), "wait_p95": round(percentile(self.window_waits, 0.95), 2),
+               "wait_max": round(max(self.window_waits, default=0.0), 2), "claimed": len(self.window_waits), "orphaned_total": self.orphaned}
+        row.update({f"queue_{expert}": count for expert, count in self.pending.items()})
+        self.samples.append(row)
+        self.window_busy = self.window_capacity = 0.0
+        self.window_waits = []
+        self.schedule(self.now + self.args.sample_interval, "sample")
+
+    def run(self):
+        args = self.args
+        duration = args.hours * 3600
+        for _ in range(args.workers): self.join()
+        if args.mean_session_hours > 0:
+            self.schedule(self.rng.expovariate(args.workers / (args.mean_session_hours * 3600)), "join")
+        self.schedule_next_arrival()
+        self.schedule(args.sample_interval, "sample")
+        handlers = {"ready": self.ready, "leave": self.leave, "purge": self.purge, "poll": self.poll, "completion": self.complete, "arrival": self.arrive, "sample": self.sample}
+        while self.events and self.events[0][0] <= duration:
+            at, _, kind, payload = heapq.heappop(self.events)
+            self.advance(at)
+            if kind == "join":
+                # --- English ---
+                # Replacement workers join at the rate others leave, keeping the population steady.
+                # --- Español ---
+                # Los workers de reemplazo llegan al ritmo al que otros se van, manteniendo la población estable.
+                self.join()
+                self.schedule(self.now + self.rng.expovariate(args.workers / (args.mean_session_hours * 3600)), "join")
+            else:
+                handlers[kind](*payload)
+        self.conn.commit()
+        self.conn.close()
+
+def synthetic_arrivals(args, rng, rate):
+    users = [f"user-{index}" for index in range(args.users)]
+    experts, shares = list(TRAFFIC_MIX), list(TRAFFIC_MIX.values())
+    now = 0.0
+    while True:
+        now += rng.expovariate(rate)
+        yield now, rng.choices(experts, weights=shares)[0], rng.choice(users)
+
+def synthetic_arrival_blocks(args, seed, rate, block_size=65536):
+    # --- English ---
+    # The same Poisson traffic as `synthetic_arrivals`, as arrays of (times, expert codes,
+    # requester codes) of `block_size` arrivals each.
+    # --- Español ---
+    # El mismo tráfico de Poisson que `synthetic_arrivals`, como arrays de (tiempos, códigos de
+    # experto, códigos de solicitante) de `block_size` llegadas cada uno.
+    rng = np.random.default_rng(seed)
+    experts = np.array([EXPERTS.index(expert) for expert in TRAFFIC_MIX])
+    shares = np.array(list(TRAFFIC_MIX.values()))
+    now = 0.0
+    while True:
+        times = now + np.cumsum(rng.exponential(1.0 / rate, block_size))
+        now = times[-1]
+        yield times, experts[rng.choice(len(experts), block_size, p=shares / shares.sum())], rng.integers(0, args.users, block_size)
+
+def read_trace(path):
+    # --- English ---
+    # CSV with columns time (seconds), expert_type and optionally requester_id.
+    # --- Español ---
+    # CSV con columnas time (segundos), expert_type y opcionalmente requester_id.
+    with open(path, newline="") as f:
+        rows = [(float(row['time']), row['expert_type'], row.get('requester_id') or None) for row in csv.DictReader(f)]
+    rows.sort(key=lambda row: row[0])
+    start = rows[0][0] if rows else 0.0
+    return [(t - start, expert, requester) for t, expert, requester in rows if expert in orchestrator.SUPPORTED_EXPERTS]
+
+def trace_arrivals(path):
+    return iter(read_trace(path))
+
+def trace_arrival_blocks(path):
+    # --- English ---
+    # The trace as a single block of arrays, and how many distinct requesters it has. Arrivals
+    # without a requester get code -1.
+    # --- Español ---
+    # La traza como un único bloque de arrays, y cuántos solicitantes distintos tiene. Las
+    # llegadas sin solicitante reciben el código -1.
+    rows, requesters = read_trace(path), {}
+    block = (np.array([t for t, _, _ in rows], dtype=float), np.array([EXPERTS.index(expert) for _, expert, _ in rows], dtype=np.int64),
+             np.array([requesters.setdefault(requester, len(requesters)) if requester else -1 for _, _, requester in rows], dtype=np.int64))
+    return iter([block]), len(requesters)
+
+def export_trace(database, output):
+    # --- English ---
+    # Writes the sub-task arrivals recorded in an orchestrator database as a trace.
+    # --- Español ---
+    # Escribe como traza las llegadas de subtareas registradas en una base de datos del orquestador.
+    conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+    rows = conn.execute("SELECT created_at, expert_type, requester_id FROM sub_tasks WHERE created_at IS NOT NULL ORDER BY created_at").fetchall()
+    conn.close()
+    with open(output, 'w', newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["time", "expert_type", "requester_id"])
+        writer.writerows(rows)
+    print(f"Exported {len(rows)} arrivals to {output} | Exportadas {len(rows)} llegadas a {output}")
+
+def print_summary(simulation, args, wall_seconds):
+    samples = simulation.samples
+    print(f"\n  {'minute':>7s} {'live':>6s} {'loading':>7s} {'ghosts':>6s} {'util':>6s} {'wait p50':>9s} {'wait p95':>9s} {'queue':>7s} {'orphaned':>8s}")
+    step = max(1, len(samples) // 20)
+    for row in samples[::step]:
+        queue = sum(value for key, value in row.items() if key.startswith("queue_"))
+        print(f"  {row['minute']:7.1f} {row['live_workers']:6d} {row['loading_workers']:7d} {row['ghost_workers']:6d} {row['utilization']:6.1%} "
+              f"{row['wait_p50']:8.1f}s {row['wait_p95']:8.1f}s {queue:7d} {row['orphaned_total']:8d}")
+    waits = simulation.all_waits
+    print(f"\nSub-tasks: {simulation.enqueued} enqueued, {len(waits)} claimed, {simulation.completed} completed, {simulation.orphaned} orphaned by churn and requeued at purge.")
+    print(f"Subtareas: {simulation.enqueued} encoladas, {len(waits)} reclamadas, {simulation.completed} completadas, {simulation.orphaned} huérfanas por rotación y devueltas a la cola en la purga.")
+    print(f"Queue wait | Espera en cola: p50 {percentile(waits, 0.5):.1f}s, p95 {percentile(waits, 0.95):.1f}s, p99 {percentile(waits, 0.99):.1f}s, max {percentile(waits, 1.0):.1f}s")
+    print(f"Simulated {args.hours:g} h with {args.workers} workers in {wall_seconds:.1f} s. | Simuladas {args.hours:g} h con {args.workers} workers en {wall_seconds:.1f} s.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the network against the orchestrator's scheduling code.")
+    parser.add_argument("--workers", type=int, default=10000)
+    parser.add_argument("--hours", type=float, default=1.0, help="Simulated duration.")
+    parser.add_argument("--load", type=float, default=0.85, help="Synthetic arrival rate as a fraction of the reference capacity of all workers.")
+    parser.add_argument("--arrival-rate", type=float, default=None, help="Synthetic sub-tasks per second (overrides --load).")
+    parser.add_argument("--trace", default=None, help="Replay arrivals from a CSV trace instead of synthetic traffic.")
+    parser.add_argument("--export-trace", nargs=2, metavar=("DATABASE", "OUTPUT"), help="Write a trace from an orchestrator database and exit.")
+    parser.add_argument("--users", type=int, default=5000, help="Synthetic requesters (for fair queuing).")
+    parser.add_argument("--speed-spread", type=float, default=0.4, help="Log-normal sigma of per-worker speed factors.")
+    parser.add_argument("--mean-session-hours", type=float, default=4.0, help="Mean worker session length; 0 disables churn.")
+    parser.add_argument("--multi-expert", action="store_true", help="Workers host several experts (plan_expert_slots) and use the combined fetch.")
+    parser.add_argument("--heartbeat-timeout", type=float, default=orchestrator.HEARTBEAT_TIMEOUT_SECONDS)
+    parser.add_argument("--sample-interval", type=float, default=60.0, help="Simulated seconds per curve point.")
+    parser.add_argument("--tick", type=float, default=0.2, help="Simulated seconds per step of the default engine; waits are measured to within one tick.")
+    parser.add_argument("--exact", action="store_true", help="Run every sub-task through the real SQL functions on an in-memory database (slow; for small networks).")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Where to save the CSV curves.")
+    args = parser.parse_args()
+
+    if args.export_trace:
+        export_trace(*args.export_trace)
+        return
+    orchestrator.HEARTBEAT_TIMEOUT_SECONDS = args.heartbeat_timeout
+    mean_service = sum(share * SERVICE_SECONDS[expert] for expert, share in TRAFFIC_MIX.items()) * math.exp(args.speed_spread ** 2 / 2)
+    rate = args.arrival_rate or args.load * args.workers / mean_service
+
+    started = time.perf_counter()
+    if args.exact:
+        orchestrator.UPLOAD_DIRECTORY = tempfile.mkdtemp(prefix="helios-simulation-")
+        orchestrator.init_db()
+        simulation = ExactSimulation(args, trace_arrivals(args.trace) if args.trace else synthetic_arrivals(args, random.Random(args.seed + 1), rate))
+    else:
+        blocks, requesters = trace_arrival_blocks(args.trace) if args.trace else (synthetic_arrival_blocks(args, args.seed + 1, rate), args.users)
+        simulation = VectorizedSimulation(args, blocks, requesters)
+    simulation.run()
+    print_summary(simulation, args, time.perf_counter() - started)
+
+    output = args.output or os.path.join(RESULTS_DIRECTORY, f"scheduler_{int(time.time())}.csv")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(simulation.samples[0]) if simulation.samples else ["minute"])
+        writer.writeheader()
+        writer.writerows(simulation.samples)
+    print(f"Curves saved to {output} | Curvas guardadas en {output}")
+
+if __name__ == "__main__":
+    main()
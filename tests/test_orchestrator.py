@@ -0,0 +1,419 @@
+# --- English ---
+# Tests for the orchestrator's HTTP API. Each test gets a fresh SQLite database and working
+# directory; the startup event (background tasks, ingest pool) is not run.
+# Run from the repository root with: python -m pytest -q tests
+# --- Español ---
+# Pruebas de la API HTTP del orquestador. Cada prueba usa una base de datos SQLite y un
+# directorio de trabajo nuevos; el evento de arranque (tareas de fondo, pool de ingesta) no se ejecuta.
+# Ejecutar desde la raíz del repositorio con: python -m pytest -q tests
+
+# -*- coding: utf-8 -*-
+import asyncio
+import gzip
+import hashlib
+import io
+import json
+import os
+import sys
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import orchestrator
+
+SPECS = {"gpu": "N/A", "cpu_cores": 8, "memory": "16GB"}
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(orchestrator, "state_backend", orchestrator.SQLiteStateBackend(str(tmp_path / "state.db"), str(tmp_path / "archive.db")))
+    monkeypatch.setattr(orchestrator, "quick_ai_hosts", {"hosted": False, "checked_at": 0.0})
+    orchestrator.init_db()
+    return TestClient(orchestrator.app)
+
+def register(client, expert=None):
+    worker_id = client.post("/register", json={"specs": SPECS}).json()["worker_id"]
+    if expert:
+        conn = orchestrator.get_db_connection()
+        conn.execute("UPDATE workers SET assigned_expert = ?, status = 'idle' WHERE id = ?", (expert, worker_id))
+        conn.commit()
+        conn.close()
+    return worker_id
+
+def submit(client, user_id, prompt, files=None):
+    response = client.post("/upload-and-submit-job", data={"worker_id": user_id, "prompt": prompt}, files=files)
+    assert response.status_code == 200, response.text
+    return response.json()["job_id"]
+
+def complete_next(client, worker_id, expert_type, result):
+    sub_task = client.get(f"/get-sub-task/{worker_id}/{expert_type}").json()
+    assert "id" in sub_task
+    response = client.post("/submit-sub-task-result", json={"worker_id": worker_id, "sub_task_id": sub_task["id"], "result": json.dumps(result)})
+    assert response.status_code == 200
+    return sub_task
+
+def job_status(client, job_id):
+    status = client.get(f"/get-job-status/{job_id}").json()
+    return status["status"], json.loads(status["final_result"]) if status["final_result"] else None
+
+def docx_file(text):
+    docx = pytest.importorskip("docx")
+    document, content = docx.Document(), io.BytesIO()
+    document.add_paragraph(text)
+    document.save(content)
+    return {"file": ("notes.docx", content.getvalue(), "application/vnd.openxmlformats-officedocument.wordprocessingml.document")}
+
+class BagOfWordsEncoder:
+    # Stands in for sentence-transformers: normalized word counts, so equal texts are identical and unrelated ones are not.
+    # Sustituye a sentence-transformers: conteos de palabras normalizados, así los textos iguales coinciden y los no relacionados no.
+    def encode(self, texts, normalize_embeddings=True):
+        import numpy as np
+        vectors = np.zeros((len(texts), 256), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in (text.lower().split() or ["<empty>"]):
+                vectors[row, zlib.crc32(word.strip(".,?!").encode()) % 256] += 1.0
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def test_semantic_cache_hit_after_prior_turns(client, monkeypatch):
+    monkeypatch.setattr(orchestrator, "np", pytest.importorskip("numpy"))
+    monkeypatch.setattr(orchestrator, "semantic_cache_model", BagOfWordsEncoder())
+    monkeypatch.setattr(orchestrator, "semantic_cache", orchestrator.SemanticCache(16))
+    worker_id = register(client, "general-ai")
+    first, second, unrelated = register(client), register(client), register(client)
+    conn = orchestrator.get_db_connection()
+    for user_id in (first, second):
+        orchestrator.add_chat_turn(conn, user_id, "user", "Tell me about the history of France.")
+        orchestrator.add_chat_turn(conn, user_id, "model", "France has a long history of kings and revolutions.")
+    orchestrator.add_chat_turn(conn, unrelated, "user", "Which programming language should I learn first?")
+    orchestrator.add_chat_turn(conn, unrelated, "model", "Python is a good first language.")
+    conn.commit()
+    conn.close()
+
+    answered = submit(client, first, "What happened in 1789?")
+    complete_next(client, worker_id, "general-ai", {"generated_text": '{"summary": "A question about 1789.", "generation": "The French Revolution began."}'})
+    assert job_status(client, answered)[0] == "completed"
+
+    status, final_result = job_status(client, submit(client, second, "What happened in 1789?"))
+    assert status == "completed"
+    assert final_result["general-ai"]["generation"] == "The French Revolution began."
+    assert job_status(client, submit(client, unrelated, "What happened in 1789?"))[0] == "pending"
+
+def test_escalated_prompt_keeps_its_place_in_the_queue(client):
+    quick, general = register(client, "quick-ai"), register(client, "general-ai")
+    early, late = register(client), register(client)
+    escalated = submit(client, early, "Hi there!")
+    submit(client, late, "Explain in detail " + "why the sky is blue and sunsets are red, " * 10)
+    complete_next(client, quick, "quick-ai", {"generated_text": '{"summary": "A greeting.", "generation": "Hello!"}', "confidence": 0.1})
+    assert client.get(f"/get-sub-task/{general}/general-ai").json()["job_id"] == escalated
+
+def test_document_summary_is_stored_as_returned(client, monkeypatch):
+    monkeypatch.setattr(orchestrator, "ingest_pool", ThreadPoolExecutor(max_workers=1))
+    summarizer, user = register(client, "document-summarization"), register(client)
+    job_id = submit(client, user, "", files=docx_file("Quarterly sales grew in every region."))
+    sub_task = complete_next(client, summarizer, "document-summarization", {"summary_text": "Sales grew everywhere."})
+    assert "Quarterly sales grew" in json.loads(sub_task["data"])["text"]
+    assert job_status(client, job_id) == ("completed", {"document-summarization": {"summary_text": "Sales grew everywhere."}})
+    orchestrator.ingest_pool.shutdown()
+
+def test_unreadable_document_falls_back_to_the_prompt(client):
+    general, user = register(client, "general-ai"), register(client)
+    answer = {"generated_text": '{"summary": "A request.", "generation": "Here you go."}'}
+    for files, reason in ((docx_file("Quarterly sales grew in every region."), "not available"),
+                          ({"file": ("notes.txt", b"plain text", "text/plain")}, "Unsupported file type")):
+        job_id = submit(client, user, "Summarize the attached notes.", files=files)
+        complete_next(client, general, "general-ai", answer)
+        status, final_result = job_status(client, job_id)
+        assert status == "completed"
+        assert final_result["general-ai"]["generation"] == "Here you go."
+        assert reason in final_result["document-summarization"]["warning"]
+
+def test_crashed_ingest_pool_is_replaced(client, monkeypatch):
+    class CrashedPool:
+        def submit(self, *args):
+            raise orchestrator.BrokenProcessPool("A child process terminated abruptly.")
+        def shutdown(self, wait=True):
+            pass
+    crashed = CrashedPool()
+    monkeypatch.setattr(orchestrator, "ingest_pool", crashed)
+    response = client.post("/upload-and-submit-job", data={"worker_id": register(client), "prompt": ""}, files=docx_file("Notes."))
+    assert response.status_code == 503
+    assert orchestrator.ingest_pool is not crashed and orchestrator.ingest_pool is not None
+    orchestrator.ingest_pool.shutdown()
+
+def test_job_status_cursor_after_legacy_job(client):
+    user = register(client)
+    conn = orchestrator.get_db_connection()
+    conn.execute("INSERT INTO jobs (id, prompt, status, worker_id) VALUES ('legacy', 'Hello', 'pending', ?)", (user,))
+    conn.commit()
+    conn.close()
+    recent = submit(client, user, "Hello again")
+
+    first = client.post("/job-statuses", json={"worker_id": user, "limit": 1}).json()
+    assert [job["id"] for job in first["jobs"]] == ["legacy"] and first["more"]
+    second = client.post("/job-statuses", json={"worker_id": user, "since": first["cursor"]})
+    assert second.status_code == 200, second.text
+    assert [job["id"] for job in second.json()["jobs"]] == [recent]
+
+def test_history_summaries_wait_behind_chat_work(client):
+    general, users = register(client, "general-ai"), [register(client) for _ in range(10)]
+    conn = orchestrator.get_db_connection()
+    for user_id in users:
+        for turn in range(4):
+            orchestrator.add_chat_turn(conn, user_id, "user" if turn % 2 == 0 else "model", "A long message about many things. " * 60)
+    conn.commit()
+    conn.close()
+    orchestrator.compact_chat_history()
+    orchestrator.compact_chat_history()
+    conn = orchestrator.get_db_connection()
+    assert conn.execute("SELECT COUNT(*) FROM sub_tasks WHERE background = 1").fetchone()[0] == 1
+    conn.close()
+
+    chat = submit(client, register(client), "Hello!")
+    claimed = [client.get(f"/get-sub-task/{general}/general-ai").json()["job_id"] for _ in range(2)]
+    assert claimed == [chat, None]
+
+def test_leader_lease_is_taken_over_once_expired(client, monkeypatch):
+    backend = orchestrator.state_backend
+    assert backend.try_acquire_lease("purge-inactive-workers", "node-a", 90)
+    assert not backend.try_acquire_lease("purge-inactive-workers", "node-b", 90)
+    assert backend.try_acquire_lease("purge-inactive-workers", "node-a", 90)
+    now = orchestrator.time.time()
+    monkeypatch.setattr(orchestrator.time, "time", lambda: now + 91)
+    assert backend.try_acquire_lease("purge-inactive-workers", "node-b", 90)
+    assert not backend.try_acquire_lease("purge-inactive-workers", "node-a", 90)
+
+def test_purge_requeues_the_sub_tasks_of_silent_workers(client):
+    general, user = register(client, "general-ai"), register(client)
+    job_id = submit(client, user, "Hello!")
+    assert client.get(f"/get-sub-task/{general}/general-ai").json()["job_id"] == job_id
+    conn = orchestrator.get_db_connection()
+    conn.execute("UPDATE workers SET last_heartbeat = 0 WHERE id = ?", (general,))
+    conn.commit()
+    conn.close()
+    orchestrator.purge_workers()
+    conn = orchestrator.get_db_connection()
+    assert conn.execute("SELECT COUNT(*) FROM workers WHERE id = ?", (general,)).fetchone()[0] == 0
+    assert conn.execute("SELECT status, assigned_worker_id FROM sub_tasks WHERE job_id = ?", (job_id,)).fetchone()[:] == ("pending", None)
+    conn.close()
+
+def test_resume_keeps_the_worker_id_and_releases_lost_sub_tasks(client):
+    general, user = register(client, "general-ai"), register(client)
+    finished, lost = submit(client, user, "Hello!"), submit(client, user, "Hi there!")
+    held = {client.get(f"/get-sub-task/{general}/general-ai").json()["job_id"]: None for _ in range(2)}
+    conn = orchestrator.get_db_connection()
+    for job_id in held: held[job_id] = conn.execute("SELECT id FROM sub_tasks WHERE job_id = ?", (job_id,)).fetchone()[0]
+    conn.close()
+    resumed = client.post("/resume", json={"worker_id": general, "specs": SPECS, "finished_sub_tasks": [held[finished]]}).json()
+    assert (resumed["status"], resumed["worker_id"], list(resumed["experts"])) == ("resumed", general, ["general-ai"])
+    assert (resumed["resubmit"], resumed["released"]) == ([held[finished]], [held[lost]])
+    assert client.get(f"/get-sub-task/{general}/general-ai").json()["job_id"] == lost
+    recreated = client.post("/resume", json={"worker_id": "purged-worker", "specs": SPECS}).json()
+    assert (recreated["status"], recreated["worker_id"], recreated["experts"]) == ("recreated", "purged-worker", {})
+    assert client.post("/heartbeat", json={"worker_id": "purged-worker"}).status_code == 200
+
+def test_stranded_quick_ai_prompts_escalate_to_general_ai(client):
+    quick, general = register(client, "quick-ai"), register(client, "general-ai")
+    waited, stranded = submit(client, register(client), "Hi there!"), submit(client, register(client), "Hello!")
+    conn = orchestrator.get_db_connection()
+    conn.execute("UPDATE sub_tasks SET created_at = created_at - ? WHERE job_id = ?", (orchestrator.CASCADE_MAX_WAIT_SECONDS + 1, waited))
+    conn.commit()
+    assert orchestrator.escalate_stranded_sub_tasks(conn) == 1
+    conn.execute("UPDATE workers SET last_heartbeat = 0 WHERE id = ?", (quick,))
+    conn.commit()
+    conn.close()
+    orchestrator.purge_workers()
+    assert [client.get(f"/get-sub-task/{general}/general-ai").json()["job_id"] for _ in range(2)] == [waited, stranded]
+
+def test_admission_refuses_excess_jobs_with_retry_after(client, monkeypatch):
+    user, submitted = register(client), orchestrator.USER_MAX_IN_FLIGHT_JOBS
+    for _ in range(submitted): submit(client, user, "Hello!")
+    response = client.post("/upload-and-submit-job", data={"worker_id": user, "prompt": "Hello!"})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == str(orchestrator.QUEUE_FULL_RETRY_AFTER_SECONDS)
+
+    monkeypatch.setattr(orchestrator, "USER_MAX_IN_FLIGHT_JOBS", 100)
+    monkeypatch.setattr(orchestrator, "USER_RATE_LIMIT_JOBS", submitted)
+    response = client.post("/upload-and-submit-job", data={"worker_id": user, "prompt": "Hello!"})
+    assert response.status_code == 429
+    assert 1 <= int(response.headers["Retry-After"]) <= orchestrator.USER_RATE_LIMIT_WINDOW_SECONDS + 1
+
+def test_admission_is_checked_in_the_insert_transaction(client):
+    # Simula envíos simultáneos que pasaron todos la comprobación temprana. | Simulates concurrent submissions that all passed the early check.
+    user = register(client)
+    worker = orchestrator.admit_job(user)
+    for index in range(orchestrator.USER_MAX_IN_FLIGHT_JOBS):
+        orchestrator.store_job(f"job-{index}", user, "Hello!", worker, "", None, None, None, False, None)
+    with pytest.raises(orchestrator.HTTPException) as refused:
+        orchestrator.store_job("job-extra", user, "Hello!", worker, "", None, None, None, False, None)
+    assert refused.value.status_code == 429
+    conn = orchestrator.get_db_connection()
+    assert conn.execute("SELECT COUNT(*) FROM jobs WHERE worker_id = ?", (user,)).fetchone()[0] == orchestrator.USER_MAX_IN_FLIGHT_JOBS
+    assert conn.execute("SELECT COUNT(*) FROM chat_history WHERE worker_id = ?", (user,)).fetchone()[0] == orchestrator.USER_MAX_IN_FLIGHT_JOBS
+    conn.close()
+
+def test_fair_queue_interleaves_users_and_favours_contributors(client):
+    general, busy, newcomer, contributor = register(client, "general-ai"), register(client), register(client), register(client)
+    conn = orchestrator.get_db_connection()
+    conn.execute("UPDATE workers SET reputation = 1000 WHERE id = ?", (contributor,))
+    conn.commit()
+    conn.close()
+    busy_jobs = [submit(client, busy, f"Question {index}?") for index in range(3)]
+    newcomer_job = submit(client, newcomer, "One question?")
+    contributor_job = submit(client, contributor, "Another question?")
+    claimed = [client.get(f"/get-sub-task/{general}/general-ai").json()["job_id"] for _ in range(5)]
+    assert claimed == [contributor_job, busy_jobs[0], newcomer_job, busy_jobs[1], busy_jobs[2]]
+
+def test_metrics_report_queue_depth_and_request_latency(client):
+    submit(client, register(client), "Hello!")
+    assert client.get("/get-job-status/unknown-job").status_code == 404
+    text = client.get("/metrics").text
+    assert 'helios_queue_depth{expert_type="general-ai"} 1' in text
+    assert 'helios_http_request_duration_seconds_count{method="GET",endpoint="/get-job-status/{job_id}",status="404"}' in text
+    assert 'helios_sqlite_query_duration_seconds_count{statement="INSERT"}' in text
+
+def test_benchmark_reads_sqlite_timings_and_flags_regressions(client):
+    import benchmark_orchestrator
+    submit(client, register(client), "Hello!")
+    timings = benchmark_orchestrator.parse_sqlite_metrics(client.get("/metrics").text)
+    assert timings["INSERT"]["count"] >= 2 and timings["INSERT"]["mean_seconds"] > 0
+
+    def results(throughput, p99, register_p99):
+        return {"orchestrator_version": "13.0.0", "git_revision": "abc1234", "throughput": {"jobs_completed_per_second": throughput},
+                "jobs": {"latency_seconds": {"p50": 1.0, "p99": p99}}, "endpoints": {"/register": {"p99": register_p99}}}
+    regressions = benchmark_orchestrator.compare_results(results(8.0, 2.1, 0.2), results(10.0, 2.0, 0.1))
+    assert regressions == ["jobs_completed_per_second", "/register p99"]
+
+def test_stage_timings_are_aggregated_and_forgotten_with_the_worker(client):
+    general = register(client, "general-ai")
+    submit(client, register(client), "Hello!")
+    sub_task = client.get(f"/get-sub-task/{general}/general-ai").json()
+    client.post("/submit-sub-task-result", json={"worker_id": general, "sub_task_id": sub_task["id"], "result": json.dumps({"generated_text": "{}"}),
+                                                 "timings": {"fetch": 0.5, "inference": 1.5, "unknown": 3.0, "upload": -1.0}})
+    stages = client.get("/stage-timings").json()["per_worker"][general]
+    assert set(stages) == {"fetch", "inference"}
+    assert stages["inference"] == {"count": 1, "mean_seconds": 1.5, "max_seconds": 1.5, "share": 0.75}
+    assert 'helios_worker_stage_duration_seconds_count{expert_type="general-ai",stage="inference"}' in client.get("/metrics").text
+
+    conn = orchestrator.get_db_connection()
+    conn.execute("UPDATE workers SET last_heartbeat = 0 WHERE id = ?", (general,))
+    conn.commit()
+    conn.close()
+    orchestrator.purge_workers()
+    assert general not in client.get("/stage-timings").json()["per_worker"]
+
+def test_history_summary_replaces_old_turns_in_the_prompt(client):
+    general, user = register(client, "general-ai"), register(client)
+    conn = orchestrator.get_db_connection()
+    for turn in range(6):
+        orchestrator.add_chat_turn(conn, user, "user" if turn % 2 == 0 else "model", f"Turn {turn}. " + "Many words about the topic. " * 20)
+    conn.commit()
+    conn.close()
+    orchestrator.compact_chat_history()
+    complete_next(client, general, "general-ai", {"generated_text": '{"summary": "We talked about the topic at length."}'})
+
+    conn = orchestrator.get_db_connection()
+    history = orchestrator.build_conversation_history(conn, user)
+    conn.close()
+    assert history.startswith("<start_of_turn>user\nSummary of our earlier conversation: We talked about the topic at length.")
+    assert "Turn 0." not in history and "Turn 5." in history
+    assert orchestrator.count_tokens(history) <= orchestrator.HISTORY_TOKEN_BUDGET + orchestrator.TURN_OVERHEAD_TOKENS
+
+def test_results_are_packed_compactly_and_unpacked_as_stored():
+    small, large = {"summary": "Short."}, {"generation": "A long answer. " * 40}
+    assert orchestrator.pack_result(small) == '{"summary":"Short."}'
+    packed = orchestrator.pack_result(large)
+    assert isinstance(packed, bytes) and len(packed) < len(json.dumps(large))
+    assert json.loads(orchestrator.unpack_result(packed)) == large
+    assert orchestrator.unpack_result('{"summary":"Short."}') == '{"summary":"Short."}'
+
+def test_expired_jobs_are_archived_with_their_results(client):
+    general, user = register(client, "general-ai"), register(client)
+    job_id = submit(client, user, "Hello!")
+    answer = {"summary": "A greeting.", "generation": "A long answer. " * 40}
+    complete_next(client, general, "general-ai", {"generated_text": json.dumps(answer)})
+    conn = orchestrator.get_db_connection()
+    assert isinstance(conn.execute("SELECT final_result FROM jobs WHERE id = ?", (job_id,)).fetchone()[0], bytes)
+    conn.execute("UPDATE jobs SET completed_at = completed_at - ? WHERE id = ?", (orchestrator.JOB_RETENTION_DAYS * 86400 + 1, job_id))
+    conn.commit()
+    conn.close()
+
+    orchestrator.expire_completed_jobs()
+    assert client.get(f"/get-job-status/{job_id}").status_code == 404
+    conn = orchestrator.get_db_connection()
+    assert conn.execute("SELECT COUNT(*) FROM sub_tasks WHERE job_id = ?", (job_id,)).fetchone()[0] == 0
+    conn.close()
+    archives = os.listdir(orchestrator.JOB_ARCHIVE_DIRECTORY)
+    with gzip.open(os.path.join(orchestrator.JOB_ARCHIVE_DIRECTORY, archives[0]), "rt", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert [(record["id"], record["worker_id"], record["prompt"]) for record in records] == [(job_id, user, "Hello!")]
+    assert records[0]["final_result"] == {"general-ai": answer}
+
+def test_reported_utilization_is_averaged_per_expert(client):
+    first, second = register(client, "general-ai"), register(client, "general-ai")
+    for worker_id, utilization in ((first, 0.5), (second, 0.9)):
+        assert client.post("/heartbeat", json={"worker_id": worker_id, "utilization": utilization}).status_code == 200
+    assert client.post("/heartbeat", json={"worker_id": second}).status_code == 200
+    assert 'helios_worker_utilization{assigned_expert="general-ai"} 0.7' in client.get("/metrics").text
+    assert client.post("/heartbeat", json={"worker_id": "unknown", "utilization": 0.5}).status_code == 404
+
+def test_multi_expert_assignment_and_combined_fetch(client):
+    chat = submit(client, register(client), "Hello!")
+    large = client.post("/register", json={"specs": {"gpu": "N/A", "cpu_cores": 16, "memory": "32GB"}}).json()["worker_id"]
+    small = client.post("/register", json={"specs": {"gpu": "N/A", "cpu_cores": 2, "memory": "2GB"}}).json()["worker_id"]
+    experts = client.get(f"/request-experts/{large}").json()["experts"]
+    assert set(experts) == set(orchestrator.SUPPORTED_EXPERTS)
+    assert sum(info["slots"] * info["slot_cores"] for info in experts.values()) <= 16 - orchestrator.RESERVED_CORES
+    assert {expert: info["slots"] for expert, info in client.get(f"/request-experts/{small}").json()["experts"].items()} == {"general-ai": 1}
+
+    conn = orchestrator.get_db_connection()
+    audio = orchestrator.enqueue_sub_task(conn, None, "audio-transcription", {"file_path": "a.wav"}, created_at=orchestrator.time.time() - 100)
+    conn.commit()
+    conn.close()
+    free_slots = {"general-ai": 1, "audio-transcription": 0}
+    assert client.post(f"/get-sub-task/{large}", json={"free_slots": free_slots}).json()["job_id"] == chat
+    free_slots = {"general-ai": 1, "audio-transcription": 1}
+    assert client.post(f"/get-sub-task/{large}", json={"free_slots": free_slots}).json()["id"] == audio
+    assert "id" not in client.post(f"/get-sub-task/{large}", json={"free_slots": free_slots}).json()
+
+def test_model_manifest_and_range_downloads(client, monkeypatch):
+    monkeypatch.setattr(orchestrator, "model_manifests", {})
+    monkeypatch.setattr(orchestrator, "MODEL_CHUNK_SIZE", 4)
+    os.makedirs("models/org--tiny-model/tokenizer")
+    content = b"0123456789"
+    with open("models/org--tiny-model/weights.bin", "wb") as f: f.write(content)
+    with open("models/org--tiny-model/tokenizer/vocab.txt", "wb") as f: f.write(b"a b c")
+
+    manifest = client.get("/model-artifacts/org--tiny-model/manifest").json()
+    files = {entry["path"]: entry for entry in manifest["files"]}
+    assert set(files) == {"tokenizer/vocab.txt", "weights.bin"}
+    weights = files["weights.bin"]
+    assert weights["size"] == 10 and weights["sha256"] == hashlib.sha256(content).hexdigest()
+    assert weights["chunks"] == [hashlib.sha256(content[i:i + 4]).hexdigest() for i in range(0, 10, 4)]
+    assert client.get("/model-artifacts/org--missing/manifest").status_code == 404
+
+    whole = client.get("/model-artifacts/org--tiny-model/files/weights.bin")
+    assert whole.status_code == 200 and whole.content == content
+    part = client.get("/model-artifacts/org--tiny-model/files/weights.bin", headers={"Range": "bytes=4-7"})
+    assert part.status_code == 206 and part.content == b"4567" and part.headers["Content-Range"] == "bytes 4-7/10"
+    assert client.get("/model-artifacts/org--tiny-model/files/weights.bin", headers={"Range": "bytes=-3"}).content == b"789"
+    assert client.get("/model-artifacts/org--tiny-model/files/weights.bin", headers={"Range": "bytes=10-"}).status_code == 416
+    assert client.get("/model-artifacts/org--tiny-model/files/../../state.db").status_code == 404
+
+    with open("models/org--tiny-model/weights.bin", "wb") as f: f.write(b"changed!!!!")
+    assert {entry["path"]: entry["size"] for entry in client.get("/model-artifacts/org--tiny-model/manifest").json()["files"]}["weights.bin"] == 11
+
+def test_concurrent_manifest_requests_share_one_build(client, monkeypatch):
+    builds = []
+    def build(model_key):
+        builds.append(model_key)
+        orchestrator.time.sleep(0.2)
+        return {"model": model_key, "files": []}
+    monkeypatch.setattr(orchestrator, "build_model_manifest", build)
+
+    async def fetch_three():
+        return await asyncio.gather(*(orchestrator.get_model_manifest("org--tiny-model") for _ in range(3)))
+    assert [manifest["model"] for manifest in asyncio.run(fetch_three())] == ["org--tiny-model"] * 3
+    assert builds == ["org--tiny-model"]
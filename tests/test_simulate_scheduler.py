@@ -0,0 +1,39 @@
+# --- English ---
+# Tests for the scheduler simulator. Each run is a separate process, as the simulator puts
+# the orchestrator on an in-memory state backend when it is imported.
+# Run from the repository root with: python -m pytest -q tests
+# --- Español ---
+# Pruebas del simulador del planificador. Cada ejecución es un proceso aparte, ya que el
+# simulador pone el orquestador sobre un backend de estado en memoria al importarlo.
+# Ejecutar desde la raíz del repositorio con: python -m pytest -q tests
+
+# -*- coding: utf-8 -*-
+import csv
+import os
+import subprocess
+import sys
+
+import pytest
+
+SIMULATOR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "simulate_scheduler.py")
+
+def simulate(tmp_path, *options):
+    pytest.importorskip("numpy")
+    output = tmp_path / f"curves{len(os.listdir(tmp_path))}.csv"
+    subprocess.run([sys.executable, SIMULATOR, "--workers", "100", "--hours", "0.25", "--users", "50", "--output", str(output), *options],
+                   cwd=tmp_path, check=True, capture_output=True, timeout=300)
+    with open(output, newline="") as f: return list(csv.DictReader(f))
+
+def test_vectorized_engine_matches_the_sql_engine(tmp_path):
+    vectorized, exact = simulate(tmp_path), simulate(tmp_path, "--exact")
+    assert len(vectorized) == len(exact) == 15
+    claimed = [sum(int(row["claimed"]) for row in curves) for curves in (vectorized, exact)]
+    assert abs(claimed[0] - claimed[1]) <= 0.05 * claimed[1]
+    for curves in (vectorized, exact):
+        assert all(0.0 <= float(row["utilization"]) <= 1.0 for row in curves)
+        assert float(curves[-1]["wait_p50"]) < 5.0
+
+def test_multi_expert_workers_use_the_combined_fetch(tmp_path):
+    curves = simulate(tmp_path, "--multi-expert")
+    assert sum(int(row["claimed"]) for row in curves) > 0
+    assert int(curves[-1]["live_workers"]) > 0
@@ -0,0 +1,71 @@
+# --- English ---
+# Tests for the Linux worker's local processing. They need the worker's own dependencies
+# (torch, transformers, requests, Pillow, soundfile, soxr) and are skipped without them.
+# Run from the repository root with: python -m pytest -q tests
+# --- Español ---
+# Pruebas del procesamiento local del worker de Linux. Necesitan las dependencias del propio
+# worker (torch, transformers, requests, Pillow, soundfile, soxr) y se omiten si no están.
+# Ejecutar desde la raíz del repositorio con: python -m pytest -q tests
+
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+import pytest
+
+for module in ("torch", "transformers", "requests", "PIL", "soundfile", "soxr"): pytest.importorskip(module)
+import numpy as np
+import soundfile
+import soxr
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import worker_linux
+
+def test_audio_windows_rebuild_the_resampled_signal(tmp_path, monkeypatch):
+    monkeypatch.setattr(worker_linux, "AUDIO_DECODE_BLOCK_FRAMES", 4096)
+    sample_rate, seconds = 44100, 75
+    time_axis = np.arange(sample_rate * seconds) / sample_rate
+    signal = (0.5 * np.sin(2 * np.pi * 440 * time_axis) * (time_axis % 7 > 0.5)).astype(np.float32)
+    soundfile.write(tmp_path / "speech.wav", signal, sample_rate, subtype="FLOAT")
+    windows = [window.copy() for window in worker_linux.audio_windows(str(tmp_path / "speech.wav"))]
+    assert len(windows) == 3
+    assert all(len(window) <= worker_linux.AUDIO_WINDOW_SECONDS * worker_linux.AUDIO_SAMPLE_RATE for window in windows)
+    expected = soxr.resample(signal, sample_rate, worker_linux.AUDIO_SAMPLE_RATE)
+    rebuilt = np.concatenate(windows)
+    assert len(rebuilt) == len(expected)
+    assert np.allclose(rebuilt, expected, atol=1e-4)
+
+def test_slot_threads_use_the_budgeted_cores_or_an_even_share(monkeypatch):
+    monkeypatch.setitem(worker_linux.WORKER_SPECS, "cpu_cores", 8)
+    experts = {"general-ai": {"slots": 1, "slot_cores": 4}, "quick-ai": {"slots": 3}}
+    assert worker_linux.slot_torch_threads(experts) == {"general-ai": 4, "quick-ai": 2}
+    assert worker_linux.slot_torch_threads({"quick-ai": {"slots": 16}}) == {"quick-ai": 1}
+
+class CharacterTokenizer:
+    eos_token_id = None
+
+    def __call__(self, text, return_tensors=None):
+        import torch
+        return type("Encoding", (), {"input_ids": torch.tensor([[ord(character) % 64 for character in text]])})
+
+    def decode(self, tokens, skip_special_tokens=True):
+        return " ".join(str(token) for token in tokens)
+
+def test_continuous_batching_matches_greedy_generation():
+    import torch
+    from concurrent.futures import ThreadPoolExecutor
+    from transformers import GPT2Config, GPT2LMHeadModel
+    torch.manual_seed(0)
+    model = GPT2LMHeadModel(GPT2Config(vocab_size=64, n_positions=64, n_embd=32, n_layer=2, n_head=2)).eval()
+    model.generation_config.eos_token_id = None
+    generator = type("Generator", (), {"model": model, "tokenizer": CharacterTokenizer()})
+    batcher = worker_linux.ContinuousBatcher(generator, max_sequences=2, budget_mb=1)
+    batcher.start()
+    prompts = ["Hello!", "Hi", "A longer prompt here"]
+    with ThreadPoolExecutor(max_workers=len(prompts)) as pool:
+        results = list(pool.map(lambda prompt: batcher.generate(prompt, {}, max_new_tokens=6)["generated_text"], prompts))
+    for prompt, result in zip(prompts, results):
+        input_ids = generator.tokenizer(prompt).input_ids
+        with torch.inference_mode():
+            expected = model.generate(input_ids, max_new_tokens=6, do_sample=False, pad_token_id=0)[0, input_ids.shape[1]:]
+        assert result == generator.tokenizer.decode(expected.tolist())
@@ -15,8 +15,20 @@ import requests
 import time
 import json
 import os
+import sys
 import threading
+import cProfile
+import pstats
+import queue
+import hashlib
+import shutil
+import copy
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+import torch
+import torch.nn.functional as F
 from transformers import pipeline
+from transformers.pipelines.base import ChunkPipeline
 
 # --- English ---
 # --- Dependency Imports for File Processing ---
@@ -25,16 +37,25 @@ from transformers import pipeline
 # --- Importaciones de Dependencias para Procesamiento de Archivos ---
 # Estas son necesarias para las capacidades multi-modales.
 try:
-    import PyPDF2
-    import docx
     from PIL import Image
-    import librosa
+    import numpy as np
+    import soundfile
+    import soxr
 except ImportError:
     # This error should not occur for the end-user as the installer should handle dependencies.
     # Este error no debería ocurrir para el usuario final ya que el instalador debería gestionar las dependencias.
     print("ERROR: Missing dependencies.")
     exit()
 
+# --- English ---
+# Fallback decoder (through ffmpeg or the system codecs) for audio formats libsndfile cannot read.
+# --- Español ---
+# Decodificador de respaldo (mediante ffmpeg o los códecs del sistema) para los formatos de audio que libsndfile no puede leer.
+try:
+    import audioread
+except ImportError:
+    audioread = None
+
 # --- English ---
 # --- Configuration ---
 # --- Español ---
@@ -57,10 +78,20 @@ ORCHESTRATOR_PUBLIC_URL = "https://api.noragentia.com"
 SESSION_FILE = os.path.join(os.path.expanduser('~'), '.config', 'HeliosAIWorker', 'worker_session.json')
 
 # --- English ---
-# Self-reported hardware specifications.
+# Self-reported hardware specifications. The core count and physical memory are read from
+# the system (the orchestrator sizes multi-expert slots from them); 8 cores and 16GB are the
+# fallback if that fails.
 # --- Español ---
-# Especificaciones de hardware auto-reportadas.
-WORKER_SPECS = { "gpu": "N/A", "cpu_cores": 8, "memory": "16GB" }
+# Especificaciones de hardware auto-reportadas. El número de núcleos y la memoria física se
+# leen del sistema (el orquestador calcula con ellos los huecos multi-experto); 8 núcleos y
+# 16GB se usan si eso falla.
+def detect_memory(default="16GB"):
+    try:
+        return f"{os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 1024 ** 3:.1f}GB"
+    except (ValueError, OSError, AttributeError):
+        return default
+
+WORKER_SPECS = { "gpu": "N/A", "cpu_cores": os.cpu_count() or 8, "memory": detect_memory() }
 
 # --- English ---
 # Time in seconds between polling for new tasks or sending heartbeats.
@@ -69,16 +100,148 @@ WORKER_SPECS = { "gpu": "N/A", "cpu_cores": 8, "memory": "16GB" }
 POLL_INTERVAL = 5
 HEARTBEAT_INTERVAL = 30
 
+# --- English ---
+# Pipelined mode overlaps the network and the model: while one sub-task is in inference,
+# the next one is fetched and its input decoded (up to PREFETCH_DEPTH ahead), and results
+# are submitted by a background thread. Set to False for the simple sequential loop.
+# --- Español ---
+# El modo en pipeline solapa la red y el modelo: mientras una subtarea está en inferencia,
+# se obtiene la siguiente y se decodifica su entrada (hasta PREFETCH_DEPTH por adelantado), y
+# los resultados se envían desde un hilo en segundo plano. Poner a False para el bucle secuencial.
+PIPELINED_MODE = True
+PREFETCH_DEPTH = 1
+UPLOAD_RETRIES = 3
+
+# --- English ---
+# Multi-expert mode: the orchestrator decides, from WORKER_SPECS, which experts this
+# machine hosts and how many sub-tasks each may run concurrently. A single expert with one
+# slot falls back to the loop above.
+# --- Español ---
+# Modo multi-experto: el orquestador decide, a partir de WORKER_SPECS, qué expertos aloja
+# esta máquina y cuántas subtareas puede ejecutar cada uno a la vez. Un único experto con un
+# hueco vuelve al bucle anterior.
+MULTI_EXPERT_MODE = True
+
+# --- English ---
+# Continuous batching for general-ai. Instead of one `pipeline` call per sub-task, a single
+# decode loop generates for up to MAX_BATCH_SEQUENCES sub-tasks at once and admits new ones
+# as soon as others finish, so short answers never wait for long ones. A sequence is only
+# admitted if the worst-case key/value cache of the batch stays within KV_CACHE_BUDGET_MB.
+# --- Español ---
+# Batching continuo para general-ai. En lugar de una llamada a `pipeline` por subtarea, un
+# único bucle de decodificación genera para hasta MAX_BATCH_SEQUENCES subtareas a la vez y
+# admite nuevas en cuanto otras terminan, así las respuestas cortas nunca esperan a las largas.
+# Una secuencia solo se admite si la caché clave/valor del lote en el peor caso cabe en KV_CACHE_BUDGET_MB.
+CONTINUOUS_BATCHING = True
+MAX_BATCH_SEQUENCES = 8
+KV_CACHE_BUDGET_MB = 2048
+GENERATION_MAX_NEW_TOKENS = 256
+
+# --- English ---
+# Streaming audio transcription. Audio files are decoded AUDIO_DECODE_BLOCK_FRAMES frames at
+# a time, mixed down to mono and resampled to 16 kHz with a stateful resampler, into a fixed
+# buffer of AUDIO_WINDOW_SECONDS (whisper's input length). When the buffer is full it is cut
+# at the quietest 20 ms within its last AUDIO_SPLIT_SEARCH_SECONDS, so words are rarely split,
+# and transcribed; the rest carries over to the next window. Memory stays the same whatever
+# the length of the file.
+# --- Español ---
+# Transcripción de audio en streaming. Los archivos de audio se decodifican de
+# AUDIO_DECODE_BLOCK_FRAMES en AUDIO_DECODE_BLOCK_FRAMES muestras, se mezclan a mono y se
+# remuestrean a 16 kHz con un remuestreador con estado, en un búfer fijo de AUDIO_WINDOW_SECONDS
+# (la longitud de entrada de whisper). Cuando el búfer se llena se corta en los 20 ms más
+# silenciosos de sus últimos AUDIO_SPLIT_SEARCH_SECONDS, así rara vez se parten palabras, y se
+# transcribe; el resto pasa a la siguiente ventana. La memoria no cambia con la duración del archivo.
+AUDIO_SAMPLE_RATE = 16000
+AUDIO_WINDOW_SECONDS = 30
+AUDIO_SPLIT_SEARCH_SECONDS = 2
+AUDIO_DECODE_BLOCK_FRAMES = 65536
+
+# --- English ---
+# On-demand profiling. Creating the trigger file (optionally containing a number of tasks)
+# makes the worker profile its next sub-tasks with cProfile and a stack sampler. The
+# reports are written to the profiles folder and the trigger file is removed.
+# --- Español ---
+# Perfilado bajo demanda. Crear el archivo disparador (opcionalmente con un número de tareas)
+# hace que el worker perfile sus siguientes subtareas con cProfile y un muestreador de pila.
+# Los informes se escriben en la carpeta de perfiles y el archivo disparador se elimina.
+PROFILE_TRIGGER_FILE = os.path.join(os.path.dirname(SESSION_FILE), 'profile_next_tasks')
+PROFILE_DIRECTORY = os.path.join(os.path.dirname(SESSION_FILE), 'profiles')
+PROFILE_DEFAULT_TASK_COUNT = 5
+PROFILE_SAMPLE_INTERVAL = 0.01
+
+# --- English ---
+# Local model cache. If the orchestrator mirrors a model, its files are downloaded from the
+# orchestrator into this folder, verified with SHA-256 and loaded from here; transformers
+# memory-maps safetensors weights instead of reading them into RAM. Interrupted downloads
+# resume and updated files only fetch the chunks that changed. Models the orchestrator does
+# not mirror still come from the public hub.
+# --- Español ---
+# Caché local de modelos. Si el orquestador tiene un modelo en su espejo, sus archivos se
+# descargan del orquestador a esta carpeta, se verifican con SHA-256 y se cargan desde aquí;
+# transformers mapea en memoria los pesos safetensors en lugar de leerlos a la RAM. Las
+# descargas interrumpidas se reanudan y los archivos actualizados solo traen los fragmentos
+# que cambiaron. Los modelos que el orquestador no tiene siguen viniendo del hub público.
+MODEL_CACHE_DIRECTORY = os.path.join(os.path.dirname(SESSION_FILE), 'models')
+
+# --- English ---
+# Warm restart. The session file is kept when the worker stops, so the next start resumes
+# with the same worker id (and reputation) and the orchestrator's stored expert assignment
+# instead of registering again. Every claimed sub-task is journaled (one file each) until its
+# result is accepted: on restart, results that were computed but not delivered are resubmitted
+# and the orchestrator puts the unfinished ones back in the queue. After the first load, each
+# model that does not come from the orchestrator's mirror is saved to PREPARED_MODEL_DIRECTORY,
+# so a warm restart loads it from disk without contacting the hub. Set WARM_RESTART to False
+# to register as a new worker on every start.
+# --- Español ---
+# Reinicio en caliente. El archivo de sesión se conserva al parar el worker, así el siguiente
+# arranque continúa con el mismo id de worker (y su reputación) y la asignación de expertos que
+# guarda el orquestador, en lugar de registrarse de nuevo. Cada subtarea reclamada se anota en un
+# diario (un archivo por subtarea) hasta que se acepta su resultado: al reiniciar, los resultados
+# calculados pero no entregados se reenvían y el orquestador devuelve a la cola los no terminados.
+# Tras la primera carga, cada modelo que no viene del espejo del orquestador se guarda en
+# PREPARED_MODEL_DIRECTORY, así un reinicio en caliente lo carga del disco sin contactar con el hub.
+# Poner WARM_RESTART a False para registrarse como un worker nuevo en cada arranque.
+WARM_RESTART = True
+JOURNAL_DIRECTORY = os.path.join(os.path.dirname(SESSION_FILE), 'journal')
+PREPARED_MODEL_DIRECTORY = os.path.join(MODEL_CACHE_DIRECTORY, 'prepared')
+
 # --- English ---
 # --- Global state variables ---
 # These variables hold the worker's current state.
 # --- Español ---
 # --- Variables de estado globales ---
 # Estas variables mantienen el estado actual del worker.
-expert_pipeline = None
+expert_pipelines = {}
+generation_batcher = None
 assigned_expert_type = None
+slot_state = threading.local()
 stop_heartbeat = threading.Event()
 
+class UtilizationMeter:
+    # --- English ---
+    # Fraction of wall time the model slots spent on inference since the last report.
+    # It is sent with every heartbeat.
+    # --- Español ---
+    # Fracción del tiempo real que los huecos del modelo pasaron en inferencia desde el
+    # último informe. Se envía con cada heartbeat.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.busy_seconds = 0.0
+        self.window_started = time.monotonic()
+        self.capacity = 1
+
+    def add_busy(self, seconds):
+        with self.lock: self.busy_seconds += seconds
+
+    def report(self):
+        with self.lock:
+            now = time.monotonic()
+            utilization = min(1.0, self.busy_seconds / max((now - self.window_started) * self.capacity, 1e-6))
+            self.busy_seconds, self.window_started = 0.0, now
+            return utilization
+
+utilization_meter = UtilizationMeter()
+
 def send_heartbeat(worker_id):
     # --- English ---
     # This function runs in a separate background thread.
@@ -90,62 +253,527 @@ def send_heartbeat(worker_id):
     # Si el orquestador no las recibe, eliminará al worker.
     while not stop_heartbeat.is_set():
         try:
-            requests.post(f"{ORCHESTRATOR_PUBLIC_URL}/heartbeat", json={"worker_id": worker_id})
+            requests.post(f"{ORCHESTRATOR_PUBLIC_URL}/heartbeat", json={"worker_id": worker_id, "utilization": utilization_meter.report()})
         except requests.exceptions.RequestException:
             pass
         time.sleep(HEARTBEAT_INTERVAL)
 
-def initialize_ai_model(model_info):
+def download_model_file(base_url, entry, chunk_size, path):
+    # --- English ---
+    # Builds `path` chunk by chunk in a ".partial" file. A chunk is kept if the partial file
+    # (interrupted download) or the old version of the file already has it with the right
+    # hash, and fetched with an HTTP range request otherwise.
+    # --- Español ---
+    # Construye `path` fragmento a fragmento en un archivo ".partial". Un fragmento se conserva
+    # si el archivo parcial (descarga interrumpida) o la versión anterior del archivo ya lo tiene
+    # con el hash correcto, y si no se descarga con una petición HTTP de rango.
+    partial_path = path + ".partial"
+    os.makedirs(os.path.dirname(partial_path), exist_ok=True)
+    old_file = open(path, 'rb') if os.path.exists(path) else None
+    downloaded = 0
+    try:
+        with open(partial_path, 'r+b' if os.path.exists(partial_path) else 'w+b') as partial:
+            partial.truncate(entry['size'])
+            for index, chunk_hash in enumerate(entry['chunks']):
+                offset = index * chunk_size
+                length = min(chunk_size, entry['size'] - offset)
+                partial.seek(offset)
+                if hashlib.sha256(partial.read(length)).hexdigest() == chunk_hash: continue
+                data = None
+                if old_file:
+                    old_file.seek(offset)
+                    data = old_file.read(length)
+                    if hashlib.sha256(data).hexdigest() != chunk_hash: data = None
+                if data is None:
+                    response = requests.get(f"{base_url}/files/{entry['path']}", headers={"Range": f"bytes={offset}-{offset + length - 1}"}, timeout=300)
+                    response.raise_for_status()
+                    data = response.content
+                    if hashlib.sha256(data).hexdigest() != chunk_hash: raise ValueError(f"Checksum mismatch in {entry['path']} chunk {index}.")
+                    downloaded += len(data)
+                partial.seek(offset)
+                partial.write(data)
+            partial.seek(0)
+            file_hash = hashlib.sha256()
+            for block in iter(lambda: partial.read(chunk_size), b""): file_hash.update(block)
+            if file_hash.hexdigest() != entry['sha256']: raise ValueError(f"Checksum mismatch in {entry['path']}.")
+    finally:
+        if old_file: old_file.close()
+    os.replace(partial_path, path)
+    return downloaded
+
+def fetch_model_artifacts(model_name):
+    # --- English ---
+    # Syncs the orchestrator's copy of `model_name` into the local cache and returns the local
+    # folder, or None if the orchestrator does not mirror it. Files that match the last
+    # verified manifest are not hashed again.
+    # --- Español ---
+    # Sincroniza la copia del orquestador de `model_name` en la caché local y devuelve la carpeta
+    # local, o None si el orquestador no la tiene. Los archivos que coinciden con el último
+    # manifiesto verificado no se vuelven a calcular.
+    model_key = model_name.replace("/", "--")
+    base_url = f"{ORCHESTRATOR_PUBLIC_URL}/model-artifacts/{model_key}"
+    try:
+        response = requests.get(f"{base_url}/manifest", timeout=600)
+        if response.status_code == 404: return None
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"Model mirror unavailable ({e}), using the public hub. | Espejo de modelos no disponible ({e}), usando el hub público.")
+        return None
+    manifest = response.json()
+    directory = os.path.join(MODEL_CACHE_DIRECTORY, model_key)
+    manifest_path = os.path.join(directory, ".manifest.json")
+    verified = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f: verified = {entry['path']: entry['sha256'] for entry in json.load(f)['files']}
+    downloaded = 0
+    for entry in manifest['files']:
+        path = os.path.join(directory, *entry['path'].split("/"))
+        if verified.get(entry['path']) == entry['sha256'] and os.path.exists(path) and os.path.getsize(path) == entry['size']: continue
+        downloaded += download_model_file(base_url, entry, manifest['chunk_size'], path)
+    with open(manifest_path, 'w') as f: json.dump(manifest, f)
+    print(f"Model '{model_name}' ready in local cache ({downloaded / 1024 ** 2:.1f} MB downloaded). | Modelo '{model_name}' listo en la caché local ({downloaded / 1024 ** 2:.1f} MB descargados).")
+    return directory
+
+def prepared_model_path(model_name):
+    # --- English ---
+    # Folder of the prepared copy of `model_name`, or None if there is none. Mirrored models
+    # are not prepared: their local copy is re-checked against the manifest, which is cheap.
+    # --- Español ---
+    # Carpeta de la copia preparada de `model_name`, o None si no hay. Los modelos del espejo no
+    # se preparan: su copia local se vuelve a comprobar con el manifiesto, lo que es barato.
+    directory = os.path.join(PREPARED_MODEL_DIRECTORY, model_name.replace("/", "--"))
+    return directory if os.path.exists(os.path.join(directory, ".prepared.json")) else None
+
+def prepare_model_cache(model_info, loaded_pipeline):
+    # --- English ---
+    # Saves a loaded pipeline (weights as safetensors, tokenizer or processor) for warm restarts.
+    # It is written to a temporary folder and moved into place, so an interrupted save never
+    # leaves a half-written model behind.
+    # --- Español ---
+    # Guarda un pipeline cargado (pesos en safetensors, tokenizador o procesador) para los
+    # reinicios en caliente. Se escribe en una carpeta temporal y se mueve a su sitio, así un
+    # guardado interrumpido nunca deja un modelo a medio escribir.
+    directory = os.path.join(PREPARED_MODEL_DIRECTORY, model_info['model'].replace("/", "--"))
+    staging = directory + ".partial"
+    try:
+        shutil.rmtree(staging, ignore_errors=True)
+        loaded_pipeline.save_pretrained(staging, safe_serialization=True)
+        with open(os.path.join(staging, ".prepared.json"), 'w') as f: json.dump(model_info, f)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(staging, directory)
+    except Exception as e:
+        shutil.rmtree(staging, ignore_errors=True)
+        print(f"Could not prepare the model cache: {e} | No se pudo preparar la caché del modelo: {e}")
+
+def initialize_ai_model(model_info, expert_type, warm=False):
     # --- English ---
     # Downloads (if not already cached) and loads the AI model assigned by the orchestrator.
     # --- Español ---
     # Descarga (si no está ya en caché) y carga el modelo de IA asignado por el orquestador.
-    global expert_pipeline
     print(f"Initializing AI model for '{model_info['task']}'... | Inicializando modelo de IA para '{model_info['task']}'...")
     try:
-        expert_pipeline = pipeline(model_info['task'], model=model_info['model'])
+        model_path = prepared_model_path(model_info['model']) if warm else None
+        if model_path:
+            print(f"Warm restart: loading from {model_path} | Reinicio en caliente: cargando desde {model_path}")
+            expert_pipelines[expert_type] = pipeline(model_info['task'], model=model_path)
+        else:
+            mirrored_path = fetch_model_artifacts(model_info['model'])
+            expert_pipelines[expert_type] = pipeline(model_info['task'], model=mirrored_path or model_info['model'])
+            if WARM_RESTART and not mirrored_path: prepare_model_cache(model_info, expert_pipelines[expert_type])
         print(f"Model '{model_info['model']}' loaded successfully. | Modelo '{model_info['model']}' cargado con éxito.")
         return True
     except Exception as e:
         print(f"Error loading AI model: {e} | Error al cargar el modelo de IA: {e}")
         return False
 
-def process_sub_task(sub_task):
+def start_slot_thread(torch_threads):
     # --- English ---
-    # This is the core work function. It processes a sub-task based on the
-    # worker's currently assigned role.
+    # Initializer of every slot thread: the thread gets its own pipeline copies (see
+    # `slot_pipeline`) and uses `torch_threads` intra-op threads, the cores the orchestrator
+    # budgeted for one slot. PyTorch's OpenMP thread count applies to the calling thread, so
+    # slots running side by side no longer each start a pool as large as the machine.
     # --- Español ---
-    # Esta es la función de trabajo principal. Procesa una subtarea basándose en el
-    # rol asignado actualmente al worker.
-    if not expert_pipeline: return {"error": "AI model not available."}
+    # Inicializador de cada hilo de hueco: el hilo tiene sus propias copias de los pipelines (ver
+    # `slot_pipeline`) y usa `torch_threads` hilos intra-op, los núcleos que el orquestador
+    # reservó para un hueco. El número de hilos OpenMP de PyTorch se aplica al hilo que lo
+    # llama, así los huecos que se ejecutan a la vez ya no arrancan cada uno un pool del tamaño de la máquina.
+    slot_state.pipelines = {}
+    if torch_threads: torch.set_num_threads(torch_threads)
+
+def slot_pipeline(expert_type):
+    # --- English ---
+    # The expert's pipeline for the calling thread. Slot threads share the model but each uses
+    # its own copy of the tokenizer, as fast tokenizers are not safe to share between threads.
+    # --- Español ---
+    # El pipeline del experto para el hilo que llama. Los hilos de hueco comparten el modelo pero
+    # cada uno usa su propia copia del tokenizador, ya que los tokenizadores rápidos no se pueden compartir entre hilos.
+    pipelines = getattr(slot_state, "pipelines", None)
+    if pipelines is None: return expert_pipelines[expert_type]
+    if expert_type not in pipelines:
+        expert_pipeline = copy.copy(expert_pipelines[expert_type])
+        if expert_pipeline.tokenizer is not None: expert_pipeline.tokenizer = copy.deepcopy(expert_pipeline.tokenizer)
+        pipelines[expert_type] = expert_pipeline
+    return pipelines[expert_type]
+
+def run_pipeline(expert_type, inputs, timings, **kwargs):
+    # --- English ---
+    # Runs the pipeline stage by stage (preprocess/tokenize, forward/inference, postprocess)
+    # so each one can be timed. This is the same sequence a plain `expert_pipeline(...)`
+    # call performs. Pipelines that split their input into chunks (speech recognition)
+    # are called directly and timed as a whole.
+    # --- Español ---
+    # Ejecuta el pipeline etapa por etapa (preproceso/tokenización, forward/inferencia,
+    # postproceso) para poder medir cada una. Es la misma secuencia que realiza una llamada
+    # normal a `expert_pipeline(...)`. Los pipelines que dividen su entrada en fragmentos
+    # (reconocimiento de voz) se llaman directamente y se miden en conjunto.
+    expert_pipeline = slot_pipeline(expert_type)
+    if isinstance(expert_pipeline, ChunkPipeline):
+        start = time.perf_counter()
+        output = expert_pipeline(inputs, **kwargs)
+        timings['inference'] = time.perf_counter() - start
+        return output
+    preprocess_params, forward_params, postprocess_params = expert_pipeline._sanitize_parameters(**kwargs)
+    preprocess_params = {**expert_pipeline._preprocess_params, **preprocess_params}
+    forward_params = {**expert_pipeline._forward_params, **forward_params}
+    postprocess_params = {**expert_pipeline._postprocess_params, **postprocess_params}
+    start = time.perf_counter()
+    model_inputs = expert_pipeline.preprocess(inputs, **preprocess_params)
+    tokenized = time.perf_counter()
+    model_outputs = expert_pipeline.forward(model_inputs, **forward_params)
+    inferred = time.perf_counter()
+    output = expert_pipeline.postprocess(model_outputs, **postprocess_params)
+    timings['tokenize'] = tokenized - start
+    timings['inference'] = inferred - tokenized
+    timings['postprocess'] = time.perf_counter() - inferred
+    return output
+
+def generate_with_confidence(expert_type, prompt, timings, max_new_tokens=GENERATION_MAX_NEW_TOKENS):
+    # --- English ---
+    # Cheap tier of the orchestrator's cascade: greedy generation that also reports its
+    # confidence, the geometric mean of the model's probability for each generated token. The
+    # orchestrator sends the prompt on to general-ai when it is too low.
+    # --- Español ---
+    # Nivel barato de la cascada del orquestador: generación voraz que además informa de su
+    # confianza, la media geométrica de la probabilidad que el modelo da a cada token generado.
+    # El orquestador pasa el prompt a general-ai cuando es demasiado baja.
+    generator = slot_pipeline(expert_type)
+    start = time.perf_counter()
+    inputs = generator.tokenizer(prompt, return_tensors="pt").to(generator.model.device)
+    tokenized = time.perf_counter()
+    with torch.no_grad():
+        output = generator.model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False, output_logits=True, return_dict_in_generate=True)
+    inferred = time.perf_counter()
+    new_tokens = output.sequences[0, inputs.input_ids.shape[1]:]
+    confidence = 0.0
+    if len(new_tokens):
+        log_probs = F.log_softmax(torch.stack(output.logits)[:, 0].float(), dim=-1)
+        confidence = log_probs.gather(1, new_tokens[:len(log_probs)].unsqueeze(1)).mean().exp().item()
+    text = generator.tokenizer.decode(new_tokens, skip_special_tokens=True)
+    timings['tokenize'] = tokenized - start
+    timings['inference'] = inferred - tokenized
+    timings['postprocess'] = time.perf_counter() - inferred
+    return {"generated_text": text, "confidence": confidence}
+
+class GenerationRequest:
+    def __init__(self, prompt, max_new_tokens):
+        self.prompt = prompt
+        self.input_ids = None
+        self.tokenize_seconds = 0.0
+        self.max_new_tokens = max_new_tokens
+        self.generated = []
+        self.future = Future()
+
+class ContinuousBatcher(threading.Thread):
+    # --- English ---
+    # Decode loop for continuous batching. The batch keeps one left-padded key/value cache;
+    # each step feeds one token per sequence. A new sequence is prefilled on its own and its
+    # cache is padded and appended to the batch; finished sequences are removed from it
+    # between steps. Decoding is greedy, like the plain pipeline call.
+    # --- Español ---
+    # Bucle de decodificación para batching continuo. El lote mantiene una caché clave/valor
+    # con relleno a la izquierda; cada paso introduce un token por secuencia. Una secuencia
+    # nueva se precarga por separado y su caché se rellena y se añade al lote; las secuencias
+    # terminadas se eliminan entre pasos. La decodificación es voraz, como la llamada normal al pipeline.
+    def __init__(self, generator, max_sequences=MAX_BATCH_SEQUENCES, budget_mb=KV_CACHE_BUDGET_MB, torch_threads=None):
+        super().__init__(daemon=True)
+        self.model, self.tokenizer = generator.model, generator.tokenizer
+        self.torch_threads = torch_threads
+        self.max_sequences = max_sequences
+        self.budget_bytes = budget_mb * 1024 ** 2
+        config = self.model.config
+        head_dim = getattr(config, "head_dim", None) or config.hidden_size // config.num_attention_heads
+        kv_heads = getattr(config, "num_key_value_heads", None) or config.num_attention_heads
+        self.bytes_per_token = 2 * config.num_hidden_layers * kv_heads * head_dim * self.model.dtype.itemsize
+        eos = self.model.generation_config.eos_token_id
+        self.eos_ids = set(eos if isinstance(eos, list) else [eos]) | {self.tokenizer.eos_token_id}
+        self.requests = queue.Queue()
+        self.waiting = None
+        self.rows, self.layers, self.mask, self.next_tokens = [], None, None, None
+
+    def generate(self, prompt, timings, max_new_tokens=GENERATION_MAX_NEW_TOKENS):
+        # --- English ---
+        # Called from the slot threads; blocks until the sequence is finished. Tokenizing and
+        # decoding happen on the batcher thread, as fast tokenizers are not safe to share.
+        # --- Español ---
+        # Se llama desde los hilos de los huecos; bloquea hasta que la secuencia termina. La
+        # tokenización y decodificación ocurren en el hilo del batcher, ya que los tokenizadores rápidos no se pueden compartir.
+        started = time.perf_counter()
+        request = GenerationRequest(prompt, max_new_tokens)
+        self.requests.put(request)
+        text = request.future.result()
+        timings['tokenize'] = request.tokenize_seconds
+        timings['inference'] = time.perf_counter() - started - request.tokenize_seconds
+        return {"generated_text": text}
+
+    def run(self):
+        if self.torch_threads: torch.set_num_threads(self.torch_threads)
+        with torch.inference_mode():
+            while True:
+                self.admit()
+                if not self.rows: continue
+                try:
+                    self.step()
+                except Exception as e:
+                    print(f"ERROR during batched generation: {e} | ERROR durante la generación por lotes: {e}")
+                    for request in self.rows: request.future.set_exception(e)
+                    self.rows, self.layers, self.mask, self.next_tokens = [], None, None, None
+
+    def fits(self, request):
+        length = max(self.mask.shape[1], request.input_ids.shape[1])
+        remaining = max([r.max_new_tokens - len(r.generated) for r in self.rows] + [request.max_new_tokens])
+        return (len(self.rows) + 1) * (length + remaining) * self.bytes_per_token <= self.budget_bytes
+
+    def admit(self):
+        while len(self.rows) < self.max_sequences:
+            if self.waiting is None:
+                try:
+                    self.waiting = self.requests.get(block=not self.rows)
+                except queue.Empty:
+                    return
+                tokenize_started = time.perf_counter()
+                try:
+                    self.waiting.input_ids = self.tokenizer(self.waiting.prompt, return_tensors="pt").input_ids
+                except Exception as e:
+                    self.waiting.future.set_exception(e)
+                    self.waiting = None
+                    continue
+                self.waiting.tokenize_seconds = time.perf_counter() - tokenize_started
+            if self.rows and not self.fits(self.waiting): return
+            request, self.waiting = self.waiting, None
+            try:
+                self.prefill(request)
+            except Exception as e:
+                request.future.set_exception(e)
+
+    def prefill(self, request):
+        input_ids = request.input_ids.to(self.model.device)
+        output = self.model(input_ids=input_ids, use_cache=True)
+        token = output.logits[:, -1].argmax(dim=-1)
+        if self.accept(request, token.item()): return
+        layers, mask = cache_layers(output.past_key_values), torch.ones_like(input_ids)
+        if self.rows:
+            length, new_length = self.mask.shape[1], mask.shape[1]
+            if new_length < length: layers, mask = left_pad(layers, mask, length - new_length)
+            elif new_length > length: self.layers, self.mask = left_pad(self.layers, self.mask, new_length - length)
+            layers = tuple((torch.cat([k0, k1]), torch.cat([v0, v1])) for (k0, v0), (k1, v1) in zip(self.layers, layers))
+            mask, token = torch.cat([self.mask, mask]), torch.cat([self.next_tokens, token])
+        self.rows.append(request)
+        self.layers, self.mask, self.next_tokens = layers, mask, token
+
+    def step(self):
+        attention_mask = F.pad(self.mask, (0, 1), value=1)
+        output = self.model(input_ids=self.next_tokens[:, None], attention_mask=attention_mask, position_ids=self.mask.sum(dim=1, keepdim=True),
+                            past_key_values=layers_to_cache(self.layers), use_cache=True)
+        self.layers, self.mask = cache_layers(output.past_key_values), attention_mask
+        self.next_tokens = output.logits[:, -1].argmax(dim=-1)
+        keep = [i for i, (request, token) in enumerate(zip(self.rows, self.next_tokens.tolist())) if not self.accept(request, token)]
+        if len(keep) == len(self.rows): return
+        self.rows = [self.rows[i] for i in keep]
+        if not self.rows:
+            self.layers, self.mask, self.next_tokens = None, None, None
+            return
+        index = torch.tensor(keep, device=self.mask.device)
+        self.mask, self.next_tokens = self.mask[index], self.next_tokens[index]
+        # --- English ---
+        # Drop the padding columns no remaining sequence needs.
+        # --- Español ---
+        # Eliminar las columnas de relleno que ya no necesita ninguna secuencia restante.
+        start = int(self.mask.any(dim=0).nonzero()[0])
+        self.mask = self.mask[:, start:]
+        self.layers = tuple((k[index][:, :, start:], v[index][:, :, start:]) for k, v in self.layers)
+
+    def accept(self, request, token):
+        # --- English ---
+        # Records a generated token; returns True (and resolves the request) when it is finished.
+        # --- Español ---
+        # Registra un token generado; devuelve True (y resuelve la petición) cuando ha terminado.
+        if token not in self.eos_ids: request.generated.append(token)
+        if token in self.eos_ids or len(request.generated) >= request.max_new_tokens:
+            request.future.set_result(self.tokenizer.decode(request.generated, skip_special_tokens=True))
+            return True
+        return False
+
+def cache_layers(cache):
+    # --- English ---
+    # (key, value) per layer. transformers 5 dropped the legacy-cache conversions; its caches
+    # expose the tensors on `layers` and are built from the same tuples.
+    # --- Español ---
+    # (clave, valor) por capa. transformers 5 eliminó las conversiones de caché heredada; sus
+    # cachés exponen los tensores en `layers` y se construyen con las mismas tuplas.
+    if hasattr(cache, "to_legacy_cache"): return cache.to_legacy_cache()
+    if hasattr(cache, "layers"): return tuple((layer.keys, layer.values) for layer in cache.layers)
+    return cache
+
+def layers_to_cache(layers):
+    try:
+        from transformers import DynamicCache
+    except ImportError:
+        return layers
+    if hasattr(DynamicCache, "from_legacy_cache"): return DynamicCache.from_legacy_cache(layers)
+    return DynamicCache(layers)
+
+def left_pad(layers, mask, amount):
+    return tuple((F.pad(k, (0, 0, amount, 0)), F.pad(v, (0, 0, amount, 0))) for k, v in layers), F.pad(mask, (amount, 0))
+
+def decode_audio_blocks(file_path):
+    # --- English ---
+    # Yields (mono float32 block, sample rate) while decoding, never the whole file at once.
+    # --- Español ---
+    # Devuelve (bloque mono float32, frecuencia de muestreo) mientras decodifica, nunca el archivo entero.
+    try:
+        source = soundfile.SoundFile(file_path)
+    except RuntimeError:
+        if audioread is None: raise
+        with audioread.audio_open(file_path) as decoder:
+            for buffer in decoder:
+                samples = np.frombuffer(buffer, dtype='<i2').reshape(-1, decoder.channels)
+                yield samples.mean(axis=1, dtype=np.float32) / 32768.0, decoder.samplerate
+        return
+    with source:
+        for block in source.blocks(blocksize=AUDIO_DECODE_BLOCK_FRAMES, dtype='float32', always_2d=True):
+            yield block.mean(axis=1), source.samplerate
+
+def stream_audio(file_path):
+    # --- English ---
+    # Decoded blocks resampled to AUDIO_SAMPLE_RATE. The resampler keeps its filter state
+    # between blocks, so the result is the same as resampling the whole signal at once.
+    # --- Español ---
+    # Bloques decodificados remuestreados a AUDIO_SAMPLE_RATE. El remuestreador conserva el
+    # estado de su filtro entre bloques, así el resultado es el mismo que remuestrear la señal entera.
+    resampler = None
+    for block, sample_rate in decode_audio_blocks(file_path):
+        if sample_rate == AUDIO_SAMPLE_RATE:
+            yield block
+            continue
+        if resampler is None: resampler = soxr.ResampleStream(sample_rate, AUDIO_SAMPLE_RATE, 1, dtype='float32')
+        yield resampler.resample_chunk(block)
+    if resampler is not None: yield resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+
+def audio_windows(file_path):
+    # --- English ---
+    # Fills one fixed buffer of AUDIO_WINDOW_SECONDS and yields a view of each window, cut at
+    # the quietest 20 ms near its end. The view is only valid until the next window is requested.
+    # --- Español ---
+    # Llena un único búfer fijo de AUDIO_WINDOW_SECONDS y devuelve una vista de cada ventana,
+    # cortada en los 20 ms más silenciosos cerca de su final. La vista solo es válida hasta pedir la siguiente ventana.
+    window = np.empty(AUDIO_WINDOW_SECONDS * AUDIO_SAMPLE_RATE, dtype=np.float32)
+    frame = AUDIO_SAMPLE_RATE // 50
+    search = AUDIO_SPLIT_SEARCH_SECONDS * AUDIO_SAMPLE_RATE // frame * frame
+    filled = 0
+    for block in stream_audio(file_path):
+        while len(block):
+            count = min(len(block), len(window) - filled)
+            window[filled:filled + count] = block[:count]
+            filled += count
+            block = block[count:]
+            if filled < len(window): continue
+            tail = window[len(window) - search:]
+            energy = np.square(tail).reshape(-1, frame).mean(axis=1)
+            cut = len(window) - search + int(np.argmin(energy)) * frame + frame // 2
+            yield window[:cut]
+            filled = len(window) - cut
+            window[:filled] = window[cut:].copy()
+    if filled: yield window[:filled]
+
+def transcribe_audio(file_path, timings):
+    # --- English ---
+    # Transcribes window by window; decoding time is reported as 'load' and model time as 'inference'.
+    # --- Español ---
+    # Transcribe ventana a ventana; el tiempo de decodificación se informa como 'load' y el del modelo como 'inference'.
+    texts = []
+    timings['load'], timings['inference'] = timings.get('load', 0.0), 0.0
+    windows = audio_windows(file_path)
+    while True:
+        decode_started = time.perf_counter()
+        window = next(windows, None)
+        timings['load'] += time.perf_counter() - decode_started
+        if window is None: break
+        window_timings = {}
+        text = run_pipeline("audio-transcription", {"raw": window, "sampling_rate": AUDIO_SAMPLE_RATE}, window_timings)['text'].strip()
+        timings['inference'] += window_timings.get('inference', 0.0)
+        if text: texts.append(text)
+    return {"text": " ".join(texts)}
+
+def load_sub_task_input(sub_task, timings):
+    # --- English ---
+    # Reads and decodes the sub-task's input so it is ready for the model. This stage does
+    # not use the model, so in pipelined mode it runs while the previous task is in inference.
+    # --- Español ---
+    # Lee y decodifica la entrada de la subtarea para dejarla lista para el modelo. Esta etapa
+    # no usa el modelo, así que en modo pipeline se ejecuta mientras la tarea anterior está en inferencia.
+    expert_type = sub_task['expert_type']
     task_data = json.loads(sub_task['data'])
+    # Los documentos llegan como texto: el orquestador lo extrae al subirlos.
+    # Documents arrive as text: the orchestrator extracts it at upload time.
+    if expert_type in ("general-ai", "quick-ai", "document-summarization"):
+        return task_data['text']
+
+    load_started = time.perf_counter()
+    if expert_type == "image-captioning":
+        model_input = Image.open(task_data['file_path'])
+        model_input.load() # Image.open is lazy; decode now so it is timed as loading. | Image.open es perezoso; decodificar ahora para medirlo como carga.
+    elif expert_type == "audio-transcription":
+        # --- English ---
+        # Audio is decoded window by window during inference (see `transcribe_audio`); only
+        # check here that the file can be opened.
+        # --- Español ---
+        # El audio se decodifica ventana a ventana durante la inferencia (ver `transcribe_audio`);
+        # aquí solo se comprueba que el archivo se puede abrir.
+        with open(task_data['file_path'], 'rb'): pass
+        model_input = task_data['file_path']
+    else:
+        raise ValueError("Unknown expert type for processing.")
+    timings['load'] = time.perf_counter() - load_started
+    return model_input
+
+def run_inference(sub_task, model_input, timings):
+    # --- English ---
+    # Runs the sub-task's model on an input prepared by `load_sub_task_input`.
+    # --- Español ---
+    # Ejecuta el modelo de la subtarea sobre una entrada preparada por `load_sub_task_input`.
+    expert_type = sub_task['expert_type']
+    if expert_type not in expert_pipelines: return {"error": "AI model not available."}
     try:
-        print(f"Processing '{assigned_expert_type}' sub-task {sub_task['id']}... | Procesando subtarea de '{assigned_expert_type}' {sub_task['id']}...")
+        print(f"Processing '{expert_type}' sub-task {sub_task['id']}... | Procesando subtarea de '{expert_type}' {sub_task['id']}...")
         
-        if assigned_expert_type == "general-ai":
+        if expert_type == "general-ai":
+            if generation_batcher: return generation_batcher.generate(model_input, timings)
             # return_full_text=False ensures we only get the generated response
             # return_full_text=False asegura que solo obtengamos la respuesta generada
-            return expert_pipeline(task_data['text'], max_new_tokens=256, return_full_text=False)[0]
-
-        elif assigned_expert_type == "document-summarization":
-            file_path = task_data['file_path']
-            text = ""
-            if file_path.endswith('.pdf'):
-                with open(file_path, 'rb') as f:
-                    reader = PyPDF2.PdfReader(f)
-                    for page in reader.pages: text += page.extract_text() + "\n"
-            elif file_path.endswith('.docx'):
-                doc = docx.Document(file_path)
-                for para in doc.paragraphs: text += para.text + "\n"
-            if not text.strip(): return {"summary_text": "Document is empty or text could not be extracted."}
-            return expert_pipeline(text, min_length=10, max_length=150)[0]
+            return run_pipeline(expert_type, model_input, timings, max_new_tokens=256, return_full_text=False)[0]
+
+        elif expert_type == "quick-ai":
+            return generate_with_confidence(expert_type, model_input, timings)
+
+        elif expert_type == "document-summarization":
+            if not model_input.strip(): return {"summary_text": "Document is empty or text could not be extracted."}
+            return run_pipeline(expert_type, model_input, timings, min_length=10, max_length=150)[0]
         
-        elif assigned_expert_type == "image-captioning":
-            image = Image.open(task_data['file_path'])
-            return expert_pipeline(image)[0]
+        elif expert_type == "image-captioning":
+            return run_pipeline(expert_type, model_input, timings)[0]
         
-        elif assigned_expert_type == "audio-transcription":
-            return expert_pipeline(task_data['file_path'])
+        elif expert_type == "audio-transcription":
+            return transcribe_audio(model_input, timings)
 
         else:
             return {"error": "Unknown expert type for processing."}
@@ -153,6 +781,154 @@ def process_sub_task(sub_task):
         print(f"ERROR during processing: {e} | ERROR durante el procesamiento: {e}")
         return {"error": str(e)}
 
+def process_sub_task(sub_task, timings=None):
+    # --- English ---
+    # This is the core work function. It processes a sub-task based on the
+    # worker's currently assigned role.
+    # --- Español ---
+    # Esta es la función de trabajo principal. Procesa una subtarea basándose en el
+    # rol asignado actualmente al worker.
+    if sub_task['expert_type'] not in expert_pipelines: return {"error": "AI model not available."}
+    if timings is None: timings = {}
+    try:
+        model_input = load_sub_task_input(sub_task, timings)
+    except Exception as e:
+        print(f"ERROR during processing: {e} | ERROR durante el procesamiento: {e}")
+        return {"error": str(e)}
+    return run_inference(sub_task, model_input, timings)
+
+class StackSampler(threading.Thread):
+    # --- English ---
+    # Samples the call stack of one thread at a fixed interval, in the spirit of py-spy.
+    # The result is written in the "collapsed stacks" format used by flame graph tools.
+    # --- Español ---
+    # Muestrea la pila de llamadas de un hilo a intervalos fijos, al estilo de py-spy.
+    # El resultado se escribe en el formato de "pilas colapsadas" de las herramientas de flame graph.
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_firstlineno})")
+                frame = frame.f_back
+            if stack: self.samples[";".join(reversed(stack))] += 1
+
+def consume_profile_trigger():
+    # --- English ---
+    # Returns how many tasks to profile if the trigger file exists (and removes it), otherwise 0.
+    # --- Español ---
+    # Devuelve cuántas tareas perfilar si existe el archivo disparador (y lo elimina), si no 0.
+    if not os.path.exists(PROFILE_TRIGGER_FILE): return 0
+    try:
+        with open(PROFILE_TRIGGER_FILE) as f: content = f.read().strip()
+        os.remove(PROFILE_TRIGGER_FILE)
+        return int(content) if content else PROFILE_DEFAULT_TASK_COUNT
+    except (OSError, ValueError):
+        return PROFILE_DEFAULT_TASK_COUNT
+
+def profile_sub_task(sub_task, work):
+    # --- English ---
+    # Calls `work()` (the processing of `sub_task`) under cProfile and the stack sampler
+    # and saves both reports.
+    # --- Español ---
+    # Llama a `work()` (el procesamiento de `sub_task`) bajo cProfile y el muestreador de pila
+    # y guarda ambos informes.
+    os.makedirs(PROFILE_DIRECTORY, exist_ok=True)
+    profiler = cProfile.Profile()
+    sampler = StackSampler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL)
+    sampler.start()
+    profiler.enable()
+    try:
+        return work()
+    finally:
+        profiler.disable()
+        sampler.stopped.set()
+        sampler.join()
+        base_path = os.path.join(PROFILE_DIRECTORY, f"{int(time.time())}_{sub_task['expert_type']}_{sub_task['id']}")
+        profiler.dump_stats(base_path + ".prof")
+        with open(base_path + ".txt", 'w') as f:
+            pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(40)
+        with open(base_path + ".collapsed", 'w') as f:
+            for stack, count in sampler.samples.most_common(): f.write(f"{stack} {count}\n")
+        print(f"Profile saved to {base_path}.* | Perfil guardado en {base_path}.*")
+
+def save_session(session):
+    # Escribir y renombrar, para que un corte nunca deje un archivo de sesión a medias.
+    # Write then rename, so a crash never leaves a half-written session file.
+    with open(SESSION_FILE + ".tmp", 'w') as f: json.dump(session, f)
+    os.replace(SESSION_FILE + ".tmp", SESSION_FILE)
+
+def load_session():
+    try:
+        with open(SESSION_FILE) as f: return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def journal_sub_task(sub_task, result=None, timings=None):
+    # --- English ---
+    # Records a claimed sub-task, and later its result, until the orchestrator accepts it.
+    # --- Español ---
+    # Anota una subtarea reclamada, y después su resultado, hasta que el orquestador lo acepta.
+    os.makedirs(JOURNAL_DIRECTORY, exist_ok=True)
+    path = os.path.join(JOURNAL_DIRECTORY, f"{sub_task['id']}.json")
+    with open(path + ".tmp", 'w') as f: json.dump({"sub_task": sub_task, "result": result, "timings": timings}, f)
+    os.replace(path + ".tmp", path)
+
+def forget_sub_task(sub_task_id):
+    try:
+        os.remove(os.path.join(JOURNAL_DIRECTORY, f"{sub_task_id}.json"))
+    except FileNotFoundError:
+        pass
+
+def load_journal():
+    entries = {}
+    if not os.path.isdir(JOURNAL_DIRECTORY): return entries
+    for name in os.listdir(JOURNAL_DIRECTORY):
+        path = os.path.join(JOURNAL_DIRECTORY, name)
+        if not name.endswith(".json"):
+            os.remove(path); continue
+        try:
+            with open(path) as f: entry = json.load(f)
+            entries[entry['sub_task']['id']] = entry
+        except (OSError, ValueError, KeyError):
+            os.remove(path)
+    return entries
+
+def resume_session(session):
+    # --- English ---
+    # Warm restart: reclaims the saved worker id and resubmits the results the orchestrator is
+    # still waiting for. Returns the orchestrator's reply, with the stored expert assignment.
+    # --- Español ---
+    # Reinicio en caliente: recupera el id de worker guardado y reenvía los resultados que el
+    # orquestador sigue esperando. Devuelve la respuesta del orquestador, con la asignación guardada.
+    journal = load_journal()
+    finished = [sub_task_id for sub_task_id, entry in journal.items() if entry['result'] is not None]
+    response = requests.post(f"{ORCHESTRATOR_PUBLIC_URL}/resume", json={"worker_id": session['worker_id'], "specs": WORKER_SPECS, "finished_sub_tasks": finished})
+    response.raise_for_status()
+    resumed = response.json()
+    resubmitted = 0
+    for sub_task_id, entry in journal.items():
+        if sub_task_id in resumed['resubmit']:
+            try:
+                requests.post(f"{ORCHESTRATOR_PUBLIC_URL}/submit-sub-task-result", json={
+                    "worker_id": resumed['worker_id'], "sub_task_id": sub_task_id, "result": json.dumps(entry['result']), "timings": entry['timings'] or {}
+                }).raise_for_status()
+                resubmitted += 1
+            except requests.exceptions.RequestException as e:
+                print(f"Could not resubmit {sub_task_id}: {e} | No se pudo reenviar {sub_task_id}: {e}")
+                continue
+        forget_sub_task(sub_task_id)
+    print(f"Resumed worker {resumed['worker_id']} ({resumed['status']}): {resubmitted} result(s) resubmitted, {len(resumed['released'])} sub-task(s) returned to the queue. "
+          f"| Worker {resumed['worker_id']} reanudado ({resumed['status']}): {resubmitted} resultado(s) reenviado(s), {len(resumed['released'])} subtarea(s) devuelta(s) a la cola.")
+    return resumed
+
 def startup_sequence():
     # --- English ---
     # This function runs once when the worker starts. It creates the config directory,
@@ -161,45 +937,77 @@ def startup_sequence():
     # Esta función se ejecuta una vez cuando el worker arranca. Crea el directorio de
     # configuración, se registra en el servidor, crea el archivo de sesión
     # e inicia el hilo del heartbeat.
+    # With a saved session (warm restart) it resumes that worker instead of registering, and
+    # also returns the stored expert assignment ({} if a new one must be requested).
+    # Con una sesión guardada (reinicio en caliente) reanuda ese worker en lugar de registrarse,
+    # y devuelve también la asignación de expertos guardada ({} si hay que pedir una nueva).
     global assigned_expert_type
     
     os.makedirs(os.path.dirname(SESSION_FILE), exist_ok=True)
     
-    print("Registering with the orchestrator... | Registrándose en el orquestador...")
+    session = load_session() if WARM_RESTART else None
+    experts = {}
     try:
-        response = requests.post(f"{ORCHESTRATOR_PUBLIC_URL}/register", json={"specs": WORKER_SPECS})
-        response.raise_for_status()
-        worker_id = response.json()['worker_id']
-        with open(SESSION_FILE, 'w') as f: json.dump({"worker_id": worker_id}, f)
+        if session and session.get("worker_id"):
+            print("Resuming the saved worker session... | Reanudando la sesión de worker guardada...")
+            resumed = resume_session(session)
+            worker_id, experts = resumed['worker_id'], resumed['experts']
+        else:
+            print("Registering with the orchestrator... | Registrándose en el orquestador...")
+            response = requests.post(f"{ORCHESTRATOR_PUBLIC_URL}/register", json={"specs": WORKER_SPECS})
+            response.raise_for_status()
+            worker_id = response.json()['worker_id']
+            save_session({"worker_id": worker_id})
         print("\n" + "="*60)
         print("✅ Worker is ACTIVE. You can now use the chat interface! | ✅ Worker ACTIVO. ¡Ya puedes usar la interfaz de chat!")
         print(f"   Open this URL in your browser: | Abre esta URL en tu navegador:")
         print(f"   {ORCHESTRATOR_PUBLIC_URL}/?worker_id={worker_id}")
         print("="*60 + "\n")
     except requests.exceptions.RequestException as e:
-        print(f"Error registering: {e} | Error al registrarse: {e}"); return None
+        print(f"Error registering: {e} | Error al registrarse: {e}"); return None, {}
     
     heartbeat_thread = threading.Thread(target=send_heartbeat, args=(worker_id,))
     heartbeat_thread.daemon = True
     heartbeat_thread.start()
-    return worker_id
+    return worker_id, experts
 
 def main_loop(worker_id):
     # --- Bucle principal MODIFICADO ---
     # Ahora este bucle solo pide subtareas del tipo ya asignado.
     print(f"Worker en modo sondeo para tareas de tipo '{assigned_expert_type}'. | Worker polling for '{assigned_expert_type}' tasks.")
+    # Tiempos por etapa: la subida de un resultado solo se conoce después de enviarlo,
+    # así que se informa junto con el resultado siguiente.
+    # Per-stage timings: a result's upload time is only known after it is sent,
+    # so it is reported together with the next result.
+    last_upload_seconds = None
+    tasks_to_profile = 0
     while True:
         try:
             # Si se le ha asignado un rol, buscar una tarea de ese tipo.
             if assigned_expert_type:
+                fetch_started = time.perf_counter()
                 task_response = requests.get(f"{ORCHESTRATOR_PUBLIC_URL}/get-sub-task/{worker_id}/{assigned_expert_type}")
                 task_response.raise_for_status()
                 sub_task = task_response.json()
                 if "id" in sub_task:
-                    result = process_sub_task(sub_task)
-                    requests.post(f"{ORCHESTRATOR_PUBLIC_URL}/submit-sub-task-result", json={
-                        "worker_id": worker_id, "sub_task_id": sub_task['id'], "result": json.dumps(result)
+                    timings = {"fetch": time.perf_counter() - fetch_started}
+                    journal_sub_task(sub_task)
+                    tasks_to_profile += consume_profile_trigger()
+                    processing_started = time.perf_counter()
+                    if tasks_to_profile > 0:
+                        tasks_to_profile -= 1
+                        result = profile_sub_task(sub_task, lambda: process_sub_task(sub_task, timings))
+                    else:
+                        result = process_sub_task(sub_task, timings)
+                    utilization_meter.add_busy(time.perf_counter() - processing_started)
+                    if last_upload_seconds is not None: timings['upload'] = last_upload_seconds
+                    journal_sub_task(sub_task, result, timings)
+                    upload_started = time.perf_counter()
+                    response = requests.post(f"{ORCHESTRATOR_PUBLIC_URL}/submit-sub-task-result", json={
+                        "worker_id": worker_id, "sub_task_id": sub_task['id'], "result": json.dumps(result), "timings": timings
                     })
+                    if response.ok: forget_sub_task(sub_task['id'])
+                    last_upload_seconds = time.perf_counter() - upload_started
                 else: 
                     # No hay tareas para mi especialidad, esperar un poco antes de volver a preguntar.
                     time.sleep(POLL_INTERVAL)
@@ -211,32 +1019,225 @@ def main_loop(worker_id):
             print(f"Communication error: {e}. Retrying... | Error de comunicación: {e}. Reintentando...")
             time.sleep(10)
 
+def prefetch_sub_tasks(worker_id, prefetched, free_slots):
+    # --- English ---
+    # Pipeline stage 1 (background thread): claims the next sub-task as soon as a prefetch
+    # slot is free and decodes its input, so it is ready when the model finishes.
+    # --- Español ---
+    # Etapa 1 del pipeline (hilo en segundo plano): reclama la siguiente subtarea en cuanto hay
+    # un hueco de prebúsqueda libre y decodifica su entrada, para tenerla lista cuando el modelo termine.
+    while not stop_heartbeat.is_set():
+        free_slots.acquire()
+        try:
+            fetch_started = time.perf_counter()
+            task_response = requests.get(f"{ORCHESTRATOR_PUBLIC_URL}/get-sub-task/{worker_id}/{assigned_expert_type}")
+            task_response.raise_for_status()
+            sub_task = task_response.json()
+        except requests.exceptions.RequestException as e:
+            free_slots.release()
+            print(f"Communication error: {e}. Retrying... | Error de comunicación: {e}. Reintentando...")
+            time.sleep(10)
+            continue
+        if "id" not in sub_task:
+            free_slots.release()
+            time.sleep(POLL_INTERVAL)
+            continue
+        timings = {"fetch": time.perf_counter() - fetch_started}
+        journal_sub_task(sub_task)
+        try:
+            model_input, error = load_sub_task_input(sub_task, timings), None
+        except Exception as e:
+            print(f"ERROR during processing: {e} | ERROR durante el procesamiento: {e}")
+            model_input, error = None, str(e)
+        prefetched.put((sub_task, model_input, error, timings))
+
+def submit_results(worker_id, uploads):
+    # --- English ---
+    # Pipeline stage 3 (background thread): submits finished results in order, retrying
+    # briefly on network errors, while the model already works on the next sub-task.
+    # --- Español ---
+    # Etapa 3 del pipeline (hilo en segundo plano): envía los resultados terminados en orden,
+    # reintentando brevemente ante errores de red, mientras el modelo ya trabaja en la siguiente subtarea.
+    last_upload_seconds = None
+    while True:
+        sub_task, result, timings = uploads.get()
+        if last_upload_seconds is not None: timings['upload'] = last_upload_seconds
+        journal_sub_task(sub_task, result, timings)
+        upload_started = time.perf_counter()
+        for attempt in range(UPLOAD_RETRIES):
+            try:
+                response = requests.post(f"{ORCHESTRATOR_PUBLIC_URL}/submit-sub-task-result", json={
+                    "worker_id": worker_id, "sub_task_id": sub_task['id'], "result": json.dumps(result), "timings": timings
+                })
+                response.raise_for_status()
+                forget_sub_task(sub_task['id'])
+                break
+            except requests.exceptions.RequestException as e:
+                print(f"Communication error: {e}. Retrying... | Error de comunicación: {e}. Reintentando...")
+                time.sleep(2 ** attempt)
+        last_upload_seconds = time.perf_counter() - upload_started
+
+def pipelined_loop(worker_id):
+    # --- English ---
+    # Pipeline stage 2 (main thread): keeps the model busy with prefetched sub-tasks.
+    # --- Español ---
+    # Etapa 2 del pipeline (hilo principal): mantiene el modelo ocupado con subtareas prebuscadas.
+    print(f"Pipelined worker polling for '{assigned_expert_type}' tasks. | Worker en modo pipeline para tareas de tipo '{assigned_expert_type}'.")
+    prefetched = queue.Queue()
+    uploads = queue.Queue()
+    free_slots = threading.Semaphore(PREFETCH_DEPTH)
+    threading.Thread(target=prefetch_sub_tasks, args=(worker_id, prefetched, free_slots), daemon=True).start()
+    threading.Thread(target=submit_results, args=(worker_id, uploads), daemon=True).start()
+    tasks_to_profile = 0
+    while True:
+        sub_task, model_input, error, timings = prefetched.get()
+        free_slots.release()
+        processing_started = time.perf_counter()
+        if error is not None:
+            result = {"error": error}
+        else:
+            tasks_to_profile += consume_profile_trigger()
+            # --- English ---
+            # As in `run_in_slot`: an error outside `run_inference` (e.g. while writing the profile
+            # reports) is reported as the sub-task's result instead of stopping the worker.
+            # --- Español ---
+            # Como en `run_in_slot`: un error fuera de `run_inference` (ej. al escribir los informes
+            # del perfil) se informa como resultado de la subtarea en lugar de detener el worker.
+            try:
+                if tasks_to_profile > 0:
+                    tasks_to_profile -= 1
+                    result = profile_sub_task(sub_task, lambda: run_inference(sub_task, model_input, timings))
+                else:
+                    result = run_inference(sub_task, model_input, timings)
+            except Exception as e:
+                print(f"ERROR during processing: {e} | ERROR durante el procesamiento: {e}")
+                result = {"error": str(e)}
+        utilization_meter.add_busy(time.perf_counter() - processing_started)
+        uploads.put((sub_task, result, timings))
+
+def slot_torch_threads(experts):
+    # --- English ---
+    # Intra-op threads for one slot of each expert: the cores the orchestrator budgeted per slot,
+    # or an even share of this machine's cores for assignments that do not include them.
+    # --- Español ---
+    # Hilos intra-op para un hueco de cada experto: los núcleos que el orquestador reservó por
+    # hueco, o un reparto a partes iguales de los núcleos de esta máquina si la asignación no los incluye.
+    even_share = max(1, WORKER_SPECS['cpu_cores'] // max(1, sum(info['slots'] for info in experts.values())))
+    return {expert: info.get('slot_cores') or even_share for expert, info in experts.items()}
+
+def multi_expert_loop(worker_id, expert_slots, torch_threads):
+    # --- English ---
+    # Runs several experts side by side. Each expert has a thread pool with one thread per
+    # slot; the main thread asks the combined endpoint for any task type that has a free slot
+    # and hands it to that expert's pool. Results are submitted in the background.
+    # --- Español ---
+    # Ejecuta varios expertos en paralelo. Cada experto tiene un pool de hilos con un hilo por
+    # hueco; el hilo principal pide al endpoint combinado cualquier tipo de tarea con un hueco
+    # libre y la entrega al pool de ese experto. Los resultados se envían en segundo plano.
+    print(f"Multi-expert worker polling for {expert_slots}. | Worker multi-experto en sondeo para {expert_slots}.")
+    free_slots = dict(expert_slots)
+    slot_freed = threading.Condition()
+    uploads = queue.Queue()
+    executors = {expert: ThreadPoolExecutor(max_workers=slots, initializer=start_slot_thread, initargs=(torch_threads.get(expert),)) for expert, slots in expert_slots.items()}
+    utilization_meter.capacity = sum(expert_slots.values())
+    threading.Thread(target=submit_results, args=(worker_id, uploads), daemon=True).start()
+
+    def run_in_slot(sub_task, timings, profile):
+        # --- English ---
+        # The slot is given back in `finally`, so an error outside `process_sub_task` (e.g. while
+        # profiling) is reported as the sub-task's result instead of losing the slot for good.
+        # --- Español ---
+        # El hueco se devuelve en `finally`, así un error fuera de `process_sub_task` (ej. al
+        # perfilar) se informa como resultado de la subtarea en lugar de perder el hueco para siempre.
+        processing_started = time.perf_counter()
+        try:
+            if profile: result = profile_sub_task(sub_task, lambda: process_sub_task(sub_task, timings))
+            else: result = process_sub_task(sub_task, timings)
+        except Exception as e:
+            print(f"ERROR during processing: {e} | ERROR durante el procesamiento: {e}")
+            result = {"error": str(e)}
+        finally:
+            utilization_meter.add_busy(time.perf_counter() - processing_started)
+            with slot_freed:
+                free_slots[sub_task['expert_type']] += 1
+                slot_freed.notify()
+        uploads.put((sub_task, result, timings))
+
+    tasks_to_profile = 0
+    while True:
+        with slot_freed:
+            while not any(free_slots.values()): slot_freed.wait()
+            request = dict(free_slots)
+        try:
+            fetch_started = time.perf_counter()
+            task_response = requests.post(f"{ORCHESTRATOR_PUBLIC_URL}/get-sub-task/{worker_id}", json={"free_slots": request})
+            task_response.raise_for_status()
+            sub_task = task_response.json()
+        except requests.exceptions.RequestException as e:
+            print(f"Communication error: {e}. Retrying... | Error de comunicación: {e}. Reintentando...")
+            time.sleep(10)
+            continue
+        if "id" not in sub_task:
+            time.sleep(POLL_INTERVAL)
+            continue
+        timings = {"fetch": time.perf_counter() - fetch_started}
+        journal_sub_task(sub_task)
+        tasks_to_profile += consume_profile_trigger()
+        profile = tasks_to_profile > 0
+        if profile: tasks_to_profile -= 1
+        with slot_freed: free_slots[sub_task['expert_type']] -= 1
+        executors[sub_task['expert_type']].submit(run_in_slot, sub_task, timings, profile)
+
 if __name__ == "__main__":
     worker_id = None
     try:
         # --- Lógica de arranque MODIFICADA ---
         try:
-            # 1. Registrar el worker y obtener un ID.
+            # 1. Registrar el worker (o reanudar la sesión guardada) y obtener un ID.
             while worker_id is None:
-                worker_id = startup_sequence()
+                worker_id, experts = startup_sequence()
                 if worker_id is None:
                     print("Could not connect to server. Retrying in 1 minute... | No se pudo conectar al servidor. Reintentando en 1 minuto...")
                     time.sleep(60)
 
-            # 2. Pedir una asignación de experto y cargar el modelo UNA SOLA VEZ.
-            print("Requesting assignment from orchestrator... | Solicitando asignación al orquestador...")
-            response = requests.get(f"{ORCHESTRATOR_PUBLIC_URL}/request-assignment/{worker_id}")
-            response.raise_for_status()
-            assignment = response.json()
-            assigned_expert_type = assignment['assigned_expert']
-            print(f"Assignment received: I am a '{assigned_expert_type}' expert. | Asignación recibida: soy un experto en '{assigned_expert_type}'.")
+            # 2. Pedir una asignación de experto (salvo que se reanude una) y cargar el modelo UNA SOLA VEZ.
+            if experts:
+                print("Reusing the saved assignment. | Reutilizando la asignación guardada.")
+            elif MULTI_EXPERT_MODE:
+                print("Requesting assignment from orchestrator... | Solicitando asignación al orquestador...")
+                response = requests.get(f"{ORCHESTRATOR_PUBLIC_URL}/request-experts/{worker_id}")
+                response.raise_for_status()
+                experts = response.json()['experts']
+            else:
+                print("Requesting assignment from orchestrator... | Solicitando asignación al orquestador...")
+                response = requests.get(f"{ORCHESTRATOR_PUBLIC_URL}/request-assignment/{worker_id}")
+                response.raise_for_status()
+                assignment = response.json()
+                experts = {assignment['assigned_expert']: {"model_info": assignment['model_info'], "slots": 1}}
+            expert_slots = {expert: info['slots'] for expert, info in experts.items()}
+            torch_threads = slot_torch_threads(experts)
+            # Con batching continuo, cada hueco de general-ai es una secuencia del lote, no un hilo de CPU.
+            # With continuous batching, each general-ai slot is a sequence in the batch, not a CPU thread.
+            if CONTINUOUS_BATCHING and "general-ai" in expert_slots: expert_slots["general-ai"] = MAX_BATCH_SEQUENCES
+            print(f"Assignment received: {expert_slots}. | Asignación recibida: {expert_slots}.")
             
-            if not initialize_ai_model(assignment['model_info']):
-                 raise Exception("Failed to initialize the AI model.")
+            for expert, info in experts.items():
+                if not initialize_ai_model(info['model_info'], expert, warm=WARM_RESTART):
+                     raise Exception("Failed to initialize the AI model.")
+            if CONTINUOUS_BATCHING and "general-ai" in expert_pipelines:
+                # El lote usa los núcleos de todos los huecos de general-ai cuando comparte la máquina con otros expertos.
+                # The batch uses the cores of all general-ai slots when it shares the machine with other experts.
+                batch_threads = torch_threads["general-ai"] * experts["general-ai"]['slots'] if len(experts) > 1 else None
+                generation_batcher = ContinuousBatcher(expert_pipelines["general-ai"], torch_threads=batch_threads)
+                generation_batcher.start()
 
             # 3. Iniciar el bucle principal de sondeo de tareas.
             if worker_id:
-                main_loop(worker_id)
+                if len(expert_slots) > 1 or sum(expert_slots.values()) > 1: multi_expert_loop(worker_id, expert_slots, torch_threads)
+                else:
+                    assigned_expert_type = next(iter(expert_slots))
+                    if PIPELINED_MODE: pipelined_loop(worker_id)
+                    else: main_loop(worker_id)
 
         except Exception as e:
             # Si ocurre cualquier error, se muestra aquí
@@ -248,8 +1249,10 @@ if __name__ == "__main__":
             time.sleep(60)
 
     finally:
-        # Este código de limpieza se ejecuta siempre, incluso si hay un error
+        # Este código de limpieza se ejecuta siempre, incluso si hay un error.
+        # Con reinicio en caliente la sesión se conserva para reanudarla en el siguiente arranque.
+        # This cleanup always runs, even on error. With warm restart the session is kept for the next start.
         stop_heartbeat.set()
-        if os.path.exists(SESSION_FILE):
+        if not WARM_RESTART and os.path.exists(SESSION_FILE):
             os.remove(SESSION_FILE)
             print(f"\nWorker shutdown. Access pass removed. | Worker apagado. Pase de acceso eliminado.")
\ No newline at end of file